@@ -0,0 +1,8 @@
+"""
+Shared package of the manager and the containers of the splitters and matchers.
+
+The container definitions and Dockerfiles copy this package to `/opt/erbench`, so the modules used by the containers
+(`artifacts`, `batching`, `checkpoint`, `cleaning`, `embeddings`, `pairs`, `serialization`, `splitting`, `tables`,
+`timing` and `tokenization`) have to run on Python 3.7 and must not import the manager or its other modules.
+The other modules (`cache`, `client`, `daemon`, `importer`, `scheduler`, `slurm`) are only used by the manager.
+"""
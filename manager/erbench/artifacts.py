@@ -0,0 +1,109 @@
+"""
+Cache of intermediate results of the containers (e.g. cleaned tables, tuple embeddings), shared across jobs.
+
+The cache is only used with `ERBENCH_CACHE_DIR` set, which the manager passes on to the jobs. Every kind of result
+has its own subdirectory, entries are named by a hash of everything they depend on and written atomically,
+so concurrent jobs on the same dataset never read a partial entry. Nothing is evicted automatically.
+"""
+import os
+import shutil
+import hashlib
+import tempfile
+from typing import Callable, Optional
+
+CACHE_DIR_ENV = "ERBENCH_CACHE_DIR"
+
+
+def get_cache_dir(kind: str) -> Optional[str]:
+    cache_dir = os.getenv(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, kind)
+
+
+def make_key(*parts) -> str:
+    """
+    Hashes the parts (strings, bytes or anything with a string representation) into a cache key.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+def hash_series(series) -> bytes:
+    """
+    Returns the content hash of a pandas Series or DataFrame (values and index).
+    """
+    import pandas as pd
+
+    return hashlib.sha256(pd.util.hash_pandas_object(series, index=True).to_numpy().tobytes()).digest()
+
+
+def store(path: str, write: Callable[[str], None]) -> bool:
+    """
+    Stores an entry by calling `write` with a temporary path, which is then renamed to `path`.
+    """
+    directory = os.path.dirname(path)
+    temp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(prefix=".tmp_", suffix=os.path.splitext(path)[1], dir=directory)
+        os.close(fd)
+        write(temp_path)
+        os.replace(temp_path, path)
+        return True
+    except OSError as e:
+        print("Warning: Failed to store {} in cache: {}".format(path, e))
+        if temp_path is not None and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+
+
+def store_dir(path: str, write: Callable[[str], None]) -> bool:
+    """
+    Stores an entry of several files by calling `write` with a temporary directory, which is then renamed to `path`.
+    If another job stored the entry in the meantime, that entry is kept.
+    """
+    directory = os.path.dirname(path)
+    temp_path = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        temp_path = tempfile.mkdtemp(prefix=".tmp_", dir=directory)
+        write(temp_path)
+        os.rename(temp_path, path)
+        return True
+    except OSError as e:
+        if temp_path is not None and os.path.exists(temp_path):
+            shutil.rmtree(temp_path, ignore_errors=True)
+        if os.path.isdir(path):
+            return True
+        print("Warning: Failed to store {} in cache: {}".format(path, e))
+        return False
+
+
+def store_array(path: str, array) -> bool:
+    import numpy as np
+
+    def write(temp_path):
+        # np.save would append .npy to a path with another extension
+        with open(temp_path, "wb") as f:
+            np.save(f, array)
+
+    return store(path, write)
+
+
+def load_array(path: str):
+    """
+    Returns a memory-mapped array from the cache or None, pages are copied on write only.
+    """
+    import numpy as np
+
+    if not os.path.isfile(path):
+        return None
+    try:
+        return np.load(path, mmap_mode="c")
+    except (OSError, ValueError) as e:
+        print("Warning: Failed to read {} from cache: {}".format(path, e))
+        return None
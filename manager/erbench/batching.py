@@ -0,0 +1,98 @@
+"""
+Length-bucketed batching of tokenized pairs for the transformer-based matchers, so every batch is padded only to its
+longest pair instead of the maximum length of the model.
+
+    sampler = LengthBucketBatchSampler(get_lengths(arrays), batch_size, shuffle=True, seed=seed)
+    loader = DataLoader(dataset, batch_sampler=sampler, collate_fn=TrimPadding())
+
+For training, the pairs are shuffled and split into pools of `bucket_batches` batches, every pool is sorted by length
+and cut into batches, and the batches are shuffled. The order is deterministic for a seed and differs per epoch.
+Without shuffling, all pairs are sorted by length, which only fits evaluations that do not depend on the order.
+"""
+from typing import Iterator, List, Sequence
+
+import numpy as np
+
+BUCKET_BATCHES = 50
+
+
+class LengthBucketBatchSampler:
+    """
+    Batch sampler (for `DataLoader(batch_sampler=...)`) yielding batches of indices of pairs with similar lengths.
+    The epoch is increased with every iteration, unless it is set with `set_epoch`.
+    """
+
+    def __init__(self, lengths: Sequence[int], batch_size: int, shuffle: bool = True, seed: int = 0,
+                 bucket_batches: int = BUCKET_BATCHES):
+        self.lengths = np.asarray(lengths)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.bucket_batches = bucket_batches
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int) -> None:
+        self.epoch = epoch
+
+    def get_batches(self, epoch: int) -> List[np.ndarray]:
+        if not self.shuffle:
+            order = np.argsort(self.lengths, kind="stable")
+            return [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+        rng = np.random.RandomState((self.seed + epoch) % 2 ** 32)
+        order = rng.permutation(len(self.lengths))
+        pool_size = self.batch_size * self.bucket_batches
+        batches = []
+        for start in range(0, len(order), pool_size):
+            pool = order[start:start + pool_size]
+            pool = pool[np.argsort(self.lengths[pool], kind="stable")]
+            batches.extend(pool[i:i + self.batch_size] for i in range(0, len(pool), self.batch_size))
+        rng.shuffle(batches)
+        return batches
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self.get_batches(self.epoch)
+        self.epoch += 1
+        for batch in batches:
+            yield batch.tolist()
+
+    def __len__(self) -> int:
+        # all pools except the last one are multiples of the batch size
+        return (len(self.lengths) + self.batch_size - 1) // self.batch_size
+
+
+class TrimPadding:
+    """
+    Collate function for a `TensorDataset` of pairs padded to the maximum length (e.g. input ids, attention mask,
+    token type ids, labels), which cuts the padding of the batch down to its longest pair.
+    The padding is on the left for `padding_side='left'` (e.g. XLNet).
+    """
+
+    def __init__(self, mask_index: int = 1, padding_side: str = "right"):
+        self.mask_index = mask_index
+        self.padding_side = padding_side
+
+    def __call__(self, batch):
+        import torch
+
+        tensors = [torch.stack(items) for items in zip(*batch)]
+        mask = tensors[self.mask_index]
+        max_len = mask.shape[1]
+        length = max(int(mask.sum(dim=1).max()), 1)
+
+        trimmed = []
+        for tensor in tensors:
+            if tensor.dim() == 2 and tensor.shape[1] == max_len:
+                tensor = tensor[:, max_len - length:] if self.padding_side == "left" else tensor[:, :length]
+            trimmed.append(tensor)
+        return trimmed
+
+
+def get_padding_side(attention_mask) -> str:
+    """
+    Returns on which side the pairs are padded, the first token of a right-padded pair is never padding.
+    """
+    attention_mask = np.asarray(attention_mask)
+    if len(attention_mask) > 0 and (attention_mask[:, 0] == 0).any():
+        return "left"
+    return "right"
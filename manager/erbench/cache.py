@@ -0,0 +1,239 @@
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+
+from .client import Metrics
+from .tables import find_table
+
+# outputs of a splitter, which are needed by the matchers
+SPLIT_FILES = ["train", "valid", "test", "tableA", "tableB", "matches", "filtering_metrics", "filtering_phases"]
+
+# outputs of a finished job, which are needed to complete a duplicate
+# (in any table format, see erbench.tables)
+RESULT_FILES = ["filtering_metrics", "metrics", "predictions", "filtering_phases", "phases"]
+REQUIRED_RESULT_FILES = ["metrics", "predictions"]
+
+
+def make_cache_key(*parts) -> str:
+    return hashlib.sha256("\x1f".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+
+class SplitCache:
+    """
+    Content-addressed cache of splitter outputs, shared across jobs.
+
+    Every entry is a directory named by its key, which is created atomically (the files are copied into a
+    temporary directory first, which is renamed afterward). The least recently used entries are evicted
+    once the total size exceeds `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int, link_mode: str = "hardlink"):
+        if link_mode not in ("hardlink", "copy"):
+            raise ValueError(f"Unknown link mode {link_mode}, expected hardlink or copy")
+
+        self.root = root
+        self.max_bytes = max_bytes
+        self.link_mode = link_mode
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def get(self, key: str) -> Optional[str]:
+        entry_dir = os.path.join(self.root, key)
+        if not os.path.isdir(entry_dir):
+            return None
+
+        # the modification time of an entry is its last usage
+        os.utime(entry_dir)
+        return entry_dir
+
+    def restore(self, key: str, dest_dir: str) -> bool:
+        with self._lock:
+            entry_dir = self.get(key)
+            if entry_dir is None:
+                return False
+
+            os.makedirs(dest_dir, exist_ok=True)
+            try:
+                for name in os.listdir(entry_dir):
+                    self._link(os.path.join(entry_dir, name), os.path.join(dest_dir, name))
+            except OSError as e:
+                print(f"Warning: Failed to restore cached split {key}: {str(e)}")
+                return False
+            return True
+
+    def store(self, key: str, source_dir: str, names: List[str] = None) -> bool:
+        if names is None:
+            names = SPLIT_FILES
+
+        files = [name for name in os.listdir(source_dir) if os.path.splitext(name)[0] in names and os.path.isfile(os.path.join(source_dir, name))]
+        if not files:
+            return False
+
+        with self._lock:
+            entry_dir = os.path.join(self.root, key)
+            if os.path.isdir(entry_dir):
+                os.utime(entry_dir)
+                return True
+
+            temp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self.root)
+            try:
+                for name in files:
+                    dest = os.path.join(temp_dir, name)
+                    shutil.copy2(os.path.join(source_dir, name), dest)
+                    # cached files are shared by hardlinks, they must never be modified in place
+                    os.chmod(dest, 0o444)
+                os.rename(temp_dir, entry_dir)
+            except OSError as e:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                print(f"Warning: Failed to store split {key} in cache: {str(e)}")
+                return False
+
+            self._evict(keep=key)
+            return True
+
+    def size(self) -> int:
+        return sum(size for _, _, size in self._entries())
+
+    def _evict(self, keep: str = None):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+
+        for key, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+
+            print(f"Evicting cached split {key}")
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= size
+
+    def _entries(self):
+        for key in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, key)
+            if key.startswith(".") or not os.path.isdir(entry_dir):
+                continue
+
+            size = sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+            yield key, os.stat(entry_dir).st_mtime, size
+
+    def _link(self, source: str, dest: str):
+        if os.path.exists(dest):
+            os.remove(dest)
+
+        if self.link_mode == "hardlink":
+            try:
+                os.link(source, dest)
+                return
+            except OSError:
+                # e.g. the cache and the job directory are on different file systems
+                pass
+
+        shutil.copyfile(source, dest)
+
+
+class ResultCache:
+    """
+    Local store of the results of completed jobs, shared by identical jobs.
+
+    The metrics sent to the API are kept in a SQLite database, the result files (metrics and predictions)
+    in a directory per entry. The least recently used entries are evicted once the total size of the
+    stored files exceeds `max_bytes`.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(root, "results.db")
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, job_id TEXT NOT NULL, metrics TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, used_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[Tuple[str, Metrics, str]]:
+        """
+        Returns the ID of the job which produced the result, its metrics and the directory of its result files.
+        """
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT job_id, metrics FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            entry_dir = os.path.join(self.root, key)
+            if not all(find_table(entry_dir, name) is not None for name in REQUIRED_RESULT_FILES):
+                print(f"Warning: Files of cached result {key} are missing, removing it")
+                db.execute("DELETE FROM results WHERE key = ?", (key,))
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                return None
+
+            db.execute("UPDATE results SET used_at = ? WHERE key = ?", (time.time(), key))
+            return row[0], Metrics(json.loads(row[1])), entry_dir
+
+    def store(self, key: str, job_id: str, metrics: Metrics, source_dir: str) -> bool:
+        files = [name for name in os.listdir(source_dir) if os.path.splitext(name)[0] in RESULT_FILES and os.path.isfile(os.path.join(source_dir, name))]
+        if not all(find_table(source_dir, name) is not None for name in REQUIRED_RESULT_FILES):
+            return False
+
+        with self._lock:
+            entry_dir = os.path.join(self.root, key)
+            temp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=self.root)
+            try:
+                for name in files:
+                    shutil.copy2(os.path.join(source_dir, name), os.path.join(temp_dir, name))
+                size = sum(os.path.getsize(os.path.join(temp_dir, name)) for name in files)
+
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.rename(temp_dir, entry_dir)
+            except OSError as e:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                print(f"Warning: Failed to store result {key} in cache: {str(e)}")
+                return False
+
+            now = time.time()
+            with self._connect() as db:
+                db.execute(
+                    "INSERT OR REPLACE INTO results (key, job_id, metrics, size, created_at, used_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, job_id, json.dumps(metrics), size, now, now),
+                )
+                self._evict(db, keep=key)
+            return True
+
+    def size(self) -> int:
+        with self._connect() as db:
+            return db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _evict(self, db: sqlite3.Connection, keep: str = None):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+        for key, size in db.execute("SELECT key, size FROM results ORDER BY used_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+
+            print(f"Evicting cached result {key}")
+            db.execute("DELETE FROM results WHERE key = ?", (key,))
+            shutil.rmtree(os.path.join(self.root, key), ignore_errors=True)
+            total -= size
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # a connection per call, as jobs may be handled by several threads
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
@@ -0,0 +1,103 @@
+"""
+Epoch checkpoints of the deep matchers, so a job which was preempted or ran into the time limit of Slurm continues
+from its last finished epoch when it is resubmitted with `--resume`.
+
+    checkpoint = load_checkpoint(output_dir) if args.resume else None
+    start_epoch = restore_checkpoint(checkpoint, model=model, optimizer=optimizer) if checkpoint else 0
+    for epoch in range(start_epoch, epochs):
+        ...
+        save_checkpoint(output_dir, epoch + 1, results_per_epoch, model=model, optimizer=optimizer)
+
+A checkpoint holds the state dicts of the given objects (model, optimizer, scheduler, ...), the states of the random
+number generators, the number of finished epochs and the results per epoch. It is written atomically to
+`checkpoint.pt` in the job directory, so a job killed while writing keeps the previous checkpoint.
+"""
+import os
+import random
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .artifacts import store
+
+CHECKPOINT_FILE = "checkpoint.pt"
+
+
+def get_checkpoint_path(output_dir: str) -> str:
+    return os.path.join(str(output_dir), CHECKPOINT_FILE)
+
+
+def get_rng_state() -> Dict[str, Any]:
+    import torch
+
+    state = {"python": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+    if torch.cuda.is_available():
+        state["cuda"] = torch.cuda.get_rng_state_all()
+    return state
+
+
+def set_rng_state(state: Dict[str, Any]) -> None:
+    import torch
+
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+    if "cuda" in state and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state["cuda"])
+
+
+def save_checkpoint(output_dir: str, epoch: int, results_per_epoch: List[list], extra: Optional[Dict[str, Any]] = None,
+                    **objects) -> bool:
+    """
+    Stores the state dicts of `objects`, the RNG states, the number of finished epochs, the results per epoch and
+    `extra` (picklable values, e.g. the best score).
+    """
+    import torch
+
+    checkpoint = {
+        "epoch": epoch,
+        "results_per_epoch": [list(row) for row in results_per_epoch],
+        "extra": extra or {},
+        "rng": get_rng_state(),
+        "states": {name: obj.state_dict() for name, obj in objects.items() if obj is not None},
+    }
+    path = get_checkpoint_path(output_dir)
+    if store(path, lambda temp_path: torch.save(checkpoint, temp_path)):
+        print("Saved checkpoint of epoch {} to {}".format(epoch, path))
+        return True
+    return False
+
+
+def load_checkpoint(output_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the checkpoint of the job directory, or None if there is none (the job starts from the beginning).
+    """
+    import torch
+
+    path = get_checkpoint_path(output_dir)
+    if not os.path.isfile(path):
+        print("No checkpoint in {}, starting from the beginning".format(output_dir))
+        return None
+    try:
+        try:
+            # the checkpoint holds numpy RNG states, not only tensors
+            checkpoint = torch.load(path, map_location="cpu", weights_only=False)
+        except TypeError:
+            # torch < 1.13 has no weights_only
+            checkpoint = torch.load(path, map_location="cpu")
+    except Exception as e:
+        print("Warning: Failed to read checkpoint {}, starting from the beginning: {}".format(path, e))
+        return None
+    print("Resuming from checkpoint {} after epoch {}".format(path, checkpoint["epoch"]))
+    return checkpoint
+
+
+def restore_checkpoint(checkpoint: Dict[str, Any], **objects) -> int:
+    """
+    Loads the state dicts into `objects` and restores the RNG states. Returns the number of finished epochs.
+    """
+    for name, obj in objects.items():
+        if obj is not None and name in checkpoint["states"]:
+            obj.load_state_dict(checkpoint["states"][name])
+    set_rng_state(checkpoint["rng"])
+    return checkpoint["epoch"]
@@ -0,0 +1,122 @@
+"""
+Text cleaning of the attributes before blocking (tokenization, stop word removal and stemming), shared by the splitters.
+
+Cell values repeat a lot (e.g. brands, categories, years), so every distinct value is cleaned only once and the stems
+of the tokens are memoized. Large tables are cleaned by a process pool with `SLURM_CPUS_PER_TASK` processes.
+With `ERBENCH_CACHE_DIR` set, the cleaned tables are stored there, keyed by a hash of their content.
+"""
+import os
+from functools import lru_cache
+from multiprocessing import Pool
+from typing import List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .artifacts import get_cache_dir, hash_series, make_key, store
+
+CACHE_VERSION = "1"  # increase when the cleaning changes, so older cache entries are not used anymore
+STEM_CACHE_SIZE = 2 ** 18
+MIN_PARALLEL_VALUES = 20000  # fewer distinct values are cleaned in this process, starting a pool costs more
+CHUNK_SIZE = 2000
+
+_stop_words = None
+_stem = None
+
+
+def get_num_processes() -> int:
+    """
+    Returns the number of CPUs allocated by Slurm, or the number of usable CPUs outside of Slurm.
+    """
+    cpus = os.getenv("SLURM_CPUS_PER_TASK")
+    if cpus:
+        return max(1, int(cpus))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def clean_entry(entry: str) -> str:
+    """
+    Tokenizes `entry`, removes English stop words and stems the remaining tokens.
+    """
+    from nltk.tokenize import word_tokenize
+
+    if _stem is None:
+        _init_cleaning()
+    return ' '.join([_stem(token) for token in word_tokenize(entry) if token not in _stop_words])
+
+
+def clean_values(values: Sequence[str], processes: Optional[int] = None) -> List[str]:
+    """
+    Cleans a sequence of distinct values, in parallel if there are many of them.
+    """
+    _download_nltk_data()
+    processes = processes or get_num_processes()
+    if processes <= 1 or len(values) < MIN_PARALLEL_VALUES:
+        return _clean_chunk(values)
+
+    chunks = [values[i:i + CHUNK_SIZE] for i in range(0, len(values), CHUNK_SIZE)]
+    with Pool(processes, initializer=_init_cleaning) as pool:
+        cleaned = []
+        for chunk in pool.imap(_clean_chunk, chunks):
+            cleaned.extend(chunk)
+    return cleaned
+
+
+def clean_table(table_df: pd.DataFrame, columns: List[str], processes: Optional[int] = None) -> pd.DataFrame:
+    """
+    Returns a copy of `table_df` with the (string) `columns` cleaned, every distinct value of them is cleaned only once.
+    """
+    cache_path = _get_cache_path(table_df, columns)
+    if cache_path is not None and os.path.isfile(cache_path):
+        try:
+            cleaned_df = pd.read_pickle(cache_path)
+            print("Using cleaned table from cache", cache_path)
+            return cleaned_df
+        except Exception as e:
+            print("Warning: Failed to read cleaned table {}: {}".format(cache_path, e))
+
+    table_df = table_df.copy()
+    values = pd.unique(np.concatenate([table_df[col].to_numpy(dtype=object) for col in columns]))
+    index = pd.Index(values)
+    cleaned = np.asarray(clean_values(list(values), processes), dtype=object)
+    print("Cleaned {} distinct values of {} cells".format(len(values), table_df.shape[0] * len(columns)))
+
+    for col in columns:
+        table_df[col] = cleaned[index.get_indexer(table_df[col].to_numpy(dtype=object))]
+
+    if cache_path is not None:
+        store(cache_path, table_df.to_pickle)
+    return table_df
+
+
+def _get_cache_path(table_df: pd.DataFrame, columns: List[str]) -> Optional[str]:
+    cache_dir = get_cache_dir("cleaning")
+    if cache_dir is None:
+        return None
+    key = make_key("cleaning", CACHE_VERSION, list(table_df.columns), columns, hash_series(table_df))
+    return os.path.join(cache_dir, key + ".pkl")
+
+
+def _clean_chunk(values: Sequence[str]) -> List[str]:
+    return [clean_entry(value) for value in values]
+
+
+def _init_cleaning() -> None:
+    global _stop_words, _stem
+    from nltk.corpus import stopwords
+    from nltk.stem import SnowballStemmer
+
+    _stop_words = set(stopwords.words('english'))
+    _stem = lru_cache(maxsize=STEM_CACHE_SIZE)(SnowballStemmer('english').stem)
+
+
+def _download_nltk_data() -> None:
+    import nltk
+
+    for path, package in [('tokenizers/punkt_tab', 'punkt_tab'), ('corpora/stopwords', 'stopwords')]:
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(package)
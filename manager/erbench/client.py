@@ -1,7 +1,15 @@
 import os
+import copy
+import gzip
+import json
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
 from enum import Enum
-from typing import List, TypedDict, Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Iterable, List, TypedDict, Dict, Any, Optional, Tuple
+from urllib3.util.retry import Retry
 
 
 class FilteringAlgo(TypedDict):
@@ -42,6 +50,7 @@ class Job(TypedDict):
     matchingParams: Dict[str, Any]
     matchingSlurmId: int
     notifyEmail: str
+    updatedAt: str
     createdAt: str
     filteringAlgo: FilteringAlgo
     matchingAlgo: MatchingAlgo
@@ -57,11 +66,13 @@ class Metrics(TypedDict, total=False):
     filteringEntriesA: Optional[int]
     filteringEntriesB: Optional[int]
     filteringMatches: Optional[int]
+    filteringPhases: Optional[List[Dict[str, Any]]]
     f1: Optional[float]
     precision: Optional[float]
     recall: Optional[float]
     trainTime: Optional[int]
     evalTime: Optional[int]
+    phases: Optional[List[Dict[str, Any]]]
     cpuAllocated: Optional[int]
     cpuUtilized: Optional[int]
     memUtilized: Optional[int]
@@ -91,29 +102,103 @@ class Prediction(TypedDict):
 
 
 class ErbenchClient:
-    def __init__(self):
+    """
+    Client for the SMBench API.
+
+    All requests go through a keep-alive session with a connection pool. Idempotent requests (GET/PUT)
+    are retried with exponential backoff on connection errors and 429/5xx responses.
+    With `thread_safe=True` every thread gets its own session, so the client can be shared by concurrent job handlers.
+    """
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    RETRY_METHODS = frozenset(["GET", "PUT", "HEAD", "OPTIONS", "DELETE"])
+    JOBS_PAGE_SIZE = 500
+
+    def __init__(self, timeout: float | Tuple[float, float] = None, retries: int = None, backoff_factor: float = None, pool_size: int = None, thread_safe: bool = False):
         self.base_url = os.getenv("API_BASE_URL", "https://smbench.kbs.uni-hannover.de")
         self.api_key = os.getenv("API_KEY")
 
         if not self.base_url:
             raise ValueError("API_BASE_URL not found. Please create a .env file with API_BASE_URL defined.")
 
-    def get_jobs(self) -> List[Job]:
+        # (connect, read) timeouts in seconds
+        self.timeout = timeout if timeout is not None else (float(os.getenv("API_CONNECT_TIMEOUT", 5)), float(os.getenv("API_READ_TIMEOUT", 60)))
+        self.retries = retries if retries is not None else int(os.getenv("API_RETRIES", 3))
+        self.backoff_factor = backoff_factor if backoff_factor is not None else float(os.getenv("API_BACKOFF_FACTOR", 0.5))
+        self.pool_size = pool_size if pool_size is not None else int(os.getenv("API_POOL_SIZE", 10))
+        self.thread_safe = thread_safe
+
+        self._session: Optional[requests.Session] = None
+        self._local = threading.local()
+        # url -> (etag, response json) of the last successful job list requests
+        self._etag_cache: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+    @property
+    def session(self) -> requests.Session:
+        if self.thread_safe:
+            session = getattr(self._local, "session", None)
+            if session is None:
+                session = self._local.session = self._create_session()
+            return session
+
+        if self._session is None:
+            self._session = self._create_session()
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        session = getattr(self._local, "session", None)
+        if session is not None:
+            session.close()
+            self._local.session = None
+
+    def get_jobs(self, statuses: List[JobStatus] = None, updated_since: datetime | str = None) -> List[Job]:
+        """
+        Returns the jobs with one of the given statuses (by default, the API returns only active jobs),
+        optionally only those updated after `updated_since`.
+        Pages which did not change since the last call are answered by the API with 304 and taken from a local cache.
+        """
         url = f"{self.base_url}/api/jobs"
-        headers = self._get_headers()
+        params = {"rows": self.JOBS_PAGE_SIZE, "sortField": "createdAt", "sortOrder": "asc"}
+        if statuses:
+            params["status"] = ",".join(JobStatus(status).value for status in statuses)
+        if updated_since:
+            params["updatedSince"] = updated_since.isoformat() if isinstance(updated_since, datetime) else updated_since
+
+        jobs = []
+        while True:
+            params["first"] = len(jobs)
+            json = self._get_cached(url, params)
+            if not json or not json["data"]:
+                break
+
+            jobs.extend(json["data"])
+            if len(jobs) >= json.get("page", {}).get("total", 0):
+                break
 
-        response = requests.get(url, headers=headers)
+        return jobs
+
+    def _get_cached(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        cache_key = requests.Request("GET", url, params=params).prepare().url
+        cached = self._etag_cache.get(cache_key)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+
+        response = self.session.get(url, params=params, headers=headers, timeout=self.timeout)
+        if response.status_code == 304 and cached:
+            # callers are allowed to modify the returned jobs
+            return copy.deepcopy(cached[1])
         response.raise_for_status()
 
         json = response.json()
-        if response.status_code == 200 and json["data"]:
-            return json["data"]
-        else:
-            return []
+        etag = response.headers.get("ETag")
+        if etag:
+            self._etag_cache[cache_key] = (etag, copy.deepcopy(json))
+        return json
 
     def update_job(self, job_id: str, status: JobStatus, filtering_slurm_id: int = None, matching_slurm_id: int = None) -> requests.Response:
         url = f"{self.base_url}/api/jobs/{job_id}"
-        headers = self._get_headers()
 
         payload = {
             "status": status.value,
@@ -123,26 +208,67 @@ class ErbenchClient:
         if matching_slurm_id is not None:
             payload["matchingSlurmId"] = matching_slurm_id
 
-        response = requests.put(url, headers=headers, json=payload)
+        response = self.session.put(url, json=payload, timeout=self.timeout)
         response.raise_for_status()
         return response
 
     def send_results(self, job_id: str, status: JobStatus, metrics: Metrics) -> requests.Response:
         url = f"{self.base_url}/api/jobs/{job_id}/results"
-        headers = self._get_headers()
 
-        response = requests.put(url, headers=headers, json={"status": status.value, **metrics})
+        response = self.session.put(url, json={"status": status.value, **metrics}, timeout=self.timeout)
         response.raise_for_status()
         return response
 
-    def send_predictions(self, job_id: str, predictions: List[Prediction]) -> requests.Response:
+    def send_predictions(self, job_id: str, predictions: List[Prediction], compress: bool = False) -> requests.Response:
         url = f"{self.base_url}/api/jobs/{job_id}/predictions"
-        headers = self._get_headers()
 
-        response = requests.put(url, headers=headers, json=predictions)
+        if compress:
+            body = gzip.compress(json.dumps(predictions).encode("utf-8"))
+            response = self.session.put(url, data=body, headers={"Content-Encoding": "gzip"}, timeout=self.timeout)
+        else:
+            response = self.session.put(url, json=predictions, timeout=self.timeout)
         response.raise_for_status()
         return response
 
+    def upload_predictions(self, job_id: str, chunks: Iterable[List[Prediction]], max_workers: int = 4, compress: bool = True) -> int:
+        """
+        Uploads chunks of predictions in parallel and returns the number of uploaded predictions.
+        At most `2 * max_workers` chunks are held in memory at the same time.
+        The API ignores duplicated predictions, so a retried chunk does not create duplicates.
+        """
+        total = 0
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="erbench-upload") as executor:
+            pending = set()
+            for chunk in chunks:
+                if len(pending) >= max_workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+
+                pending.add(executor.submit(self.send_predictions, job_id, chunk, compress))
+                total += len(chunk)
+
+            for future in wait(pending).done:
+                future.result()
+
+        return total
+
+    def _create_session(self) -> requests.Session:
+        retry = Retry(
+            total=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=self.RETRY_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        session.headers.update(self._get_headers())
+        return session
+
     def _get_headers(self) -> Dict[str, str]:
         headers = {"Content-Type": "application/json"}
         if self.api_key:
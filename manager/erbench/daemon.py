@@ -0,0 +1,93 @@
+import asyncio
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from .client import Job
+
+
+class JobDaemon:
+    """
+    Long-running poll loop, every job is handled as its own asyncio task.
+
+    The handler itself is a blocking function (it shells out to Slurm and talks to the API),
+    so it is executed in a worker thread and never blocks the event loop.
+    A job which is still being handled is not dispatched again by the next poll.
+    """
+
+    def __init__(self, fetch_jobs: Callable[[], List[Job]], handle_job: Callable[[Job], None], interval: float = 10, concurrency: int = 4):
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+
+        self.fetch_jobs = fetch_jobs
+        self.handle_job = handle_job
+        self.interval = interval
+        self.concurrency = concurrency
+
+        self._active: Dict[str, asyncio.Task] = {}
+        self._stopping: asyncio.Event | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def is_active(self, job_id: str) -> bool:
+        return job_id in self._active
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    def stop(self):
+        if self._stopping is not None and not self._stopping.is_set():
+            print("Shutdown requested, waiting for running jobs to finish")
+            self._stopping.set()
+
+    async def serve(self):
+        loop = asyncio.get_running_loop()
+        # one thread per concurrent job, plus one for polling
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=self.concurrency + 1, thread_name_prefix="erbench"))
+
+        self._stopping = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        print(f"Manager daemon started, polling every {self.interval}s with up to {self.concurrency} concurrent jobs")
+        try:
+            while not self._stopping.is_set():
+                await self._poll()
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+
+            if self._active:
+                print(f"Waiting for {len(self._active)} job(s) to finish")
+                await asyncio.gather(*self._active.values(), return_exceptions=True)
+            print("Manager daemon stopped")
+
+    async def _poll(self):
+        try:
+            jobs = await asyncio.to_thread(self.fetch_jobs)
+        except Exception as e:
+            print(f"Error fetching jobs: {str(e)}")
+            return
+
+        for job in jobs:
+            if job["id"] in self._active:
+                continue
+            task = asyncio.create_task(self._run(job), name=f"job-{job['id']}")
+            self._active[job["id"]] = task
+
+    async def _run(self, job: Job):
+        try:
+            async with self._semaphore:
+                if self._stopping.is_set():
+                    return
+                await asyncio.to_thread(self.handle_job, job)
+        except Exception as e:
+            print(f"Error processing job {job['id']}: {str(e)}")
+        finally:
+            self._active.pop(job["id"], None)
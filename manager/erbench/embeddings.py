@@ -0,0 +1,265 @@
+"""
+Vocabulary-restricted fastText embeddings, which are memory-mapped instead of loading the full `wiki.en.bin` per job.
+
+A store is a directory next to the model (`wiki.en.bin` -> `wiki.en.store`) with
+
+    vocab.txt     the tokens of the datasets (and optionally the most frequent words of the model), one per line
+    vectors.npy   their fastText word vectors, precomputed with the subwords
+    subwords.npy  the character n-gram vectors of the model (float16), to compute vectors of other tokens
+    meta.json     dimension and subword parameters of the model
+
+It is built once with the full model (in a container with fasttext installed):
+
+    python -m erbench.embeddings /embeddings/wiki.en.bin /datasets/d1_fodors_zagat /datasets/d2_abt_buy ...
+
+The consumers call `install_fasttext_shim` with their `--embeddings` directory, which makes `fasttext.load_model`
+return an `EmbeddingStore` for every model that has a store. Only the pages of the vectors which are looked up are
+read from disk, instead of several GB per job.
+"""
+import os
+import sys
+import json
+import argparse
+from typing import Iterable, List, Optional, Set
+
+import numpy as np
+
+STORE_SUFFIX = ".store"
+VOCAB_FILE = "vocab.txt"
+VECTORS_FILE = "vectors.npy"
+SUBWORDS_FILE = "subwords.npy"
+META_FILE = "meta.json"
+
+
+def get_store_path(model_path: str) -> str:
+    return os.path.splitext(str(model_path))[0] + STORE_SUFFIX
+
+
+def has_store(model_path: str) -> bool:
+    return os.path.isfile(os.path.join(get_store_path(model_path), META_FILE))
+
+
+class EmbeddingStore:
+    """
+    Provides the parts of the fastText model API which the methods use (`get_word_vector`, `get_sentence_vector`,
+    `get_dimension`, `get_words`) on top of a store.
+    """
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        with open(os.path.join(self.path, META_FILE), "r") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(self.path, VOCAB_FILE), "r", encoding="utf-8") as f:
+            self.words = f.read().split("\n")[:-1]
+        self.word_ids = {word: i for i, word in enumerate(self.words)}
+        self.vectors = np.load(os.path.join(self.path, VECTORS_FILE), mmap_mode="r")
+
+        subwords_path = os.path.join(self.path, SUBWORDS_FILE)
+        self.subwords = np.load(subwords_path, mmap_mode="r") if os.path.isfile(subwords_path) else None
+
+    def get_dimension(self) -> int:
+        return int(self.meta["dim"])
+
+    def get_words(self) -> List[str]:
+        return list(self.words)
+
+    def get_word_id(self, word: str) -> int:
+        return self.word_ids.get(word, -1)
+
+    def get_word_vector(self, word: str) -> np.ndarray:
+        word_id = self.word_ids.get(word)
+        if word_id is not None:
+            return np.array(self.vectors[word_id], dtype=np.float32)
+        if self.subwords is None:
+            return np.zeros(self.get_dimension(), dtype=np.float32)
+
+        # like fastText, a token without a vector is the average of its character n-grams
+        buckets = get_subword_buckets(word, self.meta["minn"], self.meta["maxn"], self.meta["bucket"])
+        if not buckets:
+            return np.zeros(self.get_dimension(), dtype=np.float32)
+        return self.subwords[np.asarray(buckets)].astype(np.float32).mean(axis=0)
+
+    def get_sentence_vector(self, text: str) -> np.ndarray:
+        # like fastText for unsupervised models, the average of the normalized word vectors
+        vector = np.zeros(self.get_dimension(), dtype=np.float32)
+        count = 0
+        for word in text.split():
+            word_vector = self.get_word_vector(word)
+            norm = np.linalg.norm(word_vector)
+            if norm > 0:
+                vector += word_vector / norm
+                count += 1
+        return vector / count if count > 0 else vector
+
+    def __getitem__(self, word: str) -> np.ndarray:
+        return self.get_word_vector(word)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.word_ids
+
+
+def install_fasttext_shim(embeddings_dir: Optional[str] = None) -> None:
+    """
+    Makes `fasttext.load_model` return an `EmbeddingStore` for models with a store (in `embeddings_dir`, if given).
+    Other models are still loaded by fasttext.
+    """
+    try:
+        import fasttext
+    except ImportError:
+        return
+
+    if getattr(fasttext.load_model, "erbench_shim", False):
+        return
+    load_model = fasttext.load_model
+
+    def load_model_or_store(path, *args, **kwargs):
+        in_dir = embeddings_dir is None or os.path.dirname(os.path.abspath(str(path))) == os.path.abspath(str(embeddings_dir))
+        if in_dir and has_store(path):
+            print("Using embedding store", get_store_path(path))
+            return EmbeddingStore(get_store_path(path))
+        return load_model(path, *args, **kwargs)
+
+    load_model_or_store.erbench_shim = True
+    fasttext.load_model = load_model_or_store
+
+
+def get_subword_buckets(word: str, minn: int, maxn: int, bucket: int) -> List[int]:
+    """
+    Returns the hash buckets of the character n-grams of `word`, computed on UTF-8 like fastText's computeSubwords.
+    """
+    if bucket <= 0 or maxn <= 0:
+        return []
+    data = ("<" + word + ">").encode("utf-8")
+    buckets = []
+    for i in range(len(data)):
+        if data[i] & 0xC0 == 0x80:
+            continue
+        j = i
+        n = 1
+        while j < len(data) and n <= maxn:
+            j += 1
+            while j < len(data) and data[j] & 0xC0 == 0x80:
+                j += 1
+            if n >= minn and not (n == 1 and (i == 0 or j == len(data))):
+                buckets.append(_fnv1a(data[i:j]) % bucket)
+            n += 1
+    return buckets
+
+
+def _fnv1a(data: bytes) -> int:
+    h = 2166136261
+    for byte in data:
+        # fastText hashes the bytes as signed chars
+        h = (h ^ ((byte - 256 if byte > 127 else byte) & 0xFFFFFFFF)) & 0xFFFFFFFF
+        h = (h * 16777619) & 0xFFFFFFFF
+    return h
+
+
+def collect_tokens(dataset_dirs: Iterable[str]) -> Set[str]:
+    """
+    Returns the tokens of all attributes of the tables of the datasets, as split by whitespace (fastText, DeepBlocker)
+    and, if nltk is available, by its word tokenizer (deepmatcher), each as is and lowercase.
+    """
+    from .tables import read_table
+
+    try:
+        from nltk.tokenize import word_tokenize
+        word_tokenize("test")
+    except (ImportError, LookupError):
+        word_tokenize = None
+
+    tokens = set()  # type: Set[str]
+    for dataset_dir in dataset_dirs:
+        for name in ["tableA", "tableB"]:
+            table_df = read_table(dataset_dir, name)
+            for col in table_df.columns:
+                if col == "id":
+                    continue
+                for value in table_df[col].dropna().astype(str).unique():
+                    for text in {value, value.lower()}:
+                        tokens.update(text.split())
+                        if word_tokenize is not None:
+                            tokens.update(word_tokenize(text))
+    return tokens
+
+
+def build_store(model_path: str, tokens: Iterable[str], top_words: int = 0, subwords: bool = True,
+                output: Optional[str] = None) -> str:
+    """
+    Builds the store of a fastText model for `tokens` and the `top_words` most frequent words of the model.
+    """
+    import fasttext
+
+    model = fasttext.load_model(str(model_path))
+    args = model.f.getArgs()
+    output = output or get_store_path(model_path)
+    os.makedirs(output, exist_ok=True)
+
+    words = sorted(set(token for token in tokens if token and not any(c.isspace() for c in token)))
+    if top_words > 0:
+        known = set(words)
+        words.extend(word for word in model.get_words()[:top_words] if word not in known and word.strip() == word)
+    print("Building the embedding store {} with {} words".format(output, len(words)))
+
+    dim = model.get_dimension()
+    vectors = np.lib.format.open_memmap(os.path.join(output, VECTORS_FILE), mode="w+", dtype=np.float32,
+                                        shape=(len(words), dim))
+    for i, word in enumerate(words):
+        vectors[i] = model.get_word_vector(word)
+    vectors.flush()
+    del vectors
+
+    with open(os.path.join(output, VOCAB_FILE), "w", encoding="utf-8") as f:
+        for word in words:
+            f.write(word + "\n")
+
+    num_words = len(model.get_words())
+    if subwords and args.bucket > 0:
+        _check_subword_hashing(model, args, num_words)
+        input_matrix = model.get_input_matrix()
+        subword_vectors = np.lib.format.open_memmap(os.path.join(output, SUBWORDS_FILE), mode="w+", dtype=np.float16,
+                                                    shape=(args.bucket, dim))
+        for start in range(0, args.bucket, 100000):
+            end = min(start + 100000, args.bucket)
+            subword_vectors[start:end] = input_matrix[num_words + start:num_words + end]
+        subword_vectors.flush()
+        del subword_vectors
+
+    with open(os.path.join(output, META_FILE), "w") as f:
+        json.dump({"source": os.path.basename(str(model_path)), "dim": dim, "minn": args.minn, "maxn": args.maxn,
+                   "bucket": args.bucket if subwords else 0, "words": len(words)}, f)
+    return output
+
+
+def _check_subword_hashing(model, args, num_words: int) -> None:
+    for word in ["entity", "matching", "Straße", "東京", "x"]:
+        expected = sorted(int(i) - num_words for i in model.get_subwords(word)[1] if i >= num_words)
+        actual = sorted(get_subword_buckets(word, args.minn, args.maxn, args.bucket))
+        if expected != actual:
+            raise RuntimeError("The subword hashing does not match fastText for {!r}".format(word))
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description='Builds a memory-mapped embedding store of a fastText model')
+    parser.add_argument('model', type=str,
+                        help='Path of the fastText model, e.g. /workspace/embeddings/wiki.en.bin')
+    parser.add_argument('datasets', type=str, nargs='*',
+                        help='Dataset directories, whose tokens are included')
+    parser.add_argument('-t', '--top_words', type=int, nargs='?', default=0,
+                        help='Also include the most frequent words of the model')
+    parser.add_argument('--no_subwords', action='store_true', default=False,
+                        help='Do not store the subword vectors, other tokens get zero vectors')
+    parser.add_argument('-o', '--output', type=str, nargs='?',
+                        help='Directory of the store, next to the model by default')
+    args = parser.parse_args(argv)
+
+    if not args.datasets and args.top_words <= 0:
+        print("Either datasets or --top_words have to be given")
+        sys.exit(1)
+
+    tokens = collect_tokens(args.datasets)
+    build_store(args.model, tokens, args.top_words, not args.no_subwords, args.output)
+
+
+if __name__ == "__main__":
+    main()
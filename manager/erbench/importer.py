@@ -1,39 +1,39 @@
 import os
-import csv
 import json
-from typing import List
+from typing import Any, Dict, Iterator, List
 
 from .client import Metrics, Prediction
+from .tables import find_table, get_path, iter_rows, read_first_row
+from .timing import PHASES_FILE, FILTERING_PHASES_FILE, read_phases
 
 
 def import_filtering_results(directory: str, results: Metrics = None) -> Metrics | None:
     if results is None:
         results = Metrics()
 
-    metrics_path = os.path.join(directory, "filtering_metrics.csv")
-    if not os.path.exists(metrics_path):
-        print(f"Error: {metrics_path} does not exist")
+    metrics_path = find_table(directory, "filtering_metrics")
+    if metrics_path is None:
+        print(f"Error: {get_path(directory, 'filtering_metrics')} does not exist")
         return None
 
     try:
-        with open(metrics_path, "r") as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-            values = next(reader)
-            metrics = dict(zip(headers, values))
-
-            results["filteringF1"] = float(metrics.get("f1", 0))
-            results["filteringPrecision"] = float(metrics.get("precision", 0))
-            results["filteringRecall"] = float(metrics.get("recall", 0))
-            results["filteringTime"] = round(float(metrics.get("filtering_time", 0)) * 1000)
-            results["filteringCandidates"] = int(metrics.get("num_candidates", 0))
-            results["filteringEntriesA"] = int(metrics.get("entries_tableA", 0))
-            results["filteringEntriesB"] = int(metrics.get("entries_tableB", 0))
-            results["filteringMatches"] = int(metrics.get("entries_matches", 0))
+        metrics = read_first_row(metrics_path)
+        results["filteringF1"] = float(metrics.get("f1", 0))
+        results["filteringPrecision"] = float(metrics.get("precision", 0))
+        results["filteringRecall"] = float(metrics.get("recall", 0))
+        results["filteringTime"] = round(float(metrics.get("filtering_time", 0)) * 1000)
+        results["filteringCandidates"] = int(metrics.get("num_candidates", 0))
+        results["filteringEntriesA"] = int(metrics.get("entries_tableA", 0))
+        results["filteringEntriesB"] = int(metrics.get("entries_tableB", 0))
+        results["filteringMatches"] = int(metrics.get("entries_matches", 0))
     except Exception as e:
-        print(f"Error reading filtering_metrics.csv: {e}")
+        print(f"Error reading {os.path.basename(metrics_path)}: {e}")
         return None
 
+    phases = import_phases(os.path.join(directory, FILTERING_PHASES_FILE))
+    if phases is not None:
+        results["filteringPhases"] = phases
+
     return results
 
 
@@ -41,66 +41,101 @@ def import_results(directory: str, results: Metrics = None) -> Metrics | None:
     if results is None:
         results = Metrics()
 
-    metrics_path = os.path.join(directory, "metrics.csv")
-    if not os.path.exists(metrics_path):
-        print(f"Error: {metrics_path} does not exist")
+    metrics_path = find_table(directory, "metrics")
+    if metrics_path is None:
+        print(f"Error: {get_path(directory, 'metrics')} does not exist")
         return None
 
     try:
-        with open(metrics_path, "r") as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-            values = next(reader)
-            metrics = dict(zip(headers, values))
-
-            results["f1"] = float(metrics.get("f1", 0))
-            results["precision"] = float(metrics.get("precision", 0))
-            results["recall"] = float(metrics.get("recall", 0))
-            results["trainTime"] = round(float(metrics.get("train_time", 0)) * 1000)
-            results["evalTime"] = round(float(metrics.get("eval_time", 0)) * 1000)
+        metrics = read_first_row(metrics_path)
+        results["f1"] = float(metrics.get("f1", 0))
+        results["precision"] = float(metrics.get("precision", 0))
+        results["recall"] = float(metrics.get("recall", 0))
+        results["trainTime"] = round(float(metrics.get("train_time", 0)) * 1000)
+        results["evalTime"] = round(float(metrics.get("eval_time", 0)) * 1000)
     except Exception as e:
-        print(f"Error reading metrics.csv: {e}")
+        print(f"Error reading {os.path.basename(metrics_path)}: {e}")
         return None
 
+    phases = import_phases(os.path.join(directory, PHASES_FILE))
+    if phases is not None:
+        results["phases"] = phases
+
     return results
 
 
+def import_phases(phases_path: str) -> List[Dict[str, Any]] | None:
+    """
+    Reads the per-phase timings written by the containers, times are converted to milliseconds like the other metrics.
+    Older containers don't write them, so a missing file is not an error.
+    """
+    try:
+        phases = read_phases(phases_path)
+    except Exception as e:
+        print(f"Error reading {os.path.basename(phases_path)}: {e}")
+        return None
+    if phases is None:
+        return None
+
+    for phase in phases:
+        for column in ["wall_time", "cpu_time"]:
+            if phase[column] is not None:
+                phase[column] = round(phase[column] * 1000)
+    return phases
+
+
 def import_predictions(directory: str) -> List[Prediction] | None:
-    predictions_path = os.path.join(directory, "predictions.csv")
-    if not os.path.exists(predictions_path):
-        print(f"Error: {predictions_path} does not exist")
+    predictions_path = find_table(directory, "predictions")
+    if predictions_path is None:
+        print(f"Error: {get_path(directory, 'predictions')} does not exist")
         return None
 
     predictions = []
     try:
-        with open(predictions_path, "r") as f:
-            reader = csv.reader(f)
-            headers = next(reader)
-            for row in reader:
-                prediction_data = dict(zip(headers, row))
-                predictions.append(
-                    {
-                        "tableA_id": int(prediction_data.get("tableA_id")),
-                        "tableB_id": int(prediction_data.get("tableB_id")),
-                        "tableA_name": prediction_data.get("tableA_name"),
-                        "tableB_name": prediction_data.get("tableB_name"),
-                        "probability": float(prediction_data.get("prob_class1", 0)),
-                        "label": int(prediction_data.get("label", 0)),
-                    }
-                )
+        for chunk in iter_predictions(directory):
+            predictions.extend(chunk)
     except Exception as e:
-        print(f"Error reading predictions.csv: {e}")
+        print(f"Error reading {os.path.basename(predictions_path)}: {e}")
         return None
 
     return predictions
 
 
-def import_slurm_metrics(job_json: str, results: Metrics = None) -> Metrics | None:
+def iter_predictions(directory: str, chunk_size: int = 10000) -> Iterator[List[Prediction]]:
+    """
+    Reads the predictions table (in any format) lazily and yields lists of at most `chunk_size` predictions,
+    so only a single chunk has to be kept in memory.
+    """
+    predictions_path = find_table(directory, "predictions")
+    if predictions_path is None:
+        raise FileNotFoundError(f"{get_path(directory, 'predictions')} does not exist")
+
+    for rows in iter_rows(predictions_path, chunk_size):
+        yield [_parse_prediction(row) for row in rows]
+
+
+def _parse_prediction(prediction_data: Dict[str, Any]) -> Prediction:
+    # values of CSV tables are strings, those of Parquet/Arrow tables are typed and missing names are None
+    return {
+        "tableA_id": int(prediction_data.get("tableA_id")),
+        "tableB_id": int(prediction_data.get("tableB_id")),
+        "tableA_name": _optional_str(prediction_data.get("tableA_name")),
+        "tableB_name": _optional_str(prediction_data.get("tableB_name")),
+        "probability": float(prediction_data.get("prob_class1", 0)),
+        "label": int(prediction_data.get("label", 0)),
+    }
+
+
+def _optional_str(value: Any) -> str | None:
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def import_slurm_metrics(job_json: str | Dict[str, Any], results: Metrics = None) -> Metrics | None:
     if results is None:
         results = Metrics()
 
     try:
-        job_data = json.loads(job_json)
+        job_data = json.loads(job_json) if isinstance(job_json, str) else job_json
 
         if not job_data.get("jobs") or len(job_data["jobs"]) == 0:
             print("Error: No jobs found in the job data")
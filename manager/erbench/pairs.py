@@ -0,0 +1,109 @@
+"""
+Layouts of the candidate pair files (train/valid/test) written by the splitters and read by the matchers.
+
+    full: every pair with all attributes of both records (`tableA_<attr>`, `tableB_<attr>`, `label`), the default
+    ids:  only `tableA_id`, `tableB_id` and `label`, the attributes are in the tables `tableA`/`tableB` next to it
+
+The splitters write the layout chosen by `ERBENCH_PAIRS_LAYOUT`, `load_pairs` reads both and joins the attributes in memory.
+"""
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .tables import TableWriter, read_table, write_table
+
+PAIRS_LAYOUT_ENV = "ERBENCH_PAIRS_LAYOUT"
+FULL_LAYOUT = "full"
+IDS_LAYOUT = "ids"
+PAIRS_LAYOUTS = [FULL_LAYOUT, IDS_LAYOUT]
+
+ID_COLUMNS = ['tableA_id', 'tableB_id']
+
+_tables = {}  # the tables of a pairs directory by its path, read once per process
+
+
+def get_pairs_layout() -> str:
+    layout = os.getenv(PAIRS_LAYOUT_ENV, FULL_LAYOUT).lower()
+    if layout not in PAIRS_LAYOUTS:
+        raise ValueError("{} must be one of {}, not {}".format(PAIRS_LAYOUT_ENV, PAIRS_LAYOUTS, layout))
+    return layout
+
+
+def join_attributes(tableA_df: pd.DataFrame, tableB_df: pd.DataFrame, pairs_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the pairs with all attributes of both tables prefixed by `tableA_`/`tableB_` and the label.
+    The tables have to be indexed by their id.
+    """
+    cand_tableA = tableA_df.add_prefix('tableA_')
+    cand_tableB = tableB_df.add_prefix('tableB_')
+
+    return pd.concat([
+        (cand_tableA.loc[pairs_df['tableA_id']]).reset_index(drop=True),
+        (cand_tableB.loc[pairs_df['tableB_id']]).reset_index(drop=True),
+        pairs_df['label'].reset_index(drop=True)
+    ], axis=1)
+
+
+def format_pairs(tableA_df: pd.DataFrame, tableB_df: pd.DataFrame, pairs_df: pd.DataFrame,
+                 layout: Optional[str] = None) -> pd.DataFrame:
+    """
+    Returns the labelled pairs (`tableA_id`, `tableB_id`, `label`) in the given layout.
+    """
+    if (layout or get_pairs_layout()) == IDS_LAYOUT:
+        return pairs_df[ID_COLUMNS + ['label']].reset_index(drop=True)
+    return join_attributes(tableA_df, tableB_df, pairs_df)
+
+
+def write_pairs(pairs_df: pd.DataFrame, directory: str, name: str, layout: Optional[str] = None) -> str:
+    if (layout or get_pairs_layout()) == IDS_LAYOUT:
+        pairs_df = pairs_df[ID_COLUMNS + ['label']]
+    return write_table(pairs_df, directory, name)
+
+
+class PairsWriter(TableWriter):
+    """
+    Writes a pair file from a sequence of DataFrames, in the given layout.
+    """
+
+    def __init__(self, directory: str, name: str, layout: Optional[str] = None):
+        super().__init__(directory, name)
+        self.layout = layout or get_pairs_layout()
+
+    def write(self, pairs_df: pd.DataFrame):
+        if self.layout == IDS_LAYOUT:
+            pairs_df = pairs_df[ID_COLUMNS + ['label']]
+        super().write(pairs_df)
+
+
+def is_ids_only(pairs_df: pd.DataFrame) -> bool:
+    return set(pairs_df.columns) <= set(ID_COLUMNS + ['label'])
+
+
+def load_tables(directory: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Reads tableA and tableB of a split, indexed by their id. The tables are read only once per directory.
+    """
+    directory = os.path.abspath(str(directory))
+    if directory not in _tables:
+        tableA_df = read_table(directory, 'tableA')
+        tableB_df = read_table(directory, 'tableB')
+        _tables[directory] = (tableA_df.set_index('id', drop=False), tableB_df.set_index('id', drop=False))
+    return _tables[directory]
+
+
+def load_pairs(directory: str, name: str, with_attributes: bool = True) -> pd.DataFrame:
+    """
+    Reads the pairs `name` (e.g. train) of a split in either layout and format. With `with_attributes`, pairs in the
+    ids layout are joined with the tables, so the result looks like a pair file in the full layout.
+    """
+    pairs_df = read_table(directory, name)
+    if not with_attributes or not is_ids_only(pairs_df):
+        return pairs_df
+
+    tableA_df, tableB_df = load_tables(str(directory))
+    missing = ~pairs_df['tableA_id'].isin(tableA_df.index) | ~pairs_df['tableB_id'].isin(tableB_df.index)
+    if np.any(missing):
+        raise ValueError("{} pairs of {} refer to records which are not in the tables".format(int(missing.sum()), name))
+    return join_attributes(tableA_df, tableB_df, pairs_df)
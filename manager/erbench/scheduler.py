@@ -0,0 +1,412 @@
+import os
+import json
+import time
+import fcntl
+import signal
+import resource
+import threading
+import subprocess
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .slurm import SlurmStatus, write_array_job
+
+
+def render_params(params: dict) -> str:
+    result = []
+    for key, value in params.items():
+        if value is None or value is False:
+            continue
+        elif value is True:
+            result.append(f"--{key}")
+        elif isinstance(value, str) and " " in value:
+            result.append(f'--{key}="{value}"')
+        else:
+            result.append(f"--{key}={value}")
+
+    return " ".join(result)
+
+
+class Scheduler(ABC):
+    """
+    Backend which runs the filtering and matching commands of jobs.
+
+    The states and accounting records of all backends are reported in the format of `sacct --json`
+    (as a `SlurmStatus`), so jobs are checked and imported the same way, no matter where they ran.
+    """
+
+    name: str
+    supports_arrays = False
+
+    @abstractmethod
+    def submit(self, name: str, command: str, output: str, error: str, gpus: bool = False, dependency: int | str = None) -> int:
+        """
+        Submits a shell command and returns its job ID. With a `dependency`, the command only starts
+        after that job completed successfully, and is cancelled if it failed.
+        """
+
+    def submit_array(self, array_dir: str, phase: str, tasks: List[Tuple[str, str]], gpus: bool = False, dependency: int = None) -> int:
+        raise NotImplementedError(f"The {self.name} scheduler doesn't support job arrays")
+
+    @abstractmethod
+    def query(self, job_ids: Iterable[int | str]) -> SlurmStatus:
+        """
+        Returns the states and accounting records of the given jobs.
+        """
+
+    @abstractmethod
+    def cancel(self, job_id: int | str):
+        pass
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+
+class SlurmScheduler(Scheduler):
+    name = "slurm"
+    supports_arrays = True
+
+    def __init__(self, job_args: str = "", export: str = None):
+        self.job_args = job_args
+        self.export = export
+
+    def submit(self, name: str, command: str, output: str, error: str, gpus: bool = False, dependency: int | str = None) -> int:
+        slurm_params = {
+            "job-name": name,
+            "parsable": True,
+            "gpus": "1" if gpus else None,
+            "output": output,
+            "error": error,
+            "dependency": f"afterok:{dependency}" if dependency else None,
+            "export": self.export,
+            "wrap": command,
+        }
+        return self._sbatch(render_params(slurm_params))
+
+    def submit_array(self, array_dir: str, phase: str, tasks: List[Tuple[str, str]], gpus: bool = False, dependency: int = None) -> int:
+        script_path = write_array_job(array_dir, phase, tasks)
+
+        slurm_params = {
+            "job-name": f"erbench_{phase}_array",
+            "parsable": True,
+            "array": f"0-{len(tasks) - 1}",
+            "gpus": "1" if gpus else None,
+            # the tasks redirect their output into their job directories, this only catches errors of the script itself
+            "output": os.path.join(array_dir, f"{phase}_%a.out"),
+            "error": os.path.join(array_dir, f"{phase}_%a.err"),
+            # task i starts after task i of the dependency completed successfully
+            "dependency": f"aftercorr:{dependency}" if dependency else None,
+            "export": self.export,
+        }
+        return self._sbatch(f"{render_params(slurm_params)} {script_path}")
+
+    def query(self, job_ids: Iterable[int | str]) -> SlurmStatus:
+        return SlurmStatus.query(job_ids)
+
+    def cancel(self, job_id: int | str):
+        process = subprocess.run(["scancel", str(job_id)], capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"Error cancelling job: {process.stderr}")
+
+    def _sbatch(self, args: str) -> int:
+        cmd = f"sbatch {self.job_args} {args}"
+        print(f"Slurm command: {cmd}")
+        process = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"Error submitting Slurm job: {process.stderr}")
+
+        # --parsable prints "<job id>;<cluster>" on multi-cluster setups
+        return int(process.stdout.strip().split(";")[0])
+
+
+class LocalJob:
+    def __init__(self, job_id: int, name: str, command: str, output: str, error: str, cpus: int, memory: int, dependency: Optional[int]):
+        self.job_id = job_id
+        self.name = name
+        self.command = command
+        self.output = output
+        self.error = error
+        self.cpus = cpus
+        self.memory = memory
+        self.dependency = dependency
+        self.state = "PENDING"
+        self.reason = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.elapsed = 0.0
+        self.cpu_time = 0.0
+        self.max_rss = 0
+
+    def to_sacct(self) -> Dict[str, Any]:
+        # just the fields of a sacct record which are read by the manager
+        elapsed = self.elapsed if self.started_at is None or self.state != "RUNNING" else time.time() - self.started_at
+        return {
+            "job_id": self.job_id,
+            "name": self.name,
+            "state": {"current": [self.state], "reason": self.reason},
+            "time": {"elapsed": round(elapsed), "submission": round(self.submitted_at)},
+            "tres": {"allocated": [{"type": "cpu", "count": self.cpus}, {"type": "mem", "count": self.memory // 1024**2}]},
+            "steps": [{
+                "time": {"total": {"seconds": int(self.cpu_time), "microseconds": int(self.cpu_time % 1 * 1e6)}},
+                "tres": {"requested": {"total": [{"type": "mem", "count": self.max_rss}]}},
+            }],
+        }
+
+
+class LocalScheduler(Scheduler):
+    """
+    Runs the commands on this host in a process pool, limited by CPU and memory slots.
+
+    A job waits until its dependency completed and enough slots are free, smaller jobs may overtake larger ones.
+    Memory slots are only reserved, not enforced. The records of finished jobs are written to `state_dir`,
+    so they can still be imported after a restart of the manager. Jobs of another manager process, which is
+    still alive (e.g. an overlapping cronjob run), are reported as pending or running. Jobs whose manager
+    stopped before they finished are reported as failed, unless their command is still running.
+    """
+
+    name = "local"
+
+    def __init__(self, state_dir: str, cpus: int = None, memory: int = None, job_cpus: int = 1, job_memory: int = 4 * 1024**3):
+        self.state_dir = state_dir
+        self.cpus = cpus or os.cpu_count() or 1
+        self.memory = memory or os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+        self.job_cpus = job_cpus
+        self.job_memory = job_memory
+        os.makedirs(self.state_dir, exist_ok=True)
+
+        # at most one job per CPU slot is running, workers are spawned as the manager runs several threads
+        self._executor = ProcessPoolExecutor(max_workers=self.cpus, mp_context=multiprocessing.get_context("spawn"))
+        self._lock = threading.Condition()
+        self._jobs: Dict[int, LocalJob] = {}
+        self._queue: List[int] = []
+        self._free_cpus = self.cpus
+        self._free_memory = self.memory
+
+    def submit(self, name: str, command: str, output: str, error: str, gpus: bool = False, dependency: int | str = None,
+               cpus: int = None, memory: int = None) -> int:
+        # GPUs aren't managed by this scheduler, GPU jobs can only run if the host has a GPU to spare
+        with self._lock:
+            job_id = self._next_id()
+            # a job which is larger than this host would never start
+            job = LocalJob(job_id, name, command, output, error, min(cpus or self.job_cpus, self.cpus), min(memory or self.job_memory, self.memory),
+                           int(dependency) if dependency else None)
+            self._jobs[job_id] = job
+            self._queue.append(job_id)
+            self._write_owner(job_id)
+            self._dispatch()
+
+        print(f"Local job {job_id} submitted: {command}")
+        return job_id
+
+    def query(self, job_ids: Iterable[int | str]) -> SlurmStatus:
+        jobs = {}
+        with self._lock:
+            for job_id in {int(job_id) for job_id in job_ids if job_id}:
+                jobs[job_id] = self._get_record(job_id)
+        return SlurmStatus(jobs)
+
+    def cancel(self, job_id: int | str):
+        with self._lock:
+            job = self._jobs.get(int(job_id))
+            if job is None or job.state not in ("PENDING", "RUNNING"):
+                return
+
+            if job.state == "PENDING":
+                self._queue.remove(job.job_id)
+                self._finish(job, "CANCELLED")
+                self._dispatch()
+                return
+
+        # the command runs in its own process group, whose ID is written by the pool worker right after the start
+        job.reason = "Cancelled"
+        for _ in range(50):
+            try:
+                with open(self._pid_path(job.job_id), "r") as f:
+                    os.killpg(int(f.read().strip()), signal.SIGTERM)
+                return
+            except (OSError, ValueError):
+                if job.state != "RUNNING":
+                    return
+                time.sleep(0.1)
+        raise RuntimeError(f"Error cancelling local job {job_id}: the process was not found")
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops the scheduler, with `wait=True` only after all submitted jobs finished.
+        """
+        if wait:
+            with self._lock:
+                self._lock.wait_for(lambda: not any(job.state in ("PENDING", "RUNNING") for job in self._jobs.values()))
+        self._executor.shutdown(wait=wait, cancel_futures=not wait)
+
+    def _dispatch(self):
+        # called with the lock held, whenever a job was submitted or finished
+        for job_id in list(self._queue):
+            job = self._jobs[job_id]
+
+            if job.dependency is not None:
+                dependency_state = self._get_record(job.dependency)["state"]["current"][0]
+                if dependency_state in ("PENDING", "RUNNING"):
+                    continue
+                if dependency_state != "COMPLETED":
+                    self._queue.remove(job_id)
+                    job.reason = "DependencyNeverSatisfied"
+                    self._finish(job, "CANCELLED")
+                    continue
+
+            if job.cpus > self._free_cpus or job.memory > self._free_memory:
+                continue
+
+            self._queue.remove(job_id)
+            self._free_cpus -= job.cpus
+            self._free_memory -= job.memory
+            job.state = "RUNNING"
+            job.started_at = time.time()
+
+            try:
+                future = self._executor.submit(run_command, job.command, job.output, job.error, job.cpus, self._pid_path(job_id))
+            except Exception as e:
+                print(f"Error starting local job {job_id}: {str(e)}")
+                self._free_cpus += job.cpus
+                self._free_memory += job.memory
+                self._finish(job, "FAILED")
+                continue
+            future.add_done_callback(lambda f, job=job: self._on_done(job, f))
+
+    def _on_done(self, job: LocalJob, future: Future):
+        with self._lock:
+            self._free_cpus += job.cpus
+            self._free_memory += job.memory
+
+            try:
+                returncode, job.elapsed, job.cpu_time, job.max_rss = future.result()
+                state = "COMPLETED" if returncode == 0 else "FAILED"
+            except Exception as e:
+                print(f"Error running local job {job.job_id}: {str(e)}")
+                job.elapsed = time.time() - job.started_at
+                state = "FAILED"
+
+            self._finish(job, "CANCELLED" if job.reason == "Cancelled" else state)
+            self._dispatch()
+
+    def _finish(self, job: LocalJob, state: str):
+        job.state = state
+        try:
+            with open(os.path.join(self.state_dir, f"{job.job_id}.json"), "w") as f:
+                json.dump(job.to_sacct(), f)
+        except OSError as e:
+            print(f"Warning: Failed to store state of local job {job.job_id}: {str(e)}")
+        self._lock.notify_all()
+
+    def _get_record(self, job_id: int) -> Dict[str, Any]:
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_sacct()
+
+        # finished before the manager was restarted, or in another manager process
+        state_path = os.path.join(self.state_dir, f"{job_id}.json")
+        if os.path.exists(state_path):
+            with open(state_path, "r") as f:
+                return json.load(f)
+
+        running = self._is_running(job_id)
+        owner = self._read_pid(self._owner_path(job_id))
+        if owner is not None and owner != os.getpid() and _is_alive(owner):
+            # the other manager writes the record once the job finished
+            state = "RUNNING" if running else "PENDING"
+            return {"job_id": job_id, "state": {"current": [state], "reason": f"Job of manager process {owner}"}}
+        if running:
+            # its manager stopped, but the command is still running and may complete
+            return {"job_id": job_id, "state": {"current": ["RUNNING"], "reason": "The manager of the job was restarted"}}
+
+        return {"job_id": job_id, "state": {"current": ["FAILED"], "reason": "Unknown job, the manager was restarted"}}
+
+    def _next_id(self) -> int:
+        # IDs are unique across restarts, as they are stored in the database,
+        # and across manager processes, which allocate them under an exclusive lock
+        id_path = os.path.join(self.state_dir, "last_id")
+        with open(id_path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                last_id = int(f.read().strip() or 0)
+                f.seek(0)
+                f.truncate()
+                f.write(str(last_id + 1))
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        return last_id + 1
+
+    def _write_owner(self, job_id: int):
+        try:
+            with open(self._owner_path(job_id), "w") as f:
+                f.write(str(os.getpid()))
+        except OSError as e:
+            print(f"Warning: Failed to store owner of local job {job_id}: {str(e)}")
+
+    def _is_running(self, job_id: int) -> bool:
+        # the command runs in its own process group, whose ID is the pid of the command
+        pgid = self._read_pid(self._pid_path(job_id))
+        if pgid is None:
+            return False
+        try:
+            os.killpg(pgid, 0)
+            return True
+        except PermissionError:
+            return True
+        except OSError:
+            return False
+
+    @staticmethod
+    def _read_pid(path: str) -> Optional[int]:
+        try:
+            with open(path, "r") as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _owner_path(self, job_id: int) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.owner")
+
+    def _pid_path(self, job_id: int) -> str:
+        return os.path.join(self.state_dir, f"{job_id}.pid")
+
+
+def _is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+
+
+def run_command(command: str, output: str, error: str, cpus: int, pid_path: str) -> Tuple[int, float, float, int]:
+    """
+    Runs a command in a worker of the process pool and returns its exit code, wall time, CPU time and peak memory.
+    """
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+
+    # the commands size their thread pools like in a Slurm job
+    env = dict(os.environ, SLURM_CPUS_PER_TASK=str(cpus), OMP_NUM_THREADS=str(cpus))
+    with open(output, "w") as out, open(error, "w") as err:
+        process = subprocess.Popen(command, shell=True, stdout=out, stderr=err, env=env, start_new_session=True)
+        with open(pid_path, "w") as f:
+            f.write(str(process.pid))
+        returncode = process.wait()
+
+    try:
+        os.remove(pid_path)
+    except OSError:
+        pass
+
+    usage_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_time = (usage_after.ru_utime + usage_after.ru_stime) - (usage_before.ru_utime + usage_before.ru_stime)
+    # ru_maxrss is in KB and covers all commands run by this worker so far, an upper bound of this command
+    return returncode, time.time() - start, cpu_time, usage_after.ru_maxrss * 1024
@@ -0,0 +1,65 @@
+"""
+Serialization of the records of candidate pairs into text, shared by the transformer-based matchers.
+
+    plain:  the values joined by the separator (emtransformer)
+    tagged: every value prefixed by its attribute, "COL <attribute> VAL <value> COL ..." (ditto)
+
+The strings are built column by column with vectorized string operations, and every record is serialized only once,
+although it usually appears in many pairs, and then mapped onto the pairs by its id.
+"""
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+PLAIN = "plain"
+TAGGED = "tagged"
+FORMATS = [PLAIN, TAGGED]
+PREFIXES = ['tableA_', 'tableB_']
+
+
+def get_columns(pairs_df: pd.DataFrame, prefix: str, columns_to_join: Optional[List[str]] = None) -> List[str]:
+    """
+    Returns the attribute columns of one side of the pairs, all except the id unless `columns_to_join` are given.
+    """
+    if columns_to_join is None:
+        return [column for column in pairs_df.columns if column != prefix + 'id' and prefix in column]
+    return [prefix + column for column in columns_to_join]
+
+
+def serialize_records(records_df: pd.DataFrame, columns: List[str], fmt: str = PLAIN, separator: str = ' ',
+                      prefix: str = '') -> pd.Series:
+    """
+    Serializes every row of `records_df`, missing values are empty strings. In the tagged format, the attribute
+    names are the column names without the prefix.
+    """
+    if fmt not in FORMATS:
+        raise ValueError("Unknown serialization format {}, expected one of {}".format(fmt, FORMATS))
+    if not columns:
+        return pd.Series('', index=records_df.index, dtype=object)
+
+    parts = []
+    for column in columns:
+        values = records_df[column].fillna('').astype(str)
+        if fmt == TAGGED:
+            values = "COL {} VAL ".format(column.replace(prefix, '')) + values
+        parts.append(values)
+    return parts[0].str.cat(parts[1:], sep=separator) if len(parts) > 1 else parts[0]
+
+
+def serialize_pairs(pairs_df: pd.DataFrame, fmt: str = PLAIN, columns_to_join: Optional[List[str]] = None,
+                    separator: str = ' ', prefixes: List[str] = PREFIXES) -> Dict[str, pd.Series]:
+    """
+    Returns the serialized records of both sides of the pairs, as Series named `<prefix>AgValue` aligned with the pairs.
+    Pairs in the ids layout have to be loaded with their attributes.
+    """
+    serialized = {}
+    for prefix in prefixes:
+        columns = get_columns(pairs_df, prefix, columns_to_join)
+        ids = pairs_df[prefix + 'id']
+
+        # records with the same id have the same attributes
+        records_df = pairs_df.loc[~ids.duplicated().to_numpy(), [prefix + 'id'] + columns]
+        texts = serialize_records(records_df, columns, fmt, separator, prefix)
+        positions = pd.Index(records_df[prefix + 'id']).get_indexer(ids)
+        serialized[prefix] = pd.Series(texts.to_numpy()[positions], index=pairs_df.index, name=prefix + 'AgValue')
+    return serialized
@@ -0,0 +1,138 @@
+import os
+import json
+import shlex
+import subprocess
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# script of an array job, every task looks up its job directory and command in the manifest
+ARRAY_SCRIPT = """#!/bin/bash
+# {name}: task i runs the command in the line of the manifest with index i
+IFS=$'\\t' read -r index job_dir command < <(awk -F'\\t' -v i="$SLURM_ARRAY_TASK_ID" '$1 == i' {manifest})
+if [ -z "$job_dir" ]; then
+    echo "No task $SLURM_ARRAY_TASK_ID in {manifest}" >&2
+    exit 1
+fi
+
+exec > "$job_dir/{phase}.out" 2> "$job_dir/{phase}.err"
+eval "$command"
+"""
+
+
+class SlurmStatus:
+    """
+    Snapshot of `sacct --json` for a set of Slurm jobs.
+
+    All jobs are queried with a single `sacct` call, the parsed records are then used
+    both for the job states and for the accounting metrics of completed jobs.
+    Tasks of array jobs are addressed as `<array job id>_<task id>`.
+    """
+
+    def __init__(self, jobs: Dict[int, Dict[str, Any]] = None):
+        self.jobs = jobs or {}
+        self.tasks: Dict[str, Dict[str, Any]] = {}
+
+        for job in self.jobs.values():
+            array_job_id, task_ids = parse_array_tasks(job)
+            for task_id in task_ids:
+                task_ref = f"{array_job_id}_{task_id}"
+                # a task which already has its own record wins over the pending rest of the array
+                if task_ref not in self.tasks or _parse_number((self.tasks[task_ref].get("array") or {}).get("task_id")) is None:
+                    self.tasks[task_ref] = job
+
+    @classmethod
+    def query(cls, slurm_job_ids: Iterable[int | str]) -> "SlurmStatus":
+        # tasks are queried by their array job, sacct returns the records of all its tasks
+        ids = sorted({int(str(slurm_job_id).split("_")[0]) for slurm_job_id in slurm_job_ids if slurm_job_id})
+        if not ids:
+            return cls()
+
+        process = subprocess.run(["sacct", "-j", ",".join(str(i) for i in ids), "--json"], capture_output=True, text=True)
+        if process.returncode != 0:
+            raise RuntimeError(f"Error checking job status: {process.stderr}")
+        return cls.from_json(process.stdout)
+
+    @classmethod
+    def from_json(cls, sacct_json: str | Dict[str, Any]) -> "SlurmStatus":
+        data = json.loads(sacct_json) if isinstance(sacct_json, str) else sacct_json
+        return cls({int(job["job_id"]): job for job in data.get("jobs", []) if "job_id" in job})
+
+    def get_job(self, slurm_job_id: int | str) -> Optional[Dict[str, Any]]:
+        if not slurm_job_id:
+            return None
+        if isinstance(slurm_job_id, str) and "_" in slurm_job_id:
+            return self.tasks.get(slurm_job_id)
+        return self.jobs.get(int(slurm_job_id))
+
+    def get_state(self, slurm_job_id: int | str) -> Optional[str]:
+        job = self.get_job(slurm_job_id)
+        if job is None:
+            return None
+        return parse_job_state(job)
+
+
+def parse_job_state(job: Dict[str, Any]) -> Optional[str]:
+    # Slurm < 23.02 reports the state as a string, newer versions as a list of flags
+    state = job.get("state", {})
+    if isinstance(state, dict):
+        state = state.get("current")
+    if isinstance(state, list):
+        state = state[0] if state else None
+    return state
+
+
+def parse_array_tasks(job: Dict[str, Any]) -> Tuple[Optional[int], List[int]]:
+    """
+    Returns the array job ID and the task IDs covered by a sacct record, which is either a single task
+    or the not yet started rest of the array (e.g. `task_string: "3-9,12"`).
+    """
+    array = job.get("array") or {}
+    array_job_id = _parse_number(array.get("job_id"))
+    if not array_job_id:
+        return None, []
+
+    task_id = _parse_number(array.get("task_id"))
+    if task_id is not None:
+        return array_job_id, [task_id]
+
+    task_ids = []
+    task_string = array.get("task_string") or array.get("task") or ""
+    # e.g. "0-99%10", the limit of simultaneously running tasks doesn't matter here
+    for part in task_string.split("%")[0].split(","):
+        if "-" in part:
+            # e.g. "0-15:4" for every fourth task
+            start, end = part.split("-", 1)
+            end, step = end.split(":", 1) if ":" in end else (end, 1)
+            task_ids.extend(range(int(start), int(end) + 1, int(step)))
+        elif part.strip():
+            task_ids.append(int(part))
+    return array_job_id, task_ids
+
+
+def _parse_number(value: Any) -> Optional[int]:
+    # newer Slurm versions wrap numbers as {"set": true, "infinite": false, "number": 3}
+    if isinstance(value, dict):
+        return value.get("number") if value.get("set", True) else None
+    return value
+
+
+def write_array_job(array_dir: str, phase: str, tasks: List[Tuple[str, str]]) -> str:
+    """
+    Writes the manifest of an array job (one line `index, job directory, command` per task) and its batch script.
+    The output of every task goes to `<phase>.out`/`<phase>.err` in its job directory, like for single jobs.
+    Returns the path of the batch script.
+    """
+    os.makedirs(array_dir, exist_ok=True)
+    manifest_path = os.path.join(array_dir, f"{phase}.tsv")
+    script_path = os.path.join(array_dir, f"{phase}.sh")
+
+    with open(manifest_path, "w") as f:
+        for index, (job_dir, command) in enumerate(tasks):
+            if "\t" in job_dir or "\t" in command or "\n" in command:
+                raise ValueError(f"Task {index} can't be written to the manifest: {command}")
+            f.write(f"{index}\t{job_dir}\t{command}\n")
+
+    with open(script_path, "w") as f:
+        f.write(ARRAY_SCRIPT.format(name=os.path.basename(array_dir), phase=phase, manifest=shlex.quote(manifest_path)))
+    os.chmod(script_path, 0o755)
+
+    return script_path
@@ -0,0 +1,108 @@
+"""
+Shared core of the splitters: pair encoding, labelling of candidates, statistics and splitting.
+"""
+from typing import List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import train_test_split
+
+from .tables import read_table, write_table
+
+
+def stringify_attributes(table_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts all attributes except the id to strings without tabs, in place.
+    """
+    for col in table_df.columns:
+        if col == 'id':
+            continue
+        table_df[col] = table_df[col].astype(str).str.replace('\t', ' ')
+    return table_df
+
+
+def filter_matches(matches_df: pd.DataFrame, tableA_df: pd.DataFrame, tableB_df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Removes those pairs from matches, which entries no longer appear in tableA or tableB.
+    """
+    A_match_exists = matches_df['tableA_id'].isin(tableA_df['id'])
+    B_match_exists = matches_df['tableB_id'].isin(tableB_df['id'])
+    return matches_df[A_match_exists & B_match_exists]
+
+
+def encode_pairs(a_ids, b_ids, a_index: pd.Index, b_index: pd.Index) -> np.ndarray:
+    """
+    Encodes pairs of IDs as int64 keys `a_pos * len(b_index) + b_pos`, with the positions of the IDs in the indexes.
+    IDs which are not in the index get a negative key.
+    """
+    a_pos = a_index.get_indexer(a_ids).astype(np.int64)
+    b_pos = b_index.get_indexer(b_ids).astype(np.int64)
+    keys = a_pos * len(b_index) + b_pos
+    keys[(a_pos < 0) | (b_pos < 0)] = -1
+    return keys
+
+
+def label_pairs(pairs_df: pd.DataFrame, matches_df: pd.DataFrame) -> np.ndarray:
+    """
+    Returns 1 for every pair (tableA_id, tableB_id) which is a match, 0 otherwise.
+    """
+    a_index = pd.Index(pd.unique(np.concatenate([pairs_df['tableA_id'].to_numpy(), matches_df['tableA_id'].to_numpy()])))
+    b_index = pd.Index(pd.unique(np.concatenate([pairs_df['tableB_id'].to_numpy(), matches_df['tableB_id'].to_numpy()])))
+    pair_keys = encode_pairs(pairs_df['tableA_id'], pairs_df['tableB_id'], a_index, b_index)
+    match_keys = encode_pairs(matches_df['tableA_id'], matches_df['tableB_id'], a_index, b_index)
+    return np.isin(pair_keys, match_keys).astype(int)
+
+
+def compute_stats(tp: int, num_candidates: int, num_matches: int) -> List[float]:
+    """
+    Returns [f1, precision, recall, number of candidates] of a candidate set with `tp` matches.
+    """
+    tp = int(tp)
+    p = tp / num_candidates if num_candidates else 0.0
+    r = tp / num_matches if num_matches else 0.0
+    f1 = 2 * p * r / (p + r) if p + r else 0.0
+    return [f1, p, r, num_candidates]
+
+
+def split_candidates(candidates: pd.DataFrame, seed: int, valid: bool = True) -> Union[Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame], Tuple[pd.DataFrame, pd.DataFrame]]:
+    """
+    Splits the candidates stratified by label into train/valid/test (60/20/20) or train/test (75/25).
+    """
+    if valid:
+        train, test_valid = train_test_split(candidates, train_size=0.6, random_state=seed, shuffle=True,
+                                             stratify=candidates['label'])
+        valid, test = train_test_split(test_valid, train_size=0.5, random_state=seed, shuffle=True,
+                                       stratify=test_valid['label'])
+        return train, valid, test
+    return tuple(train_test_split(candidates, train_size=0.75, random_state=seed, shuffle=True,
+                                  stratify=candidates['label']))
+
+
+def read_dataset(directory: str) -> Tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Reads tableA, tableB (indexed by their id) and matches of a dataset.
+    """
+    tableA_df = read_table(directory, 'tableA')
+    tableB_df = read_table(directory, 'tableB')
+    matches_df = read_table(directory, 'matches')
+    return tableA_df.set_index('id', drop=False), tableB_df.set_index('id', drop=False), matches_df
+
+
+def write_dataset(output: str, tableA_df: pd.DataFrame, tableB_df: pd.DataFrame, matches_df: pd.DataFrame) -> None:
+    write_table(tableA_df, output, 'tableA')
+    write_table(tableB_df, output, 'tableB')
+    write_table(matches_df, output, 'matches')
+
+
+def write_filtering_metrics(output: str, stats: List[float], filtering_time: float,
+                            tableA_df: pd.DataFrame, tableB_df: pd.DataFrame, matches_df: pd.DataFrame) -> None:
+    write_table(pd.DataFrame({
+        'f1': [stats[0]],
+        'precision': [stats[1]],
+        'recall': [stats[2]],
+        'filtering_time': [filtering_time],
+        'num_candidates': [stats[3]],
+        'entries_tableA': [tableA_df.shape[0]],
+        'entries_tableB': [tableB_df.shape[0]],
+        'entries_matches': [matches_df.shape[0]],
+    }), output, 'filtering_metrics')
@@ -0,0 +1,216 @@
+"""
+Reading and writing of the tables exchanged between the pipeline stages (pairs, tables, predictions and metrics).
+
+Tables are written as CSV, Parquet or Arrow IPC depending on `ERBENCH_FORMAT` (default csv) and read in whichever
+format exists, so stages built before the switch keep working. Parquet and Arrow are read memory-mapped and with
+multiple threads, they need pyarrow, which is only imported when one of them is used.
+pandas is only imported by the functions returning DataFrames, the manager reads rows with `iter_rows`.
+"""
+import os
+import csv
+from typing import Any, Dict, Iterator, List, Optional
+
+FORMAT_ENV = "ERBENCH_FORMAT"
+CSV = "csv"
+PARQUET = "parquet"
+ARROW = "arrow"
+EXTENSIONS = {CSV: ".csv", PARQUET: ".parquet", ARROW: ".arrow"}
+FORMATS = list(EXTENSIONS)
+
+# strings which pd.read_csv reads as missing values by default, Parquet and Arrow tables store them as nulls
+# so that a table reads back the same in every format (e.g. the "nan" of attributes converted with astype(str))
+NA_STRINGS = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+              "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+
+def get_format() -> str:
+    fmt = os.getenv(FORMAT_ENV, CSV).lower()
+    if fmt not in FORMATS:
+        raise ValueError("{} must be one of {}, not {}".format(FORMAT_ENV, FORMATS, fmt))
+    return fmt
+
+
+def get_path(directory: str, name: str, fmt: Optional[str] = None) -> str:
+    return os.path.join(str(directory), name + EXTENSIONS[fmt or get_format()])
+
+
+def find_table(directory: str, name: str) -> Optional[str]:
+    """
+    Returns the path of the table `name` in `directory`, preferring the configured format, or None if there is none.
+    """
+    preferred = get_format()
+    for fmt in [preferred] + [fmt for fmt in FORMATS if fmt != preferred]:
+        path = get_path(directory, name, fmt)
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def get_table_format(path: str) -> str:
+    extension = os.path.splitext(path)[1]
+    for fmt, ext in EXTENSIONS.items():
+        if ext == extension:
+            return fmt
+    raise ValueError("Unknown table format of {}".format(path))
+
+
+def read_table(directory: str, name: str, **csv_args):
+    """
+    Reads the table `name` from `directory` into a DataFrame, `csv_args` are passed on to `pd.read_csv`.
+    """
+    import pandas as pd
+
+    path = find_table(directory, name)
+    if path is None:
+        raise FileNotFoundError("{} does not exist".format(get_path(directory, name)))
+
+    fmt = get_table_format(path)
+    if fmt == CSV:
+        csv_args.setdefault('encoding_errors', 'replace')
+        return pd.read_csv(path, **csv_args)
+
+    pa, pq = _import_pyarrow()
+    if fmt == PARQUET:
+        table = pq.read_table(path, memory_map=True, use_threads=True)
+    else:
+        with pa.memory_map(path, 'r') as source:
+            table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(use_threads=True)
+
+
+def write_table(df, directory: str, name: str, fmt: Optional[str] = None) -> str:
+    """
+    Writes the DataFrame `df` (without its index) as table `name` and removes the table in other formats.
+    """
+    with TableWriter(directory, name, fmt) as writer:
+        writer.write(df)
+    return writer.path
+
+
+class TableWriter:
+    """
+    Writes a table from a sequence of DataFrames with the same columns, e.g. to stream pairs into a split file.
+    Parquet and Arrow tables get the schema of the first DataFrame, the others are converted to it.
+    """
+
+    def __init__(self, directory: str, name: str, fmt: Optional[str] = None):
+        self.format = fmt or get_format()
+        self.path = get_path(directory, name, self.format)
+        self._writer = None
+        self._sink = None
+        self._schema = None
+        self._empty = True
+
+        # an older table in another format would be found by find_table
+        for other in FORMATS:
+            other_path = get_path(directory, name, other)
+            if other != self.format and os.path.isfile(other_path):
+                os.remove(other_path)
+
+    def write(self, df):
+        if self.format == CSV:
+            df.to_csv(self.path, index=False, mode='w' if self._empty else 'a', header=self._empty)
+            self._empty = False
+            return
+
+        pa, pq = _import_pyarrow()
+        table = _to_arrow(pa, _nullify_na_strings(df), self._schema)
+        if self._schema is None:
+            # the schema is fixed by the first DataFrame, columns which are null in all of its rows are strings
+            self._schema = _promote_null_fields(pa, table.schema)
+            table = table.cast(self._schema)
+            if self.format == PARQUET:
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                self._sink = pa.OSFile(self.path, 'wb')
+                self._writer = pa.ipc.new_file(self._sink, self._schema)
+        self._writer.write_table(table)
+        self._empty = False
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+        self._writer = self._sink = None
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def iter_rows(path: str, batch_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Reads a table lazily and yields lists of at most `batch_size` rows as dicts, without pandas.
+    Values of CSV tables are strings, those of Parquet and Arrow tables are typed.
+    """
+    fmt = get_table_format(path)
+    if fmt == CSV:
+        with open(path, 'r') as f:
+            chunk = []
+            for row in csv.DictReader(f):
+                chunk.append(row)
+                if len(chunk) >= batch_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+        return
+
+    pa, pq = _import_pyarrow()
+    if fmt == PARQUET:
+        for batch in pq.ParquetFile(path, memory_map=True).iter_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+    else:
+        with pa.memory_map(path, 'r') as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                batch = reader.get_batch(i)
+                for offset in range(0, batch.num_rows, batch_size):
+                    yield batch.slice(offset, batch_size).to_pylist()
+
+
+def read_first_row(path: str) -> Dict[str, Any]:
+    for chunk in iter_rows(path, batch_size=1):
+        return chunk[0]
+    raise ValueError("{} is empty".format(path))
+
+
+def _nullify_na_strings(df):
+    columns = [col for col in df.columns if df[col].dtype == object]
+    if not columns:
+        return df
+    df = df.copy()
+    for col in columns:
+        df[col] = df[col].mask(df[col].isin(NA_STRINGS), None)
+    return df
+
+
+def _to_arrow(pa, df, schema=None):
+    try:
+        return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # object columns with mixed types (e.g. numbers and strings) are stored as strings
+        df = df.copy()
+        for col in df.columns:
+            if df[col].dtype == object:
+                df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+        return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+def _promote_null_fields(pa, schema):
+    return pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field for field in schema],
+                     metadata=schema.metadata)
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc  # noqa: F401
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("pyarrow is required to read and write Parquet or Arrow tables, "
+                          "install it or set {}=csv".format(FORMAT_ENV))
+    return pa, pq
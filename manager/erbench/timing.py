@@ -0,0 +1,152 @@
+"""
+Timing and resource measurements of the phases of a splitter or matcher, shared by all containers.
+
+    timer = PhaseTimer()
+    with timer.phase("train"):
+        model.train()
+    timer.write(output_dir)
+"""
+import os
+import sys
+import csv
+import time
+import resource
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+
+PHASES_FILE = "phases.csv"
+FILTERING_PHASES_FILE = "filtering_phases.csv"
+PHASE_COLUMNS = ["phase", "wall_time", "cpu_time", "peak_rss", "peak_cuda_memory"]
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+class PhaseTimer:
+    """
+    Records wall time, CPU time (of all threads and child processes), peak RSS and peak CUDA memory per named phase.
+
+    The RSS is sampled by a background thread every `sample_interval` seconds. If the peak RSS of the process
+    increased during a phase, that peak is exact. CUDA memory is only recorded if torch was already imported.
+    """
+
+    def __init__(self, sample_interval: float = 0.05):
+        self.sample_interval = sample_interval
+        self.phases = []  # type: List[Dict[str, object]]
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[Dict[str, object]]:
+        cuda = _get_cuda()
+        if cuda is not None:
+            cuda.synchronize()
+            cuda.reset_peak_memory_stats()
+
+        sampler = _RssSampler(self.sample_interval)
+        sampler.start()
+        max_rss_before = _max_rss()
+        cpu_before = _cpu_time()
+        start = time.perf_counter()
+
+        record = {"phase": name}  # type: Dict[str, object]
+        try:
+            yield record
+        finally:
+            if cuda is not None:
+                # kernels run asynchronously, wait for them to be part of this phase
+                cuda.synchronize()
+
+            record["wall_time"] = time.perf_counter() - start
+            record["cpu_time"] = _cpu_time() - cpu_before
+            peak_rss = sampler.stop()
+            max_rss_after = _max_rss()
+            if max_rss_after > max_rss_before:
+                peak_rss = max(peak_rss, max_rss_after)
+            record["peak_rss"] = peak_rss
+            record["peak_cuda_memory"] = cuda.max_memory_allocated() if cuda is not None else None
+            self.phases.append(record)
+
+    def wall_time(self, *names: str) -> float:
+        """
+        Returns the total wall time of the given phases, in seconds.
+        """
+        return sum(phase["wall_time"] for phase in self.phases if phase["phase"] in names)
+
+    def write(self, directory: str, filename: str = PHASES_FILE) -> str:
+        path = os.path.join(directory, filename)
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=PHASE_COLUMNS)
+            writer.writeheader()
+            for phase in self.phases:
+                writer.writerow({column: _format(phase.get(column)) for column in PHASE_COLUMNS})
+        return path
+
+
+def read_phases(path: str) -> Optional[List[Dict[str, object]]]:
+    """
+    Reads a phases.csv, times are returned in seconds, memory in bytes.
+    """
+    if not os.path.exists(path):
+        return None
+
+    phases = []
+    with open(path, "r") as f:
+        for row in csv.DictReader(f):
+            phase = {"phase": row["phase"]}  # type: Dict[str, object]
+            for column in ["wall_time", "cpu_time"]:
+                phase[column] = float(row[column]) if row.get(column) else None
+            for column in ["peak_rss", "peak_cuda_memory"]:
+                phase[column] = int(row[column]) if row.get(column) else None
+            phases.append(phase)
+    return phases
+
+
+class _RssSampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="erbench-rss-sampler", daemon=True)
+        self.interval = interval
+        self.peak = _current_rss()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, _current_rss())
+
+    def stop(self) -> int:
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, _current_rss())
+        return self.peak
+
+
+def _current_rss() -> int:
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return _max_rss()
+
+
+def _max_rss() -> int:
+    # in KB on Linux, in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _cpu_time() -> float:
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time() + children.ru_utime + children.ru_stime
+
+
+def _get_cuda():
+    torch = sys.modules.get("torch")
+    if torch is None or not torch.cuda.is_available():
+        return None
+    return torch.cuda
+
+
+def _format(value: object) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return "{:.6f}".format(value)
+    return str(value)
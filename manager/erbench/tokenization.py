@@ -0,0 +1,122 @@
+"""
+Tokenization of serialized pairs for the transformer-based matchers, cached across runs.
+
+The pairs are tokenized with the fast (Rust) tokenizer of the model, in batches and by a process pool with
+`SLURM_CPUS_PER_TASK` processes for large sets. The results are int32 arrays of `input_ids`, `attention_mask` and
+`token_type_ids`, padded to `max_len`. With `ERBENCH_CACHE_DIR` set, they are stored in `ERBENCH_CACHE_DIR/tokenization`
+as memory-mapped `.npy` files, keyed by the content of the pairs, the tokenizer, `max_len` and the serialization format,
+so runs which only differ in the seed, the epochs or the learning rate skip the tokenization.
+"""
+import os
+from multiprocessing import Pool
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from .artifacts import get_cache_dir, hash_series, load_array, make_key, store_array
+from .cleaning import get_num_processes
+
+CACHE_VERSION = "1"  # increase when the tokenization changes
+FIELDS = ["input_ids", "attention_mask", "token_type_ids"]
+BATCH_SIZE = 1000
+MIN_PARALLEL_PAIRS = 20000  # fewer pairs are tokenized in this process, loading the tokenizer per process costs more
+
+_tokenizer = None
+_max_len = None
+
+
+def load_tokenizer(name: str, **kwargs):
+    from transformers import AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(name, use_fast=True, **kwargs)
+    if not tokenizer.is_fast:
+        print("Warning: No fast tokenizer for {}, tokenizing with the Python tokenizer".format(name))
+    return tokenizer
+
+
+def tokenize_pairs(tokenizer_name: str, lefts: Sequence[str], rights: Sequence[str], max_len: int, fmt: str,
+                   processes: Optional[int] = None, **tokenizer_kwargs) -> Dict[str, np.ndarray]:
+    """
+    Returns the encodings of the pairs (`lefts[i]`, `rights[i]`), truncated longest first to `max_len` tokens, like
+    `tokenizer(left, right, max_length=max_len, truncation=True, padding='max_length')`.
+    """
+    pairs_df = pd.DataFrame({"left": list(lefts), "right": list(rights)})
+    paths = _get_cache_paths(pairs_df, tokenizer_name, tokenizer_kwargs, max_len, fmt)
+    if paths is not None:
+        arrays = {field: load_array(path) for field, path in paths.items()}
+        if all(array is not None for array in arrays.values()):
+            print("Using tokenized pairs from cache", paths["input_ids"])
+            return arrays
+
+    arrays = _tokenize(tokenizer_name, tokenizer_kwargs, pairs_df, max_len, processes)
+    print("Tokenized {} pairs with {}".format(len(pairs_df), tokenizer_name))
+    if paths is not None:
+        for field, path in paths.items():
+            store_array(path, arrays[field])
+    return arrays
+
+
+def get_lengths(arrays: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Returns the number of tokens (without padding) of every pair.
+    """
+    return np.asarray(arrays["attention_mask"]).sum(axis=1)
+
+
+def unpad(arrays: Dict[str, np.ndarray], i: int, field: str = "input_ids") -> List[int]:
+    """
+    Returns the tokens of pair `i` without padding, like `tokenizer.encode(left, right, truncation=True)`.
+    """
+    mask = np.asarray(arrays["attention_mask"][i], dtype=bool)
+    return np.asarray(arrays[field][i])[mask].tolist()
+
+
+def _get_cache_paths(pairs_df: pd.DataFrame, tokenizer_name: str, tokenizer_kwargs: dict, max_len: int,
+                     fmt: str) -> Optional[Dict[str, str]]:
+    cache_dir = get_cache_dir("tokenization")
+    if cache_dir is None:
+        return None
+    key = make_key("tokenization", CACHE_VERSION, tokenizer_name, sorted(tokenizer_kwargs.items()), max_len, fmt,
+                   hash_series(pairs_df))
+    return {field: os.path.join(cache_dir, "{}.{}.npy".format(key, field)) for field in FIELDS}
+
+
+def _tokenize(tokenizer_name: str, tokenizer_kwargs: dict, pairs_df: pd.DataFrame, max_len: int,
+              processes: Optional[int]) -> Dict[str, np.ndarray]:
+    lefts = pairs_df["left"].fillna("").astype(str).tolist()
+    rights = pairs_df["right"].fillna("").astype(str).tolist()
+    batches = [(lefts[i:i + BATCH_SIZE], rights[i:i + BATCH_SIZE]) for i in range(0, len(lefts), BATCH_SIZE)]
+
+    processes = processes or get_num_processes()
+    if processes <= 1 or len(lefts) < MIN_PARALLEL_PAIRS:
+        _init_tokenizer(tokenizer_name, tokenizer_kwargs, max_len)
+        encoded = [_tokenize_batch(batch) for batch in batches]
+    else:
+        with Pool(processes, initializer=_init_worker, initargs=(tokenizer_name, tokenizer_kwargs, max_len)) as pool:
+            encoded = list(pool.imap(_tokenize_batch, batches))
+
+    arrays = {}
+    for field in FIELDS:
+        parts = [batch[field] for batch in encoded]
+        arrays[field] = np.concatenate(parts) if parts else np.zeros((0, max_len), dtype=np.int32)
+    return arrays
+
+
+def _init_worker(tokenizer_name: str, tokenizer_kwargs: dict, max_len: int) -> None:
+    # the batches are already split across the processes
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    _init_tokenizer(tokenizer_name, tokenizer_kwargs, max_len)
+
+
+def _init_tokenizer(tokenizer_name: str, tokenizer_kwargs: dict, max_len: int) -> None:
+    global _tokenizer, _max_len
+    _tokenizer = load_tokenizer(tokenizer_name, **tokenizer_kwargs)
+    _max_len = max_len
+
+
+def _tokenize_batch(batch) -> Dict[str, np.ndarray]:
+    lefts, rights = batch
+    encoded = _tokenizer(lefts, rights, max_length=_max_len, truncation=True, padding="max_length",
+                         return_attention_mask=True, return_token_type_ids=True)
+    return {field: np.asarray(encoded[field], dtype=np.int32) for field in FIELDS}
@@ -1,17 +1,25 @@
 import argparse
+import json
 import os
+import shlex
 import shutil
+import uuid
 import pathtype
-import subprocess
 import smtplib
+import threading
 from email.message import EmailMessage
 from dotenv import load_dotenv
 from datetime import datetime
 
 load_dotenv()
 
-from erbench.client import ErbenchClient, JobStatus, Job
-from erbench.importer import import_results, import_slurm_metrics, import_predictions, import_filtering_results
+from erbench.client import ErbenchClient, JobStatus, Job, Metrics
+from erbench.daemon import JobDaemon
+from erbench.slurm import SlurmStatus
+from erbench.scheduler import LocalScheduler, Scheduler, SlurmScheduler, render_params
+from erbench.cache import ResultCache, SplitCache, make_cache_key
+from erbench.importer import import_results, import_slurm_metrics, iter_predictions, import_filtering_results
+from erbench.tables import find_table
 
 ERBENCH_URL = os.getenv("API_BASE_URL", "https://smbench.kbs.uni-hannover.de")
 DATASETS_DIR = os.getenv("DATASETS_DIR", "../datasets")
@@ -20,9 +28,50 @@ EMBEDDINGS_DIR = os.getenv("EMBEDDINGS_DIR", "../embeddings")
 TEMP_DIR = os.getenv("TEMP_DIR", "../running_jobs")
 SLURM_JOB_ARGS = os.getenv("SLURM_JOB_ARGS", "")
 HF_HOME = os.getenv("HF_HOME")
-
-# loads configuration from .env file
-erbench_client = ErbenchClient()
+POLL_INTERVAL = float(os.getenv("POLL_INTERVAL", 10))
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", 4))
+PREDICTIONS_CHUNK_SIZE = int(os.getenv("PREDICTIONS_CHUNK_SIZE", 10000))
+PREDICTIONS_UPLOAD_WORKERS = int(os.getenv("PREDICTIONS_UPLOAD_WORKERS", 4))
+SPLIT_CACHE_DIR = os.getenv("SPLIT_CACHE_DIR")
+SPLIT_CACHE_MAX_SIZE = float(os.getenv("SPLIT_CACHE_MAX_SIZE", 50))  # in GB
+SPLIT_CACHE_MODE = os.getenv("SPLIT_CACHE_MODE", "hardlink")
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR")
+RESULT_CACHE_MAX_SIZE = float(os.getenv("RESULT_CACHE_MAX_SIZE", 20))  # in GB
+ARRAY_MIN_JOBS = int(os.getenv("ARRAY_MIN_JOBS", 2))  # 0 disables job arrays
+ARRAY_MAX_SIZE = int(os.getenv("ARRAY_MAX_SIZE", 1000))  # should not exceed MaxArraySize of the cluster
+SCHEDULER = os.getenv("SCHEDULER", "slurm")  # slurm or local
+LOCAL_ALGORITHMS = [code for code in os.getenv("LOCAL_ALGORITHMS", "").split(",") if code]  # run locally even with SCHEDULER=slurm
+LOCAL_CPUS = int(os.getenv("LOCAL_CPUS", 0))  # 0 uses all CPUs
+LOCAL_MEMORY = float(os.getenv("LOCAL_MEMORY", 0))  # in GB, 0 uses all memory
+LOCAL_JOB_CPUS = int(os.getenv("LOCAL_JOB_CPUS", 1))
+LOCAL_JOB_MEMORY = float(os.getenv("LOCAL_JOB_MEMORY", 4))  # in GB
+LOCAL_PYTHON = os.getenv("LOCAL_PYTHON")  # runs the local jobs with this interpreter instead of apptainer
+SOURCES_DIR = os.getenv("SOURCES_DIR", "..")
+ERBENCH_CACHE_DIR = os.getenv("ERBENCH_CACHE_DIR")  # intermediate results of the containers, e.g. cleaned tables
+MAX_RESUMES = int(os.getenv("MAX_RESUMES", 3))  # resubmissions of a matching job after a timeout or preemption
+
+# Slurm IDs of the tasks of a job, which was submitted as part of a job array
+SLURM_TASKS_FILE = "slurm_tasks.json"
+# name of the scheduler backend, to which a job was submitted
+SCHEDULER_FILE = "scheduler"
+# number of times the matching job was resubmitted to resume from its checkpoint
+RESUMES_FILE = "resumes"
+# Slurm states of jobs which were stopped from outside and can continue from their last checkpoint
+RESUMABLE_STATES = ["TIMEOUT", "PREEMPTED"]
+
+# loads configuration from .env file, jobs may be handled concurrently by the daemon
+erbench_client = ErbenchClient(thread_safe=True)
+split_cache = SplitCache(SPLIT_CACHE_DIR, int(SPLIT_CACHE_MAX_SIZE * 1024**3), SPLIT_CACHE_MODE) if SPLIT_CACHE_DIR else None
+result_cache = ResultCache(RESULT_CACHE_DIR, int(RESULT_CACHE_MAX_SIZE * 1024**3)) if RESULT_CACHE_DIR else None
+slurm_scheduler = SlurmScheduler(SLURM_JOB_ARGS, f"ALL,TRANSFORMERS_CACHE={HF_HOME},HF_HOME={HF_HOME}" if HF_HOME else None)
+local_scheduler: LocalScheduler | None = None
+local_scheduler_lock = threading.Lock()
+
+if ERBENCH_CACHE_DIR:
+    # the jobs run in their own directories and inherit the environment, so they need the absolute path
+    ERBENCH_CACHE_DIR = os.path.abspath(ERBENCH_CACHE_DIR)
+    os.makedirs(ERBENCH_CACHE_DIR, exist_ok=True)
+    os.environ["ERBENCH_CACHE_DIR"] = ERBENCH_CACHE_DIR
 
 
 def is_gpu_required(algoCode: str) -> bool:
@@ -31,28 +80,28 @@ def is_gpu_required(algoCode: str) -> bool:
     return True
 
 
-def is_embeddings_required(algoCode: str) -> bool:
-    if algoCode in ["deepmatcher", "hiermatcher", "splitter_deepblocker"]:
+def is_seed_required(algoCode: str) -> bool:
+    # algorithms without a seed parameter are deterministic
+    if algoCode in ["zeroer"]:
+        return False
+    return True
+
+
+def is_resume_supported(algoCode: str) -> bool:
+    # these matchers checkpoint every epoch in the job directory and accept --resume,
+    # gnem only checkpoints a finished training, a resubmitted job would start over
+    if algoCode in ["ditto", "emtransformer", "deepmatcher"]:
         return True
     return False
 
 
-def render_params(params: dict) -> str:
-    result = []
-    for key, value in params.items():
-        if value is None or value is False:
-            continue
-        elif value is True:
-            result.append(f"--{key}")
-        elif isinstance(value, str) and " " in value:
-            result.append(f'--{key}="{value}"')
-        else:
-            result.append(f"--{key}={value}")
-
-    return " ".join(result)
+def is_embeddings_required(algoCode: str) -> bool:
+    if algoCode in ["deepmatcher", "hiermatcher", "splitter_deepblocker"]:
+        return True
+    return False
 
 
-def import_filtering_job(job_id: str, input_dir: any, slurm_job_id: int = None):
+def import_filtering_job(job_id: str, input_dir: any, slurm_job_id: int | str = None):
     print(f"Importing filtering results from {input_dir}")
     results = import_filtering_results(input_dir)
     if not results:
@@ -62,18 +111,18 @@ def import_filtering_job(job_id: str, input_dir: any, slurm_job_id: int = None):
     print("Filtering results uploaded successfully")
 
 
-def import_job(job_id: str, input_dir: any, slurm_job_id: int = None):
+def import_job(job_id: str, input_dir: any, slurm_job_id: int | str = None, slurm_status: SlurmStatus = None) -> Metrics:
     print(f"Importing results from {input_dir}")
 
-    slurm_job_str = None
+    slurm_job = None
     if slurm_job_id:
         try:
-            print(f"Retrieving Slurm metrics for job {slurm_job_id}")
-            process = subprocess.run(["sacct", "-j", str(slurm_job_id), "--json"], capture_output=True, text=True)
-            if process.returncode == 0:
-                slurm_job_str = process.stdout.replace("\n", "").strip()
-            else:
-                print(f"Warning: Failed to retrieve Slurm metrics: {process.stderr}")
+            if slurm_status is None:
+                print(f"Retrieving Slurm metrics for job {slurm_job_id}")
+                slurm_status = SlurmStatus.query([slurm_job_id])
+            slurm_job = slurm_status.get_job(slurm_job_id)
+            if slurm_job is None:
+                print(f"Warning: Failed to retrieve Slurm metrics for job {slurm_job_id}")
         except Exception as e:
             print(f"Warning: Error retrieving Slurm metrics: {str(e)}")
 
@@ -81,19 +130,23 @@ def import_job(job_id: str, input_dir: any, slurm_job_id: int = None):
     if not results:
         raise RuntimeError(f"Error importing results for job {job_id}")
 
-    if slurm_job_str:
-        results = import_slurm_metrics(slurm_job_str, results)
+    if slurm_job:
+        results = import_slurm_metrics({"jobs": [slurm_job]}, results)
         print("Slurm metrics retrieved successfully")
 
     erbench_client.send_results(job_id, JobStatus.COMPLETED, results)
     print("Results upload completed successfully")
 
-    predictions = import_predictions(input_dir)
-    if not predictions:
-        raise RuntimeError(f"Error importing predictions for job {job_id}")
+    try:
+        chunks = iter_predictions(input_dir, PREDICTIONS_CHUNK_SIZE)
+        num_predictions = erbench_client.upload_predictions(job_id, chunks, max_workers=PREDICTIONS_UPLOAD_WORKERS)
+    except Exception as e:
+        raise RuntimeError(f"Error importing predictions for job {job_id}: {str(e)}")
 
-    erbench_client.send_predictions(job_id, predictions)
-    print("Predictions upload completed successfully")
+    if not num_predictions:
+        raise RuntimeError(f"Error importing predictions for job {job_id}")
+    print(f"Predictions upload completed successfully ({num_predictions} predictions)")
+    return results
 
 
 def send_email_notification(job_id: str, notify_email: str):
@@ -124,7 +177,81 @@ def get_job_directory(job_id: str) -> str:
     return os.path.join(TEMP_DIR, job_id)
 
 
-def start_job(job: Job):
+def get_split_cache_key_parts(job: Job) -> tuple | None:
+    # without an explicit seed, the splitter draws a random one, and the split can't be reused
+    if not job["filteringParams"] or job["filteringParams"].get("seed") is None:
+        return None
+
+    return job["dataset"]["hash"], job["filteringAlgo"]["code"], render_params(job["filteringParams"]), job["filteringParams"]["seed"]
+
+
+def get_split_cache_key(job: Job) -> str | None:
+    parts = get_split_cache_key_parts(job)
+    if split_cache is None or parts is None:
+        return None
+
+    return make_cache_key(*parts)
+
+
+def store_split(job: Job, job_dir: str):
+    split_key = get_split_cache_key(job)
+    if split_key and split_cache.store(split_key, job_dir):
+        print(f"Split of job {job['id']} stored in cache as {split_key}")
+
+
+def get_result_cache_key(job: Job) -> str | None:
+    # the result of a job is only reproducible, if the seeds of both the splitter and the matcher are fixed
+    split_parts = get_split_cache_key_parts(job)
+    matching_params = job["matchingParams"] or {}
+    if result_cache is None or split_parts is None:
+        return None
+    if is_seed_required(job["matchingAlgo"]["code"]) and matching_params.get("seed") is None:
+        return None
+
+    return make_cache_key(*split_parts, job["matchingAlgo"]["code"], render_params(matching_params))
+
+
+def store_result(job: Job, job_dir: str, results: Metrics):
+    # the job is already completed, a failure to cache its result must not fail it
+    try:
+        result_key = get_result_cache_key(job)
+        if result_key and result_cache.store(result_key, job["id"], results, job_dir):
+            print(f"Result of job {job['id']} stored in cache as {result_key}")
+    except Exception as e:
+        print(f"Warning: Failed to store result of job {job['id']} in cache: {str(e)}")
+
+
+def complete_cached_job(job: Job) -> bool:
+    """
+    Completes a job with the stored result of an identical job, without submitting anything to Slurm.
+    Returns whether the job was handled.
+    """
+    result_key = get_result_cache_key(job)
+    cached = result_cache.get(result_key) if result_key else None
+    if cached is None:
+        return False
+
+    source_job_id, results, entry_dir = cached
+    print(f"Job {job['id']} is identical to job {source_job_id}, completing it with the cached result {result_key}")
+    try:
+        if find_table(entry_dir, "filtering_metrics") is not None:
+            results = import_filtering_results(entry_dir, results) or results
+        erbench_client.send_results(job["id"], JobStatus.COMPLETED, results)
+        chunks = iter_predictions(entry_dir, PREDICTIONS_CHUNK_SIZE)
+        num_predictions = erbench_client.upload_predictions(job["id"], chunks, max_workers=PREDICTIONS_UPLOAD_WORKERS)
+        print(f"Cached results uploaded successfully ({num_predictions} predictions)")
+    except Exception as e:
+        erbench_client.update_job(job["id"], JobStatus.FAILED)
+        print(f"Error uploading cached results: {str(e)}")
+        return True
+
+    if job["notifyEmail"] and len(job["notifyEmail"]) > 0:
+        print(f"Sending email notification to {job['notifyEmail']}")
+        send_email_notification(job["id"], job["notifyEmail"])
+    return True
+
+
+def get_job_paths(job: Job) -> tuple[str, str, str]:
     dataset_path = os.path.join(DATASETS_DIR, job["dataset"]["code"])
     if not os.path.exists(dataset_path):
         raise RuntimeError(f"Dataset directory {dataset_path} does not exist")
@@ -137,99 +264,271 @@ def start_job(job: Job):
     if not os.path.exists(matching_container):
         raise RuntimeError(f"Error: Matching algorithm container {matching_container} does not exist, skipping job")
 
+    return dataset_path, filtering_container, matching_container
+
+
+def start_job(job: Job):
+    dataset_path, filtering_container, matching_container = get_job_paths(job)
+
     try:
         job_dir = get_job_directory(job["id"])
         print(f"Creating job directory: {job_dir}")
         os.makedirs(job_dir, exist_ok=True)
+        scheduler = assign_scheduler(job, job_dir)
 
-        # print(f"Copying dataset files from {dataset_path} to {job_dir}")
-        # for item in os.listdir(dataset_path):
-        #     shutil.copy2(os.path.join(dataset_path, item), os.path.join(job_dir, item))
-
-        filtering_params = job["filteringParams"]
-        if is_embeddings_required(job["filteringAlgo"]["code"]):
-            filtering_params["embeddings"] = EMBEDDINGS_DIR
-        filtering_params_str = render_params(filtering_params)
-
-        filtering_slurm_params = {
-            "job-name": f"erbench_filtering_{job['id']}",
-            "parsable": True,
-            "gpus": "1" if is_gpu_required(job["filteringAlgo"]["code"]) else None,
-            "output": os.path.join(job_dir, "filtering.out"),
-            "error": os.path.join(job_dir, "filtering.err"),
-            "wrap": f"apptainer run {filtering_container} {dataset_path} {job_dir} {filtering_params_str}",
-        }
-
-        if HF_HOME:
-            filtering_slurm_params["export"] = f"ALL,TRANSFORMERS_CACHE={HF_HOME},HF_HOME={HF_HOME}"
-
-        filtering_cmd = f"sbatch {SLURM_JOB_ARGS} {render_params(filtering_slurm_params)}"
-        print(f"Filtering command: {filtering_cmd}")
-
-        print(f"Starting filtering job {job['filteringAlgo']['code']} with params: {filtering_params_str}")
-        process = subprocess.run(filtering_cmd, shell=True, capture_output=True, text=True)
-        if process.returncode != 0:
-            raise RuntimeError(f"Error running filtering job: {process.stderr}")
-
-        filtering_job_id = int(process.stdout.strip())
-        print(f"Filtering job submitted with ID: {filtering_job_id}")
-
-        matching_params = job["matchingParams"]
-        if is_embeddings_required(job["matchingAlgo"]["code"]):
-            matching_params["embeddings"] = EMBEDDINGS_DIR
-        matching_params_str = render_params(matching_params)
-
-        matching_slurm_params = {
-            "job-name": f"erbench_matching_{job['id']}",
-            "parsable": True,
-            "gpus": "1" if is_gpu_required(job["matchingAlgo"]["code"]) else None,
-            "output": os.path.join(job_dir, "matching.out"),
-            "error": os.path.join(job_dir, "matching.err"),
-            "dependency": f"afterok:{filtering_job_id}",
-            "wrap": f"apptainer run {matching_container} {job_dir} {matching_params_str}",
-        }
-
-        if HF_HOME:
-            matching_slurm_params["export"] = f"ALL,TRANSFORMERS_CACHE={HF_HOME},HF_HOME={HF_HOME}"
-
-        matching_cmd = f"sbatch {SLURM_JOB_ARGS} {render_params(matching_slurm_params)}"
-        print(f"Matching command: {matching_cmd}")
-
-        print(f"Starting matching job {job['matchingAlgo']['code']} with params: {matching_params_str}")
-        process = subprocess.run(matching_cmd, shell=True, capture_output=True, text=True)
-        if process.returncode != 0:
-            raise RuntimeError(f"Error running matching job: {process.stderr}")
-
-        matching_job_id = int(process.stdout.strip())
-        print(f"Matching job submitted with ID: {matching_job_id}")
-
-        erbench_client.update_job(job["id"], JobStatus.QUEUED, filtering_job_id, matching_job_id)
-        print(f"Job {job['id']} updated to QUEUED status with filtering job ID {filtering_job_id} and matching job ID {matching_job_id}")
+        filtering_job_id = None
+        split_key = get_split_cache_key(job)
+        if split_key and split_cache.restore(split_key, job_dir):
+            print(f"Reusing cached split {split_key}, skipping filtering job")
+        else:
+            filtering_job_id = submit_filtering_job(job, dataset_path, filtering_container, job_dir, scheduler)
+
+        matching_job_id = submit_matching_job(job, matching_container, job_dir, scheduler, filtering_job_id)
+
+        if filtering_job_id is None:
+            erbench_client.update_job(job["id"], JobStatus.MATCHING, matching_slurm_id=matching_job_id)
+            import_filtering_job(job["id"], job_dir)
+            print(f"Job {job['id']} updated to MATCHING status with matching job ID {matching_job_id}")
+        else:
+            erbench_client.update_job(job["id"], JobStatus.QUEUED, filtering_job_id, matching_job_id)
+            print(f"Job {job['id']} updated to QUEUED status with filtering job ID {filtering_job_id} and matching job ID {matching_job_id}")
     except Exception as e:
         print(f"Error executing job: {str(e)}")
 
 
-def get_job_status(slurm_job_id) -> str:
-    process = subprocess.run(["sacct", "-j", str(slurm_job_id), "--format=State", "--parsable2", "--noheader"], capture_output=True, text=True)
-    if process.returncode != 0:
-        raise RuntimeError(f"Error checking job status: {process.stderr}")
-    return process.stdout.strip().split("\n")[0]
+def start_jobs(jobs: list[Job]) -> list[Job]:
+    """
+    Starts pending jobs as Slurm job arrays, one array per phase for all jobs with the same algorithms
+    (and thus the same containers and resources). Returns the jobs which have to be started one by one.
+    """
+    groups: dict[tuple[str, str], list[tuple[Job, str, str]]] = {}
+    remaining = []
+    for job in jobs:
+        split_key = get_split_cache_key(job)
+        if split_key and split_cache.get(split_key):
+            # only the matching job is needed, which is cheap to submit alone
+            remaining.append(job)
+            continue
+        if not get_scheduler(choose_scheduler(job)).supports_arrays:
+            remaining.append(job)
+            continue
+
+        try:
+            dataset_path, filtering_container, matching_container = get_job_paths(job)
+        except Exception as e:
+            print(f"Error executing job {job['id']}: {str(e)}")
+            continue
+        groups.setdefault((filtering_container, matching_container), []).append((job, dataset_path, get_job_directory(job["id"])))
+
+    for (filtering_container, matching_container), group in groups.items():
+        for i in range(0, len(group), ARRAY_MAX_SIZE):
+            tasks = group[i:i + ARRAY_MAX_SIZE]
+            if len(tasks) < max(ARRAY_MIN_JOBS, 2):
+                remaining.extend(job for job, _, _ in tasks)
+                continue
+
+            try:
+                start_job_array(tasks, filtering_container, matching_container)
+            except Exception as e:
+                print(f"Error executing job array: {str(e)}")
+
+    return remaining
+
+
+def start_job_array(tasks: list[tuple[Job, str, str]], filtering_container: str, matching_container: str):
+    job = tasks[0][0]
+    scheduler = get_scheduler(choose_scheduler(job))
+    array_dir = os.path.join(TEMP_DIR, "arrays", f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}")
+    print(f"Starting {len(tasks)} jobs {job['filteringAlgo']['code']} + {job['matchingAlgo']['code']} as job arrays in {array_dir}")
+
+    filtering_tasks = []
+    matching_tasks = []
+    for job, dataset_path, job_dir in tasks:
+        os.makedirs(job_dir, exist_ok=True)
+        assign_scheduler(job, job_dir)
+        filtering_tasks.append((job_dir, get_filtering_command(job, dataset_path, filtering_container, job_dir, scheduler)))
+        matching_tasks.append((job_dir, get_matching_command(job, matching_container, job_dir, scheduler)))
+
+    filtering_array_id = scheduler.submit_array(array_dir, "filtering", filtering_tasks, is_gpu_required(job["filteringAlgo"]["code"]))
+    print(f"Filtering job array submitted with ID: {filtering_array_id}")
+    try:
+        # task i of the matching array starts after task i of the filtering array completed successfully
+        matching_array_id = scheduler.submit_array(array_dir, "matching", matching_tasks, is_gpu_required(job["matchingAlgo"]["code"]), filtering_array_id)
+        print(f"Matching job array submitted with ID: {matching_array_id}")
+    except Exception:
+        cancel_job(filtering_array_id, scheduler)
+        raise
+
+    for index, (job, _, job_dir) in enumerate(tasks):
+        store_slurm_tasks(job_dir, f"{filtering_array_id}_{index}", f"{matching_array_id}_{index}")
+        try:
+            erbench_client.update_job(job["id"], JobStatus.QUEUED, filtering_array_id, matching_array_id)
+            print(f"Job {job['id']} updated to QUEUED status with filtering task {filtering_array_id}_{index} and matching task {matching_array_id}_{index}")
+        except Exception as e:
+            print(f"Error updating job {job['id']}: {str(e)}")
+
+
+def store_slurm_tasks(job_dir: str, filtering_ref: str, matching_ref: str):
+    with open(os.path.join(job_dir, SLURM_TASKS_FILE), "w") as f:
+        json.dump({"filtering": filtering_ref, "matching": matching_ref}, f)
+
+
+def get_slurm_ref(job: Job, phase: str) -> int | str:
+    """
+    Returns the Slurm ID of the filtering or matching job, for tasks of job arrays `<array job id>_<task id>`.
+    """
+    slurm_job_id = job[f"{phase}SlurmId"]
+    tasks_path = os.path.join(get_job_directory(job["id"]), SLURM_TASKS_FILE)
+    if slurm_job_id and os.path.exists(tasks_path):
+        with open(tasks_path, "r") as f:
+            slurm_ref = json.load(f).get(phase)
+        # the file may be left over from an earlier submission
+        if slurm_ref and slurm_ref.split("_")[0] == str(slurm_job_id):
+            return slurm_ref
+    return slurm_job_id
+
+
+def choose_scheduler(job: Job) -> str:
+    # both phases run on the same backend, as a dependency can't span two backends
+    if SCHEDULER == "local" or (job["filteringAlgo"]["code"] in LOCAL_ALGORITHMS and job["matchingAlgo"]["code"] in LOCAL_ALGORITHMS):
+        return "local"
+    return "slurm"
+
+
+def assign_scheduler(job: Job, job_dir: str) -> Scheduler:
+    name = choose_scheduler(job)
+    with open(os.path.join(job_dir, SCHEDULER_FILE), "w") as f:
+        f.write(name)
+    return get_scheduler(name)
+
+
+def get_job_scheduler(job: Job) -> str:
+    """
+    Returns the name of the backend, to which the job was submitted (jobs of older managers ran on Slurm).
+    """
+    scheduler_path = os.path.join(get_job_directory(job["id"]), SCHEDULER_FILE)
+    if os.path.exists(scheduler_path):
+        with open(scheduler_path, "r") as f:
+            return f.read().strip() or "slurm"
+    return "slurm"
+
+
+def get_scheduler(name: str) -> Scheduler:
+    global local_scheduler
+
+    if name == "slurm":
+        return slurm_scheduler
+    if name != "local":
+        raise ValueError(f"Unknown scheduler {name}, expected slurm or local")
+
+    # the process pool is only started once a job runs locally
+    with local_scheduler_lock:
+        if local_scheduler is None:
+            local_scheduler = LocalScheduler(
+                os.path.join(TEMP_DIR, "local_scheduler"),
+                cpus=LOCAL_CPUS or None,
+                memory=int(LOCAL_MEMORY * 1024**3) or None,
+                job_cpus=LOCAL_JOB_CPUS,
+                job_memory=int(LOCAL_JOB_MEMORY * 1024**3),
+            )
+        return local_scheduler
+
+
+def get_run_command(algo_code: str, container: str, args: str, scheduler: Scheduler) -> str:
+    if scheduler.name == "local" and LOCAL_PYTHON:
+        # run the sources directly, e.g. to test the pipeline on a machine without apptainer
+        # the containers ship the shared erbench package, here it is taken from the manager sources
+        pythonpath = shlex.quote(os.path.join(SOURCES_DIR, "manager"))
+        return f"PYTHONPATH={pythonpath}${{PYTHONPATH:+:$PYTHONPATH}} {LOCAL_PYTHON} -u {get_source_script(algo_code)} {args}"
+    return f"apptainer run {container} {args}"
+
+
+def get_source_script(algo_code: str) -> str:
+    splitters = {"splitter_random": "Random", "splitter_knnjoin": "KNN-Join", "splitter_deepblocker": "DeepBlocker"}
+    if algo_code in splitters:
+        return os.path.join(SOURCES_DIR, "splitters", splitters[algo_code], "splitter.py")
+    return os.path.join(SOURCES_DIR, "methods", algo_code, "entrypoint.py")
+
+
+def get_filtering_command(job: Job, dataset_path: str, filtering_container: str, job_dir: str, scheduler: Scheduler) -> str:
+    filtering_params = dict(job["filteringParams"] or {})
+    if is_embeddings_required(job["filteringAlgo"]["code"]):
+        filtering_params["embeddings"] = EMBEDDINGS_DIR
+    return get_run_command(job["filteringAlgo"]["code"], filtering_container, f"{dataset_path} {job_dir} {render_params(filtering_params)}", scheduler)
+
+
+def get_matching_command(job: Job, matching_container: str, job_dir: str, scheduler: Scheduler, resume: bool = False) -> str:
+    matching_params = dict(job["matchingParams"] or {})
+    if resume:
+        matching_params["resume"] = True
+    if is_embeddings_required(job["matchingAlgo"]["code"]):
+        matching_params["embeddings"] = EMBEDDINGS_DIR
+    return get_run_command(job["matchingAlgo"]["code"], matching_container, f"{job_dir} {render_params(matching_params)}", scheduler)
+
+
+def submit_filtering_job(job: Job, dataset_path: str, filtering_container: str, job_dir: str, scheduler: Scheduler) -> int:
+    # print(f"Copying dataset files from {dataset_path} to {job_dir}")
+    # for item in os.listdir(dataset_path):
+    #     shutil.copy2(os.path.join(dataset_path, item), os.path.join(job_dir, item))
+
+    print(f"Starting filtering job {job['filteringAlgo']['code']} with params: {render_params(job['filteringParams'] or {})}")
+    filtering_job_id = scheduler.submit(
+        f"erbench_filtering_{job['id']}",
+        get_filtering_command(job, dataset_path, filtering_container, job_dir, scheduler),
+        output=os.path.join(job_dir, "filtering.out"),
+        error=os.path.join(job_dir, "filtering.err"),
+        gpus=is_gpu_required(job["filteringAlgo"]["code"]),
+    )
+    print(f"Filtering job submitted to {scheduler.name} with ID: {filtering_job_id}")
+    return filtering_job_id
+
+
+def submit_matching_job(job: Job, matching_container: str, job_dir: str, scheduler: Scheduler, filtering_job_id: int = None, resume: bool = False) -> int:
+    print(f"Starting matching job {job['matchingAlgo']['code']} with params: {render_params(job['matchingParams'] or {})}")
+    matching_job_id = scheduler.submit(
+        f"erbench_matching_{job['id']}",
+        get_matching_command(job, matching_container, job_dir, scheduler, resume),
+        output=os.path.join(job_dir, "matching.out"),
+        error=os.path.join(job_dir, "matching.err"),
+        gpus=is_gpu_required(job["matchingAlgo"]["code"]),
+        dependency=filtering_job_id,
+    )
+    print(f"Matching job submitted to {scheduler.name} with ID: {matching_job_id}")
+    return matching_job_id
+
+
+def get_scheduler_status(jobs: list[Job]) -> dict[str, SlurmStatus]:
+    """
+    Queries the states of all running jobs, with a single call per backend.
+    """
+    job_ids: dict[str, list[int]] = {}
+    for job in jobs:
+        if job["status"] == JobStatus.QUEUED or job["status"] == JobStatus.FILTERING or job["status"] == JobStatus.MATCHING:
+            job_ids.setdefault(get_job_scheduler(job), []).extend([job["filteringSlurmId"], job["matchingSlurmId"]])
+    return {name: get_scheduler(name).query(ids) for name, ids in job_ids.items()}
+
 
+def cancel_job(job_id: int | str, scheduler: Scheduler = None):
+    if scheduler is None:
+        scheduler = slurm_scheduler
 
-def cancel_job(slurm_job_id):
-    print(f"Cancelling job {slurm_job_id}")
-    process = subprocess.run(["scancel", str(slurm_job_id)], capture_output=True, text=True)
-    if process.returncode != 0:
-        raise RuntimeError(f"Error cancelling job: {process.stderr}")
-    print(f"Job {slurm_job_id} cancelled")
+    print(f"Cancelling job {job_id}")
+    scheduler.cancel(job_id)
+    print(f"Job {job_id} cancelled")
 
 
-def check_job(job: Job):
+def check_job(job: Job, scheduler_status: dict[str, SlurmStatus] = None):
     try:
         job_dir = get_job_directory(job["id"])
+        scheduler = get_scheduler(get_job_scheduler(job))
+        if scheduler_status is None:
+            scheduler_status = get_scheduler_status([job])
+        slurm_status = scheduler_status.get(scheduler.name, SlurmStatus())
+        filtering_ref = get_slurm_ref(job, "filtering")
+        matching_ref = get_slurm_ref(job, "matching")
 
         if job["status"] == JobStatus.QUEUED or job["status"] == JobStatus.FILTERING:
-            filtering_status = get_job_status(job["filteringSlurmId"])
+            filtering_status = slurm_status.get_state(filtering_ref)
             print(f"Filtering status: {filtering_status}")
 
             if filtering_status == "RUNNING" or filtering_status == "COMPLETING":
@@ -237,19 +536,21 @@ def check_job(job: Job):
                     erbench_client.update_job(job["id"], JobStatus.FILTERING)
                 return
             elif filtering_status == "COMPLETED":
-                import_filtering_job(job["id"], job_dir, job["filteringSlurmId"])
+                import_filtering_job(job["id"], job_dir, filtering_ref)
+                store_split(job, job_dir)
             elif filtering_status == "FAILED":
                 erbench_client.update_job(job["id"], JobStatus.FAILED)
-                cancel_job(job["matchingSlurmId"])
+                cancel_job(matching_ref, scheduler)
                 print(f"Job {job['id']} failed")
                 return
 
-        matching_status = get_job_status(job["matchingSlurmId"])
+        matching_status = slurm_status.get_state(matching_ref)
         print(f"Matching status: {matching_status}")
 
         if matching_status == "COMPLETED":
             print(f"Importing results for job {job['id']} from {job_dir}")
-            import_job(job["id"], job_dir, job["matchingSlurmId"])
+            results = import_job(job["id"], job_dir, matching_ref, slurm_status)
+            store_result(job, job_dir, results)
 
             if job["notifyEmail"] and len(job["notifyEmail"]) > 0:
                 print(f"Sending email notification to {job['notifyEmail']}")
@@ -262,7 +563,9 @@ def check_job(job: Job):
                 print(f"Job directory {job_dir} removed successfully")
             except Exception as e:
                 print(f"Warning: Failed to remove job directory: {str(e)}")
-        elif matching_status == "FAILED":
+        elif matching_status in RESUMABLE_STATES and resume_job(job, job_dir, scheduler):
+            return
+        elif matching_status == "FAILED" or matching_status in RESUMABLE_STATES:
             erbench_client.update_job(job["id"], JobStatus.FAILED)
             print(f"Job {job['id']} failed")
     except Exception as e:
@@ -270,19 +573,95 @@ def check_job(job: Job):
         print(f"Error updating status: {str(e)}")
 
 
+def resume_job(job: Job, job_dir: str, scheduler: Scheduler) -> bool:
+    """
+    Resubmits the matching job of a job which timed out or was preempted, to continue from its last checkpoint.
+    Returns False if the matcher can't resume or the job was already resubmitted `MAX_RESUMES` times.
+    """
+    if not is_resume_supported(job["matchingAlgo"]["code"]):
+        return False
+
+    resumes_path = os.path.join(job_dir, RESUMES_FILE)
+    resumes = 0
+    if os.path.exists(resumes_path):
+        with open(resumes_path, "r") as f:
+            resumes = int(f.read().strip() or 0)
+    if resumes >= MAX_RESUMES:
+        print(f"Job {job['id']} was already resumed {resumes} times")
+        return False
+
+    _, _, matching_container = get_job_paths(job)
+    matching_job_id = submit_matching_job(job, matching_container, job_dir, scheduler, resume=True)
+    with open(resumes_path, "w") as f:
+        f.write(str(resumes + 1))
+    erbench_client.update_job(job["id"], JobStatus.MATCHING, matching_slurm_id=matching_job_id)
+    print(f"Job {job['id']} resumed with matching job ID {matching_job_id}")
+    return True
+
+
+def process_job(job: Job, scheduler_status: dict[str, SlurmStatus] = None):
+    if job["status"] == JobStatus.PENDING:
+        if result_cache is not None and complete_cached_job(job):
+            return
+        print(f"Starting job {job['id']}")
+        start_job(job)
+    elif job["status"] == JobStatus.QUEUED or job["status"] == JobStatus.FILTERING or job["status"] == JobStatus.MATCHING:
+        print(f"Checking job {job['id']}")
+        check_job(job, scheduler_status)
+
+
+def start_pending_jobs(jobs: list[Job]) -> list[Job]:
+    """
+    Starts bursts of pending jobs as job arrays and returns the jobs which are left to be processed one by one.
+    """
+    if ARRAY_MIN_JOBS <= 0:
+        return jobs
+
+    pending = [job for job in jobs if job["status"] == JobStatus.PENDING and not (result_cache is not None and complete_cached_job(job))]
+    if len(pending) < ARRAY_MIN_JOBS:
+        return [job for job in jobs if job["status"] != JobStatus.PENDING] + pending
+
+    remaining = start_jobs(pending)
+    return [job for job in jobs if job["status"] != JobStatus.PENDING] + remaining
+
+
+def get_active_jobs() -> list[Job]:
+    return erbench_client.get_jobs(statuses=[JobStatus.PENDING, JobStatus.QUEUED, JobStatus.FILTERING, JobStatus.MATCHING])
+
+
 def run_job():
-    jobs = erbench_client.get_jobs()
+    jobs = get_active_jobs()
+    scheduler_status = get_scheduler_status(jobs)
+    jobs = start_pending_jobs(jobs)
     for job in jobs:
         try:
-            if job["status"] == JobStatus.PENDING:
-                print(f"Starting job {job['id']}")
-                start_job(job)
-            elif job["status"] == JobStatus.QUEUED or job["status"] == JobStatus.FILTERING or job["status"] == JobStatus.MATCHING:
-                print(f"Checking job {job['id']}")
-                check_job(job)
+            process_job(job, scheduler_status)
         except Exception as e:
             print(f"Error processing job {job['id']}: {str(e)}")
 
+    if local_scheduler is not None:
+        # the local jobs would be lost on exit, the next run imports their results
+        print("Waiting for local jobs to finish")
+        local_scheduler.shutdown(wait=True)
+
+
+def serve_jobs(interval: float, concurrency: int):
+    # the status of all active jobs is refreshed once per poll cycle, together with the job list
+    snapshot = {"scheduler_status": {}}
+
+    def poll_jobs() -> list[Job]:
+        jobs = get_active_jobs()
+        snapshot["scheduler_status"] = get_scheduler_status(jobs)
+        # jobs which are still being handled must not be started again as part of a job array
+        return start_pending_jobs([job for job in jobs if not daemon.is_active(job["id"])])
+
+    daemon = JobDaemon(poll_jobs, lambda job: process_job(job, snapshot["scheduler_status"]), interval=interval, concurrency=concurrency)
+    daemon.run()
+
+    if local_scheduler is not None:
+        print("Waiting for local jobs to finish")
+        local_scheduler.shutdown(wait=True)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="SMBench Manager CLI")
@@ -291,12 +670,17 @@ if __name__ == "__main__":
     import_parser = subparsers.add_parser("import", help="Import results into database")
     import_parser.add_argument("job_id", type=str, help="The job ID in the SMBench database")
     import_parser.add_argument("input_dir", type=pathtype.Path(readable=True), help="The input directory containing the results")
-    import_parser.add_argument("-sj", "--slurm-job-id", type=int, default=None, help="Slurm job ID, used to gather utilization metrics")
+    import_parser.add_argument("-sj", "--slurm-job-id", type=str, default=None, help="Slurm job ID (or <array job id>_<task id>), used to gather utilization metrics")
     import_parser.set_defaults(func=import_job)
 
     run_parser = subparsers.add_parser("run", help="Run entity resolution tasks")
     run_parser.set_defaults(func=run_job)
 
+    serve_parser = subparsers.add_parser("serve", help="Run the manager as a daemon, polling for new jobs")
+    serve_parser.add_argument("-i", "--interval", type=float, default=POLL_INTERVAL, help="Seconds between two polls of the job queue")
+    serve_parser.add_argument("-c", "--concurrency", type=int, default=MAX_CONCURRENT_JOBS, help="Maximum number of jobs handled at the same time")
+    serve_parser.set_defaults(func=serve_jobs)
+
     test_email = subparsers.add_parser("test-email", help="Send test email")
     test_email.add_argument("job_id", type=str, help="The job ID in the SMBench database")
     test_email.add_argument("notify_email", type=str, help="The email address to send the notification to")
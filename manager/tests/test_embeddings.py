@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from erbench.embeddings import EmbeddingStore, build_store
+
+fasttext = pytest.importorskip("fasttext")
+
+CORPUS = [
+    "the quick brown fox jumps over the lazy dog",
+    "entity matching links the records of two tables which refer to the same entity",
+    "apple iphone 12 pro max 256gb graphite",
+    "samsung galaxy s21 ultra 5g phantom black",
+    "fodors zagat restaurant guide new york city",
+]
+
+
+@pytest.fixture(scope="module")
+def model_path(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("fasttext")
+    corpus_path = directory / "corpus.txt"
+    corpus_path.write_text("\n".join(CORPUS * 200) + "\n")
+    model = fasttext.train_unsupervised(str(corpus_path), dim=16, minCount=1, minn=2, maxn=4, bucket=10000,
+                                        thread=1, verbose=0)
+    path = directory / "model.bin"
+    model.save_model(str(path))
+    return path
+
+
+@pytest.fixture(scope="module")
+def store(model_path):
+    # like the tokens of the datasets, the other words of a text are computed from their subwords
+    return EmbeddingStore(build_store(str(model_path), " ".join(CORPUS).split()))
+
+
+@pytest.mark.parametrize("text", [
+    "the quick brown fox",
+    "apple iphone 12 pro",
+    "unseen tokens like smartphone and restaurants",
+    "  leading and   repeated whitespace ",
+    "",
+])
+def test_sentence_vector_matches_fasttext(model_path, store, text):
+    model = fasttext.load_model(str(model_path))
+
+    # the subword vectors are stored as float16
+    np.testing.assert_allclose(store.get_sentence_vector(text), model.get_sentence_vector(text), atol=1e-3)
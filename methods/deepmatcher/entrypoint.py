@@ -2,13 +2,18 @@ import sys
 sys.path.append('fork-deepmatcher')
 
 import argparse
-import time
 import os
+import time
 import pathtype
 
 import pandas as pd
 import deepmatcher as dm
+from deepmatcher.optim import Optimizer
 from transform import transform_input, transform_output
+from erbench.timing import PhaseTimer
+from erbench.pairs import load_pairs
+from erbench.embeddings import install_fasttext_shim
+from erbench.checkpoint import load_checkpoint, restore_checkpoint, save_checkpoint
 
 parser = argparse.ArgumentParser(description='Benchmark a dataset with a method')
 parser.add_argument('input', type=pathtype.Path(readable=True), nargs='?', default='/data',
@@ -19,8 +24,39 @@ parser.add_argument('--embeddings', type=pathtype.Path(readable=True), nargs='?'
                     help='The directory where embeddings are stored')
 parser.add_argument('-e', '--epochs', type=int, nargs='?', default=5,
                     help='Number of epochs to train the model')
+parser.add_argument('--resume', action='store_true', default=False,
+                    help='Continue training from the checkpoint of the last finished epoch in the output directory')
 args = parser.parse_args()
 
+
+class ResumableOptimizer(Optimizer):
+    """
+    Optimizer of deepmatcher which keeps its state when `run_train` is called once per epoch, instead of creating a new
+    base optimizer in every call, and which can be checkpointed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.base_optimizer = None
+        self.base_state = None
+
+    def set_parameters(self, params):
+        if self.base_optimizer is None:
+            super().set_parameters(params)
+            if self.base_state is not None:
+                self.base_optimizer.load_state_dict(self.base_state)
+                self.base_optimizer.param_groups[0]['lr'] = self.lr
+
+    def state_dict(self):
+        return {'base_optimizer': self.base_optimizer.state_dict() if self.base_optimizer is not None else None,
+                'lr': self.lr, 'last_acc': self.last_acc, 'start_decay': self.start_decay}
+
+    def load_state_dict(self, state):
+        self.base_state = state['base_optimizer']
+        self.lr = state['lr']
+        self.last_acc = state['last_acc']
+        self.start_decay = state['start_decay']
+
 if args.output is None:
     args.output = args.input
 
@@ -29,40 +65,79 @@ if not os.path.isdir(args.output) or not os.access(args.output, os.W_OK):
     print("output folder does not exits or is not writable")
     exit(1)
 
+# use the memory-mapped embedding store instead of the full fastText model, if one was built
+install_fasttext_shim(args.embeddings)
+
 print("Hi, I'm DeepMatcher entrypoint!")
 print("Input taken from: ", args.input)
 print("Input directory: ", os.listdir(args.input))
 print("Output directory: ", os.listdir(args.output))
 
-transform_input(args.input, args.output)
+timer = PhaseTimer()
+with timer.phase("load"):
+    transform_input(args.input, args.output)
 
 # Step 1. Convert input data into the format expected by the method
-datasets = dm.data.process(path=args.output,
-                           train="train_dm.csv",
-                           validation="valid_dm.csv",
-                           test="test_dm.csv",
-                           id_attr='id',
-                           label_attr='label',
-                           left_prefix='tableA_',
-                           right_prefix='tableB_',
-                           cache=None,
-                           embeddings_cache_path=args.embeddings)
+with timer.phase("preprocess"):
+    datasets = dm.data.process(path=args.output,
+                               train="train_dm.csv",
+                               validation="valid_dm.csv",
+                               test="test_dm.csv",
+                               id_attr='id',
+                               label_attr='label',
+                               left_prefix='tableA_',
+                               right_prefix='tableB_',
+                               cache=None,
+                               embeddings_cache_path=args.embeddings)
 
 train, valid, test = datasets[0], datasets[1], datasets[2] if len(datasets) >= 3 else None
 
 # Step 2. Run the method
 model = dm.MatchingModel()
+optimizer = ResumableOptimizer()
+
+checkpoint = load_checkpoint(args.output) if args.resume else None
+start_epoch = 0
+results_per_epoch = []
+# the training time of the earlier jobs of a resumed training, up to their last checkpoint
+previous_train_time = 0.0
+# run_train starts with a new best score in every call, so the best epoch is kept here
+best_score = -1
+best_state = None
+if checkpoint is not None:
+    # the layers of the model are only built for the attributes of the dataset
+    model.initialize(train)
+    start_epoch = restore_checkpoint(checkpoint, model=model, optimizer=optimizer)
+    results_per_epoch = checkpoint['results_per_epoch']
+    previous_train_time = checkpoint['extra'].get('train_time', 0.0)
+    best_score = checkpoint['extra'].get('best_score', -1)
+    best_state = checkpoint['extra'].get('best_state')
 
-start_time = time.process_time()
-_, results_per_epoch = model.run_train(train, valid, test, epochs=args.epochs)
-train_time = time.process_time() - start_time
+with timer.phase("train"):
+    start_time = time.time()
+    # one epoch per call, so the state after every epoch can be checkpointed
+    for epoch in range(start_epoch, args.epochs):
+        score, epoch_results = model.run_train(train, valid, test, epochs=1, optimizer=optimizer)
+        for row in epoch_results:
+            results_per_epoch.append([row[0] + epoch] + list(row[1:]))
+        if score > best_score:
+            best_score = score
+            best_state = {name: tensor.detach().cpu().clone() for name, tensor in model.state_dict().items()}
+        save_checkpoint(args.output, epoch + 1, results_per_epoch,
+                        extra={'best_score': best_score, 'best_state': best_state,
+                               'train_time': previous_train_time + time.time() - start_time},
+                        model=model, optimizer=optimizer)
+    # evaluate the model of the epoch with the best validation score, like a training in a single call
+    if best_state is not None:
+        model.load_state_dict(best_state)
 
-start_time = time.process_time()
-predictions, stats = model.run_eval(test, return_stats=True, return_predictions=True)
-eval_time = time.process_time() - start_time
+with timer.phase("eval"):
+    predictions, stats = model.run_eval(test, return_stats=True, return_predictions=True)
 
 
 # Step 3. Convert the output into a common format
-test_data =  pd.read_csv(os.path.join(args.input, 'test.csv'), encoding_errors='replace')
-transform_output(predictions,test_data, stats, results_per_epoch, train_time, eval_time, args.output)
+with timer.phase("write"):
+    test_data = load_pairs(args.input, 'test')
+    transform_output(predictions,test_data, stats, results_per_epoch, previous_train_time + timer.wall_time("train"), timer.wall_time("eval"), args.output)
+timer.write(args.output)
 print("Final output: ", os.listdir(args.output))
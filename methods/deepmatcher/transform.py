@@ -1,11 +1,13 @@
 import os
 import pandas as pd
 import torch
+from erbench.pairs import load_pairs
+from erbench.tables import write_table
 
 def transform_input(source_dir, output_dir, prefixes=['tableA_', 'tableB_']):
-    train_data = pd.read_csv(os.path.join(source_dir, 'train.csv'), encoding_errors='replace')
-    test_data = pd.read_csv(os.path.join(source_dir, 'test.csv'), encoding_errors='replace')
-    valid_data = pd.read_csv(os.path.join(source_dir, 'valid.csv'), encoding_errors='replace')
+    train_data = load_pairs(source_dir, 'train')
+    test_data = load_pairs(source_dir, 'test')
+    valid_data = load_pairs(source_dir, 'valid')
     train_data.drop(columns = ['tableA_id', 'tableB_id'], inplace=True)
     test_data.drop(columns = ['tableA_id', 'tableB_id'], inplace=True)
     valid_data.drop(columns = ['tableA_id', 'tableB_id'], inplace=True)
@@ -57,15 +59,15 @@ def transform_output(predictions, data, stats, results_per_epoch, train_time, ev
     predictions['tableA_name'] = data.loc[predictions['id'], name_cols[0]]
     predictions['tableB_name'] = data.loc[predictions['id'], name_cols[1]]
 
-    predictions.loc[:,['tableA_id', 'tableB_id', 'tableA_name', 'tableB_name', 'label', 'prob_class1']].to_csv(os.path.join(dest_dir, 'predictions.csv'), index=False)
+    write_table(predictions.loc[:,['tableA_id', 'tableB_id', 'tableA_name', 'tableB_name', 'label', 'prob_class1']], dest_dir, 'predictions')
 
-    pd.DataFrame({
+    write_table(pd.DataFrame({
         'f1': [stats.f1().item()],
         'precision': [stats.precision().item()],
         'recall': [stats.recall().item()],
         'train_time': [train_time],
         'eval_time': [eval_time],
-    }).to_csv(os.path.join(dest_dir, 'metrics.csv'), index=False)
+    }), dest_dir, 'metrics')
 
     pd.DataFrame(results_per_epoch,
                  columns=['epoch', 'f1', 'precision', 'recall', 'train_time', 'valid_time', 'test_time']
@@ -9,16 +9,14 @@ import sys
 import torch
 import numpy as np
 from collections import namedtuple
-import time
 
-from transform import transform_input, transform_output
+from transform import serialize_input, transform_output
+from pipeline import TokenizedDittoDataset, preprocess
+from training import train
+from erbench.timing import PhaseTimer
 
 sys.path.insert(0, "Snippext_public")
 
-from ditto_light.dataset import DittoDataset
-from ditto_light.summarize import Summarizer
-from ditto_light.knowledge import ProductDKInjector, GeneralDKInjector
-from ditto_light.ditto import train
 from matcher import classify, tune_threshold
 
 from scipy.special import softmax
@@ -35,6 +33,10 @@ parser.add_argument('-e', '--epochs', type=int, nargs='?', default=5,
                     help='Number of epochs to train the model')
 parser.add_argument('-m', '--model', type=str, nargs='?', default='RoBERTa',
                     help='The language model to use', choices=['RoBERTa', 'DistilBERT', 'BERT', 'XLNet'])
+parser.add_argument('--resume', action='store_true', default=False,
+                    help='Continue training from the checkpoint of the last finished epoch in the output directory')
+parser.add_argument('--debug', action='store_true', default=False,
+                    help='Write the intermediate train/valid/test sets to the temp directory of the output')
 args = parser.parse_args()
 
 if args.output is None:
@@ -47,6 +49,7 @@ if not os.path.isdir(args.output) or not os.access(args.output, os.W_OK):
 
 temp_output = os.path.join(args.output, 'temp')
 os.makedirs(temp_output, exist_ok=True)
+debug_output = temp_output if args.debug else None
 
 print("Hi, I'm DITTO entrypoint!")
 print("Input taken from: ", args.input)
@@ -57,7 +60,10 @@ print("Output directory: ", os.listdir(args.output))
 print("Method input: ", os.listdir(args.input))
 prefix_1 = 'tableA_'
 prefix_2 = 'tableB_'
-trainset, validset, testset, train_ids, valid_ids, test_ids = transform_input(args.input, temp_output, prefixes=[prefix_1, prefix_2])
+timer = PhaseTimer()
+with timer.phase("load"):
+    lines, ids = serialize_input(args.input, prefixes=[prefix_1, prefix_2])
+    test_ids = ids['test']
 
 hyperparameters = namedtuple('hyperparameters', ['lm', #language Model
                                                  'n_epochs', #number of epochs
@@ -120,53 +126,39 @@ run_tag = run_tag.replace('/', '_')
 # testset = config['testset']
 
 config = {"task_type": "classification",
-  "vocab": ["0", "1"],
-  "trainset": os.path.join(temp_output, 'train.txt'),
-  "validset":os.path.join(temp_output, 'valid.txt'),
-  "testset": os.path.join(temp_output, 'test.txt')}
-
-# summarize the sequences up to the max sequence length
-if hp.summarize:
-    summarizer = Summarizer(config, lm=hp.lm)
-    trainset = summarizer.transform_file(trainset, max_len=hp.max_len)
-    validset = summarizer.transform_file(validset, max_len=hp.max_len)
-    testset = summarizer.transform_file(testset, max_len=hp.max_len)
-
-if hp.dk is not None:
-    if hp.dk == 'product':
-        injector = ProductDKInjector(config, hp.dk)
-    else:
-        injector = GeneralDKInjector(config, hp.dk)
-
-    trainset = injector.transform_file(trainset)
-    validset = injector.transform_file(validset)
-    testset = injector.transform_file(testset)
-
-# load train/dev/test sets
-train_dataset = DittoDataset(trainset,
-                               lm=hp.lm,
-                               max_len=hp.max_len,
-                               size=hp.size,
-                               da=hp.da)
-valid_dataset = DittoDataset(validset, lm=hp.lm)
-test_dataset = DittoDataset(testset, lm=hp.lm)
+  "vocab": ["0", "1"]}
+
+with timer.phase("preprocess"):
+    # summarize the sequences up to the max sequence length and inject the domain knowledge, in memory
+    lines = preprocess(lines, hp, config, debug_dir=debug_output)
+    trainset, validset, testset = lines['train'], lines['valid'], lines['test']
+
+    # load train/dev/test sets
+    train_dataset = TokenizedDittoDataset(trainset,
+                                          lm=hp.lm,
+                                          max_len=hp.max_len,
+                                          size=hp.size,
+                                          da=hp.da)
+    valid_dataset = TokenizedDittoDataset(validset, lm=hp.lm)
+    test_dataset = TokenizedDittoDataset(testset, lm=hp.lm)
 
 # train and evaluate the model
-start_time = time.process_time()
-matcher, threshold, results_per_epoch = train(train_dataset,valid_dataset, test_dataset, run_tag, hp)
-train_time = time.process_time() - start_time
+with timer.phase("train"):
+    matcher, threshold, results_per_epoch, train_time = train(train_dataset, valid_dataset, test_dataset, run_tag, hp,
+                                                              seed=seed, checkpoint_dir=args.output, resume=args.resume)
 
 pairs = []
 #threshold = 0.5
 
 # batch processing
 out_data = []
-start_time = time.process_time()
-predictions, logits, labels = classify(testset, matcher, lm=hp.lm,
-                               batch_size = hp.batch_size,
-                               max_len=hp.max_len,
-                               threshold=threshold)
-scores = softmax(logits, axis=1)
-eval_time = time.process_time() - start_time
-
-transform_output(scores, threshold, results_per_epoch, test_ids, labels, train_time, eval_time, args.output)
+with timer.phase("eval"):
+    predictions, logits, labels = classify(testset, matcher, lm=hp.lm,
+                                   batch_size = hp.batch_size,
+                                          max_len=hp.max_len,
+                                   threshold=threshold)
+    scores = softmax(logits, axis=1)
+
+with timer.phase("write"):
+    transform_output(scores, threshold, results_per_epoch, test_ids, labels, train_time, timer.wall_time("eval"), args.output)
+timer.write(args.output)
@@ -0,0 +1,120 @@
+"""
+In-memory preprocessing of ditto: summarization and domain knowledge injection are chained generators over the
+serialized lines of the train/valid/test sets (`transform.serialize_input`), instead of every step reading and
+writing a file per set.
+
+The lines are exactly those of the files ditto would read (`<left>\t<right>\t<label>\n`), so the summarizer and the
+injectors transform them like in `transform_file`. `DittoDataset` and `classify` take the resulting lists of lines.
+With `debug_dir`, every intermediate set is written there as well, named like the files of ditto.
+`TokenizedDittoDataset` takes the tokens of the pairs from the tokenization cache of erbench.
+"""
+import os
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from erbench.serialization import TAGGED
+from erbench.tokenization import tokenize_pairs, unpad
+
+from ditto_light.dataset import DittoDataset, lm_mp
+from ditto_light.summarize import Summarizer
+from ditto_light.knowledge import ProductDKInjector, GeneralDKInjector
+
+SPLITS = ['train', 'valid', 'test']
+
+
+class InMemorySummarizer(Summarizer):
+    """
+    Summarizer whose TF-IDF index is built once from the lines of all sets, instead of reading the files of its config.
+    """
+
+    def __init__(self, lines: Dict[str, List[str]], lm: str):
+        self.lines = lines
+        super().__init__({}, lm=lm)
+
+    def build_index(self):
+        content = []
+        for name in SPLITS:
+            for line in self.lines.get(name, []):
+                LL = line.split('\t')
+                if len(LL) > 2:
+                    for entry in LL:
+                        content.append(entry)
+
+        vectorizer = TfidfVectorizer().fit(content)
+        self.vocab = vectorizer.vocabulary_
+        self.idf = vectorizer.idf_
+
+
+def summarize(lines: Iterable[str], summarizer: Summarizer, max_len: int) -> Iterator[str]:
+    for line in lines:
+        yield summarizer.transform(line, max_len=max_len)
+
+
+def inject(lines: Iterable[str], injector) -> Iterator[str]:
+    for line in lines:
+        LL = line.split('\t')
+        if len(LL) == 3:
+            yield injector.transform(LL[0]) + '\t' + injector.transform(LL[1]) + '\t' + LL[2]
+
+
+def write_lines(lines: Iterable[str], path: str) -> Iterator[str]:
+    """
+    Passes the lines through and writes them to `path` on the way.
+    """
+    with open(path, 'w') as f:
+        for line in lines:
+            f.write(line)
+            yield line
+
+
+def preprocess(lines: Dict[str, List[str]], hp, config, debug_dir: Optional[str] = None) -> Dict[str, List[str]]:
+    """
+    Summarizes the sets and injects the domain knowledge, depending on the hyperparameters `summarize` and `dk`.
+    """
+    summarizer = InMemorySummarizer(lines, lm=hp.lm) if hp.summarize else None
+    injector = None
+    if hp.dk is not None:
+        injector = ProductDKInjector(config, hp.dk) if hp.dk == 'product' else GeneralDKInjector(config, hp.dk)
+
+    result = {}
+    for name in SPLITS:
+        stream = iter(lines[name])
+        file_name = name + '.txt'
+        if debug_dir is not None:
+            stream = write_lines(stream, os.path.join(debug_dir, file_name))
+        if summarizer is not None:
+            stream = summarize(stream, summarizer, hp.max_len)
+            file_name += '.su'
+            if debug_dir is not None:
+                stream = write_lines(stream, os.path.join(debug_dir, file_name))
+        if injector is not None:
+            stream = inject(stream, injector)
+            file_name += '.dk'
+            if debug_dir is not None:
+                stream = write_lines(stream, os.path.join(debug_dir, file_name))
+        result[name] = list(stream)
+    return result
+
+
+class TokenizedDittoDataset(DittoDataset):
+    """
+    DittoDataset whose pairs are tokenized once, in batches and cached, instead of in every `__getitem__`.
+    Only the augmented pairs of the training set are still tokenized on the fly.
+    """
+
+    def __init__(self, path, max_len=256, size=None, lm='roberta', da=None):
+        super().__init__(path, max_len=max_len, size=size, lm=lm, da=da)
+        self.encodings = tokenize_pairs(lm_mp.get(lm, lm), [pair[0] for pair in self.pairs],
+                                        [pair[1] for pair in self.pairs], max_len, TAGGED)
+
+    def __getitem__(self, idx):
+        x = unpad(self.encodings, idx)
+        if self.da is None:
+            return x, self.labels[idx]
+
+        left, right = self.pairs[idx]
+        combined = self.augmenter.augment_sent(left + ' [SEP] ' + right, self.da)
+        left, right = combined.split(' [SEP] ')
+        x_aug = self.tokenizer.encode(text=left, text_pair=right, max_length=self.max_len, truncation=True)
+        return x, x_aug, self.labels[idx]
@@ -0,0 +1,133 @@
+"""
+Training loop of ditto (like `ditto_light.ditto.train`), with batches of pairs of similar lengths.
+
+`DittoDataset.pad` already pads every batch only to its longest pair, so grouping pairs of similar lengths removes most
+of the padding. The training batches are shuffled at the granularity of length buckets, deterministically for the seed
+(`erbench.batching`). The validation and test batches are sorted by length, their metrics do not depend on the order.
+After every epoch, the model, optimizer, scheduler, RNG states and results are checkpointed (`erbench.checkpoint`).
+"""
+import time
+
+import numpy as np
+import torch
+from sklearn import metrics
+from torch.utils import data
+from transformers import AdamW, get_linear_schedule_with_warmup
+
+from erbench.batching import LengthBucketBatchSampler
+from erbench.checkpoint import load_checkpoint, restore_checkpoint, save_checkpoint
+from erbench.tokenization import get_lengths
+
+from ditto_light.ditto import DittoModel, train_step
+
+THRESHOLDS = np.arange(0.0, 1.0, 0.05)
+
+
+def get_iterator(dataset, batch_size: int, shuffle: bool, seed: int = 0):
+    sampler = LengthBucketBatchSampler(get_lengths(dataset.encodings), batch_size, shuffle=shuffle, seed=seed)
+    return data.DataLoader(dataset=dataset, batch_sampler=sampler, num_workers=0, collate_fn=dataset.pad)
+
+
+def predict(model, iterator):
+    """
+    Returns the probabilities of a match and the labels of the pairs, in the order of the iterator.
+    """
+    all_probs = []
+    all_y = []
+    with torch.no_grad():
+        for batch in iterator:
+            x, y = batch
+            logits = model(x)
+            all_probs += logits.softmax(dim=1)[:, 1].cpu().numpy().tolist()
+            all_y += y.cpu().numpy().tolist()
+    return np.asarray(all_probs), np.asarray(all_y)
+
+
+def evaluate(probs, labels, threshold=None):
+    """
+    Returns f1, precision, recall and the threshold, which maximizes the f1 score if it is not given.
+    """
+    if threshold is None:
+        scores = [metrics.f1_score(labels, probs > th, zero_division=0) for th in THRESHOLDS]
+        # the first of the best thresholds, like ditto
+        threshold = float(THRESHOLDS[int(np.argmax(scores))]) if max(scores) > 0 else 0.5
+    predictions = probs > threshold
+    return (metrics.f1_score(labels, predictions, zero_division=0),
+            metrics.precision_score(labels, predictions, zero_division=0),
+            metrics.recall_score(labels, predictions, zero_division=0),
+            threshold)
+
+
+def train(trainset, validset, testset, run_tag, hp, seed=0, checkpoint_dir=None, resume=False):
+    """
+    Trains a DittoModel and returns the model of the epoch with the best validation f1 score, its threshold, the
+    results per epoch (epoch, f1, precision, recall, train_time, valid_time, test_time) on the test set and the
+    training time in seconds. With `checkpoint_dir`, a checkpoint is written after every epoch, from which training
+    continues with `resume`. The training time then includes that of the earlier runs, up to their last checkpoint.
+    """
+    start_time = time.time()
+    train_iter = get_iterator(trainset, hp.batch_size, shuffle=True, seed=seed)
+    valid_iter = get_iterator(validset, hp.batch_size * 16, shuffle=False)
+    test_iter = get_iterator(testset, hp.batch_size * 16, shuffle=False)
+
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    model = DittoModel(device=device, lm=hp.lm, alpha_aug=hp.alpha_aug)
+    model = model.to(device)
+    optimizer = AdamW(model.parameters(), lr=hp.lr)
+
+    amp = None
+    if hp.fp16:
+        from apex import amp
+        model, optimizer = amp.initialize(model, optimizer, opt_level='O2')
+    num_steps = len(train_iter) * hp.n_epochs
+    scheduler = get_linear_schedule_with_warmup(optimizer, num_warmup_steps=0, num_training_steps=num_steps)
+
+    best_dev_f1 = -1.0
+    best_state = None
+    best_threshold = 0.5
+    results_per_epoch = []
+    start_epoch = 0
+    previous_train_time = 0.0
+    checkpoint = load_checkpoint(checkpoint_dir) if checkpoint_dir is not None and resume else None
+    if checkpoint is not None:
+        start_epoch = restore_checkpoint(checkpoint, model=model, optimizer=optimizer, scheduler=scheduler, amp=amp)
+        results_per_epoch = checkpoint['results_per_epoch']
+        best_dev_f1 = checkpoint['extra']['best_dev_f1']
+        best_threshold = checkpoint['extra']['best_threshold']
+        best_state = checkpoint['extra']['best_state']
+        previous_train_time = checkpoint['extra'].get('train_time', 0.0)
+    train_iter.batch_sampler.set_epoch(start_epoch)
+
+    for epoch in range(start_epoch + 1, hp.n_epochs + 1):
+        start = time.time()
+        model.train()
+        train_step(train_iter, model, optimizer, scheduler, hp)
+        train_time = time.time() - start
+
+        model.eval()
+        start = time.time()
+        dev_f1, _, _, threshold = evaluate(*predict(model, valid_iter))
+        valid_time = time.time() - start
+
+        start = time.time()
+        test_f1, test_precision, test_recall, _ = evaluate(*predict(model, test_iter), threshold=threshold)
+        test_time = time.time() - start
+
+        if dev_f1 > best_dev_f1:
+            best_dev_f1 = dev_f1
+            best_threshold = threshold
+            best_state = {name: tensor.detach().cpu().clone() for name, tensor in model.state_dict().items()}
+
+        print(f"epoch {epoch}: dev_f1={dev_f1}, f1={test_f1}, threshold={threshold}, run={run_tag}")
+        results_per_epoch.append([epoch, test_f1, test_precision, test_recall, train_time, valid_time, test_time])
+
+        if checkpoint_dir is not None:
+            save_checkpoint(checkpoint_dir, epoch, results_per_epoch,
+                            extra={'best_dev_f1': best_dev_f1, 'best_threshold': best_threshold, 'best_state': best_state,
+                                   'train_time': previous_train_time + time.time() - start_time},
+                            model=model, optimizer=optimizer, scheduler=scheduler, amp=amp)
+
+    if best_state is not None:
+        model.load_state_dict(best_state)
+    model.eval()
+    return model, best_threshold, results_per_epoch, previous_train_time + time.time() - start_time
@@ -1,53 +1,52 @@
+import io
 import os
 import sys
 
 import pandas as pd
 import numpy as np
 from itertools import product
+from erbench.pairs import load_pairs
+from erbench.tables import write_table
+from erbench.serialization import TAGGED, serialize_pairs
 
 def join_columns (table, columns_to_join=None, separator=' ', prefixes=['tableA_', 'tableB_']):
-    agg_table = pd.DataFrame()
-    for prefix in prefixes:
-
-        if columns_to_join == None:
-            columns = [column for column in table.columns if (column != prefix+'id' and prefix in column)]
-        else:
-            columns = [prefix+column for column in columns_to_join]
-
-        
-        red_table = table.loc[:,columns]
-        red_table = red_table.fillna('')
-        red_table = red_table.astype(str)
-        
-        for column in columns:
-            red_table[column] = f"COL {column.replace(prefix, '')} VAL " + red_table[column] 
-        
-        part_table = red_table.aggregate(separator.join, axis=1)
-        #part_table = part_table.map(lambda x: x.replace('nan', ''))
-        part_table.rename(prefix+'AgValue', inplace=True)
-        
-        agg_table = pd.concat([agg_table,part_table], axis=1)
+    serialized = serialize_pairs(table, TAGGED, columns_to_join, separator, prefixes)
+    agg_table = pd.concat([serialized[prefix] for prefix in prefixes], axis=1)
     name_cols = list(sorted([col for col in table.columns if col.endswith('_name') or col.endswith('_title')]))
     return pd.concat([agg_table, table['label']], axis=1),\
         table[[prefixes[0] + 'id', prefixes[1] + 'id']+name_cols]
 
 
+def to_lines(table):
+    """
+    Returns the lines of the set as ditto reads them from the file written by `table.to_csv`.
+    """
+    text = table.to_csv(sep='\t', header=False, index=False)
+    # universal newlines, like reading the file in text mode
+    return list(io.StringIO(text, newline=None))
+
+
+def serialize_input(source_dir, columns_to_join=None, separator=' ', prefixes=['tableA_', 'tableB_']):
+    """
+    Returns the serialized lines and the ids of the train/valid/test sets, without writing them to files.
+    """
+    lines = {}
+    ids = {}
+    for name in ['train', 'valid', 'test']:
+        table, ids[name] = join_columns(load_pairs(source_dir, name), columns_to_join, separator, prefixes)
+        lines[name] = to_lines(table)
+    return lines, ids
+
+
 def transform_input(source_dir, output_dir, columns_to_join=None, separator=' ', prefixes=['tableA_', 'tableB_']):
-    train_df = pd.read_csv(os.path.join(source_dir, 'train.csv'), encoding_errors='replace')
-    valid_df = pd.read_csv(os.path.join(source_dir, 'valid.csv'), encoding_errors='replace')
-    test_df = pd.read_csv(os.path.join(source_dir, 'test.csv'), encoding_errors='replace')
-    
-    train, train_id = join_columns(train_df, columns_to_join, separator, prefixes)
-    valid, valid_id = join_columns(valid_df, columns_to_join, separator, prefixes)
-    test, test_id = join_columns(test_df, columns_to_join, separator, prefixes)
-    
-    train_file = os.path.join(output_dir, 'train.txt')
-    valid_file = os.path.join(output_dir, 'valid.txt')
-    test_file = os.path.join(output_dir, 'test.txt')
-    train.to_csv(train_file, '\t', header=False, index=False)
-    valid.to_csv(valid_file, '\t', header=False, index=False)
-    test.to_csv(test_file, '\t', header=False, index=False)
-    return train_file, valid_file, test_file, train_id, valid_id, test_id
+    lines, ids = serialize_input(source_dir, columns_to_join, separator, prefixes)
+
+    files = {}
+    for name in ['train', 'valid', 'test']:
+        files[name] = os.path.join(output_dir, name + '.txt')
+        with open(files[name], 'w') as f:
+            f.writelines(lines[name])
+    return files['train'], files['valid'], files['test'], ids['train'], ids['valid'], ids['test']
 
 
 
@@ -65,7 +64,7 @@ def transform_output(scores, threshold, results_per_epoch, ids, labels, train_ti
                                    'label':labels, 'prob_class1':scores[:,1]})
 
     # save candidate pair IDs to predictions.csv
-    predictions_df.to_csv(os.path.join(dest_dir, 'predictions.csv'), index=False)
+    write_table(predictions_df, dest_dir, 'predictions')
 
     # calculate evaluation metrics
     predictions_df['predictions'] = (predictions_df['prob_class1'] > threshold).astype(int)
@@ -81,13 +80,13 @@ def transform_output(scores, threshold, results_per_epoch, ids, labels, train_ti
         precision = 0
         recall = 0
 
-    pd.DataFrame({
+    write_table(pd.DataFrame({
         'f1': [f1],
         'precision': [precision],
         'recall': [recall],
         'train_time': [train_time],
         'eval_time': [eval_time],
-    }).to_csv(os.path.join(dest_dir, 'metrics.csv'), index=False)
+    }), dest_dir, 'metrics')
 
     pd.DataFrame(results_per_epoch,
                  columns=['epoch', 'f1', 'precision', 'recall', 'train_time', 'valid_time', 'test_time']
@@ -10,14 +10,14 @@ import random
 import time
 
 from config import Config
-from data_loader import load_data, DataType
-from data_representation import InputExample
 from optimizer import build_optimizer
 from prediction import predict
 from torch_initializer import initialize_gpu_seed
 from training import train
 from evaluation import Evaluation
-from transform import transform_input, transform_output
+from transform import transform_input, transform_output, load_tokenized_data
+from erbench.timing import PhaseTimer
+from erbench.checkpoint import load_checkpoint, restore_checkpoint, save_checkpoint
 import torch
 
 parser = argparse.ArgumentParser(description='Benchmark a dataset with a method')
@@ -31,6 +31,8 @@ parser.add_argument('-e', '--epochs', type=int, nargs='?', default=5,  # 15.0
                     help='Number of epochs to train the model')
 parser.add_argument('-m', '--model', type=str, nargs='?', default='RoBERTa',
                     help='The language model to use', choices=['BERT', 'RoBERTa', 'DistilBERT', 'XLNet'])
+parser.add_argument('--resume', action='store_true', default=False,
+                    help='Continue training from the checkpoint of the last finished epoch in the output directory')
 args = parser.parse_args()
 
 if args.output is None:
@@ -51,7 +53,9 @@ print("Method input: ", os.listdir(args.input))
 prefix_1 = 'tableA_'
 prefix_2 = 'tableB_'
 columns_to_join = None
-train_df, valid_df, test_df = transform_input(args.input, columns_to_join, ' ', [prefix_1, prefix_2])
+timer = PhaseTimer()
+with timer.phase("load"):
+    train_df, valid_df, test_df = transform_input(args.input, columns_to_join, ' ', [prefix_1, prefix_2])
 print(test_df.columns, train_df.columns)
 
 device, n_gpu = initialize_gpu_seed(args.seed)
@@ -82,48 +86,28 @@ elif model_name == 'albert':
 
 if config_class is not None:
     config = config_class.from_pretrained(model_path)
-    tokenizer = tokenizer_class.from_pretrained(model_path, do_lower_case=True)
     model = model_class.from_pretrained(model_path, config=config)
     model.to(device)
 else:  # SBERT Models
-    tokenizer = tokenizer_class.from_pretrained(model_path)
     model = model_class.from_pretrained(model_path)
     model.to(device)
 
 print("initialized {}-model".format(model_name))
 
 
-train_examples = [InputExample(i, row[prefix_1 + 'AgValue'], row[prefix_2 + 'AgValue'], row['label']) for
-                  i, row in train_df.iterrows()]
+with timer.phase("preprocess"):
+    # the fast tokenizer of the model, with the same vocabulary and lowercasing
+    tokenizer_kwargs = {'do_lower_case': True} if config_class is not None else {}
+    training_data_loader = load_tokenized_data(train_df, model_path, max_seq_length, train_batch_size, True, args.seed,
+                                               [prefix_1, prefix_2], **tokenizer_kwargs)
 
-training_data_loader = load_data(train_examples,
-                                 label_list,
-                                 tokenizer,
-                                 max_seq_length,
-                                 train_batch_size,
-                                 DataType.TRAINING, model_name)
+    valid_data_loader = load_tokenized_data(valid_df, model_path, max_seq_length, train_batch_size, False,
+                                            prefixes=[prefix_1, prefix_2], **tokenizer_kwargs)
+    validation = Evaluation(valid_data_loader, model_name, args.output, len(label_list), model_name)
 
-valid_examples = [InputExample(i, row[prefix_1 + 'AgValue'], row[prefix_2 + 'AgValue'], row['label']) for i, row
-                 in valid_df.iterrows()]
-
-valid_data_loader = load_data(valid_examples,
-                             label_list,
-                             tokenizer,
-                             max_seq_length,
-                             train_batch_size,
-                             DataType.EVALUATION, model_name)
-validation = Evaluation(valid_data_loader, model_name, args.output, len(label_list), model_name)
-
-test_examples = [InputExample(i, row[prefix_1 + 'AgValue'], row[prefix_2 + 'AgValue'], row['label']) for i, row
-                 in test_df.iterrows()]
-
-test_data_loader = load_data(test_examples,
-                             label_list,
-                             tokenizer,
-                             max_seq_length,
-                             train_batch_size,
-                             DataType.TEST, model_name)
-testing = Evaluation(test_data_loader, model_name, args.output, len(label_list), model_name)
+    test_data_loader = load_tokenized_data(test_df, model_path, max_seq_length, train_batch_size, False,
+                                           prefixes=[prefix_1, prefix_2], **tokenizer_kwargs)
+    testing = Evaluation(test_data_loader, model_name, args.output, len(label_list), model_name)
 
 num_train_steps = len(training_data_loader) * args.epochs
 
@@ -134,32 +118,51 @@ optimizer, scheduler = build_optimizer(model,
                                        0,
                                        0.0)
 
-start_time = time.process_time()
-results_per_epoch = train(device,
-                          training_data_loader,
-                          model,
-                          optimizer,
-                          scheduler,
-                          validation,
-                          args.epochs,
-                          1.0,
-                          False,
-                          experiment_name=model_name,
-                          output_dir=args.output,
-                          model_type=model_name,
-                          testing=testing)
-train_time = time.process_time() - start_time
+checkpoint = load_checkpoint(args.output) if args.resume else None
+start_epoch = 0
+results_per_epoch = []
+# the training time of the earlier jobs of a resumed training, up to their last checkpoint
+previous_train_time = 0.0
+if checkpoint is not None:
+    start_epoch = restore_checkpoint(checkpoint, model=model, optimizer=optimizer, scheduler=scheduler)
+    results_per_epoch = checkpoint['results_per_epoch']
+    previous_train_time = checkpoint['extra'].get('train_time', 0.0)
+training_data_loader.batch_sampler.set_epoch(start_epoch)
+
+with timer.phase("train"):
+    start_time = time.time()
+    # one epoch per call, so the state after every epoch can be checkpointed
+    for epoch in range(start_epoch, args.epochs):
+        epoch_results = train(device,
+                              training_data_loader,
+                              model,
+                              optimizer,
+                              scheduler,
+                              validation,
+                              1,
+                              1.0,
+                              False,
+                              experiment_name=model_name,
+                              output_dir=args.output,
+                              model_type=model_name,
+                              testing=testing)
+        for row in epoch_results:
+            results_per_epoch.append([row[0] + epoch] + list(row[1:]))
+        save_checkpoint(args.output, epoch + 1, results_per_epoch,
+                        extra={'train_time': previous_train_time + time.time() - start_time},
+                        model=model, optimizer=optimizer, scheduler=scheduler)
 
 # Testing
 include_token_type_ids = False
 if model_name == 'bert':
     include_token_type_ids = True
 
-start_time = time.process_time()
-classification_report, predictions, logits = predict(model, device, test_data_loader, model_name)#, include_token_type_ids)
-eval_time = time.process_time() - start_time
+with timer.phase("eval"):
+    classification_report, predictions, logits = predict(model, device, test_data_loader, model_name)#, include_token_type_ids)
 
 
 # Step 3. Convert the output into a common format
-transform_output(predictions, logits, test_df, results_per_epoch, train_time, eval_time, args.output)
+with timer.phase("write"):
+    transform_output(predictions, logits, test_df, results_per_epoch, previous_train_time + timer.wall_time("train"), timer.wall_time("eval"), args.output)
+timer.write(args.output)
 print("Final output: ", os.listdir(args.output))
@@ -1,35 +1,28 @@
 import os
 import sys
 
+import numpy as np
 import pandas as pd
 import torch
+from torch.utils.data import DataLoader, SequentialSampler, TensorDataset
+from erbench.pairs import load_pairs
+from erbench.tables import write_table
+from erbench.serialization import PLAIN, serialize_pairs
+from erbench.tokenization import get_lengths, tokenize_pairs
+from erbench.batching import LengthBucketBatchSampler, TrimPadding, get_padding_side
 
 
 def join_columns(table, columns_to_join=None, separator=" ", prefixes=["tableA_", "tableB_"]):
-    agg_table = pd.DataFrame()
-    for prefix in prefixes:
-        if columns_to_join == None:
-            columns = [column for column in table.columns if (column != prefix + "id" and prefix in column)]
-        else:
-            columns = [prefix + column for column in columns_to_join]
-
-        red_table = table.loc[:, columns]
-        red_table = red_table.fillna("")
-        red_table = red_table.astype(str)
-
-        part_table = red_table.aggregate(separator.join, axis=1)
-        # part_table = part_table.map(lambda x: x.replace('nan', ''))
-        part_table.rename(prefix + "AgValue", inplace=True)
-
-        agg_table = pd.concat([agg_table, table[prefix + "id"], part_table], axis=1)
+    serialized = serialize_pairs(table, PLAIN, columns_to_join, separator, prefixes)
+    agg_table = pd.concat([pd.concat([table[prefix + "id"], serialized[prefix]], axis=1) for prefix in prefixes], axis=1)
     name_cols = list(sorted([col for col in table.columns if col.endswith("_name") or col.endswith("_title")]))
     return pd.concat([agg_table, table[["label"] + name_cols]], axis=1)
 
 
 def transform_input(source_dir, columns_to_join=None, separator=" ", prefixes=["tableA_", "tableB_"]):
-    train_df = pd.read_csv(os.path.join(source_dir, "train.csv"), encoding_errors="replace")
-    valid_df = pd.read_csv(os.path.join(source_dir, "valid.csv"), encoding_errors="replace")
-    test_df = pd.read_csv(os.path.join(source_dir, "test.csv"), encoding_errors="replace")
+    train_df = load_pairs(source_dir, "train")
+    valid_df = load_pairs(source_dir, "valid")
+    test_df = load_pairs(source_dir, "test")
 
     train = join_columns(train_df, columns_to_join, separator, prefixes)
     valid = join_columns(valid_df, columns_to_join, separator, prefixes)
@@ -38,6 +31,26 @@ def transform_input(source_dir, columns_to_join=None, separator=" ", prefixes=["
     return train, valid, test
 
 
+def load_tokenized_data(table, model_path, max_seq_length, batch_size, training, seed=0, prefixes=["tableA_", "tableB_"],
+                        **tokenizer_kwargs):
+    """
+    Returns a data loader of the pairs like `load_data`, tokenized with the cache of erbench instead of per example.
+    Every batch is only padded to its longest pair. The training batches consist of pairs of similar lengths,
+    the evaluation batches keep the order of the pairs, which the predictions rely on.
+    """
+    arrays = tokenize_pairs(model_path, table[prefixes[0] + "AgValue"], table[prefixes[1] + "AgValue"],
+                            max_seq_length, PLAIN, **tokenizer_kwargs)
+    tensors = [torch.from_numpy(np.asarray(arrays[field], dtype=np.int64))
+               for field in ["input_ids", "attention_mask", "token_type_ids"]]
+    labels = torch.tensor(table["label"].to_numpy(), dtype=torch.long)
+    data = TensorDataset(*tensors, labels)
+    collate = TrimPadding(mask_index=1, padding_side=get_padding_side(arrays["attention_mask"]))
+    if training:
+        sampler = LengthBucketBatchSampler(get_lengths(arrays), batch_size, shuffle=True, seed=seed)
+        return DataLoader(data, batch_sampler=sampler, collate_fn=collate)
+    return DataLoader(data, sampler=SequentialSampler(data), batch_size=batch_size, collate_fn=collate)
+
+
 def transform_output(predictions_df, logits, test_table, results_per_epoch, train_time, eval_time, dest_dir):
     """
     Transform the output of the method into two common format files, which are stored in the destination directory.
@@ -55,7 +68,7 @@ def transform_output(predictions_df, logits, test_table, results_per_epoch, trai
     name_cols = list(sorted([col for col in test_table.columns if col.endswith("_name") or col.endswith("_title")]))
     predictions_df["tableA_name"] = test_table.loc[predictions_df.index, name_cols[0]]
     predictions_df["tableB_name"] = test_table.loc[predictions_df.index, name_cols[1]]
-    predictions_df[["tableA_id", "tableB_id", "tableA_name", "tableB_name", "label", "prob_class1"]].to_csv(os.path.join(dest_dir, "predictions.csv"), index=False)
+    write_table(predictions_df[["tableA_id", "tableB_id", "tableA_name", "tableB_name", "label", "prob_class1"]], dest_dir, "predictions")
     # get the actual candidates (entity pairs with prediction 1)
     # candidate_ids = predictions_df[predictions_df['predictions'] == 1]
     # candidate_table = test_table.iloc[candidate_ids.index]
@@ -75,7 +88,7 @@ def transform_output(predictions_df, logits, test_table, results_per_epoch, trai
         precision = 0
         recall = 0
 
-    pd.DataFrame(
+    write_table(pd.DataFrame(
         {
             "f1": [f1],
             "precision": [precision],
@@ -83,7 +96,7 @@ def transform_output(predictions_df, logits, test_table, results_per_epoch, trai
             "train_time": [train_time],
             "eval_time": [eval_time],
         }
-    ).to_csv(os.path.join(dest_dir, "metrics.csv"), index=False)
+    ), dest_dir, "metrics")
 
     pd.DataFrame(results_per_epoch, columns=["epoch", "f1", "precision", "recall", "train_time", "valid_time", "test_time"]).to_csv(
         os.path.join(dest_dir, "metrics_per_epoch.csv"), index=False
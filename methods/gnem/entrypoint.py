@@ -6,6 +6,10 @@ import pathtype
 import pandas as pd
 
 from transform import transform_output
+from erbench.timing import PhaseTimer
+from erbench.pairs import load_pairs
+from erbench.tables import read_table
+from erbench.checkpoint import load_checkpoint, restore_checkpoint, save_checkpoint
 import time
 import os
 from train_GNEM import train
@@ -32,6 +36,8 @@ parser.add_argument('-s', '--seed', type=int, nargs='?', default=random.randint(
                     help='The random state used to initialize the algorithms and split dataset')
 parser.add_argument('-m', '--model', type=str, nargs='?', default='BERT',
                     help='The language model to use', choices=['BERT', 'DistilBERT', 'XLNet', 'ALBERT'])
+parser.add_argument('--resume', action='store_true', default=False,
+                    help='Skip training if the checkpoint in the output directory is of a finished training')
 args = parser.parse_args()
 
 if args.output is None:
@@ -53,42 +59,48 @@ print("Input taken from: ", args.input)
 print("Input directory: ", os.listdir(args.input))
 print("Output directory: ", os.listdir(args.output))
 
-train_table = pd.read_csv(os.path.join(args.input, 'train.csv'), encoding_errors='replace')
-val_table = pd.read_csv(os.path.join(args.input, 'valid.csv'), encoding_errors='replace')
-test_table = pd.read_csv(os.path.join(args.input, 'test.csv'), encoding_errors='replace')
-
-red_train_table = train_table.loc[:,['tableA_id', 'tableB_id', 'label']]
-print(red_train_table)
-red_train_table.columns = ['ltable_id', 'rtable_id', 'label']
-red_val_table = val_table.loc[:,['tableA_id', 'tableB_id', 'label']]
-red_val_table.columns = ['ltable_id', 'rtable_id', 'label']
-red_test_table = test_table.loc[:,['tableA_id', 'tableB_id', 'label']]
-red_test_table.columns = ['ltable_id', 'rtable_id', 'label']
-red_train_table.to_csv(os.path.join(args.output, 'train.csv'), index=False)
-red_val_table.to_csv(os.path.join(args.output, 'valid.csv'), index=False)
-red_test_table.to_csv(os.path.join(args.output, 'test.csv'), index=False)
-
-tableA = pd.read_csv(os.path.join(args.input, 'tableA.csv'), encoding_errors='replace')
-str_cols = [col for col in tableA.columns if col != 'id']
-tableA[str_cols] = tableA[str_cols].astype(str)
-tableB = pd.read_csv(os.path.join(args.input, 'tableB.csv'), encoding_errors='replace')
-str_cols = [col for col in tableB.columns if col != 'id']
-tableB[str_cols] = tableB[str_cols].astype(str)
+timer = PhaseTimer()
+with timer.phase("load"):
+    # only the test pairs need their attributes, for the names in the predictions
+    train_table = load_pairs(args.input, 'train', with_attributes=False)
+    val_table = load_pairs(args.input, 'valid', with_attributes=False)
+    test_table = load_pairs(args.input, 'test')
+
+    red_train_table = train_table.loc[:,['tableA_id', 'tableB_id', 'label']]
+    print(red_train_table)
+    red_train_table.columns = ['ltable_id', 'rtable_id', 'label']
+    red_val_table = val_table.loc[:,['tableA_id', 'tableB_id', 'label']]
+    red_val_table.columns = ['ltable_id', 'rtable_id', 'label']
+    red_test_table = test_table.loc[:,['tableA_id', 'tableB_id', 'label']]
+    red_test_table.columns = ['ltable_id', 'rtable_id', 'label']
+    # don't overwrite the split files, the output directory is usually the input directory
+    train_path = os.path.join(args.output, 'gnem_train.csv')
+    val_path = os.path.join(args.output, 'gnem_valid.csv')
+    test_path = os.path.join(args.output, 'gnem_test.csv')
+    red_train_table.to_csv(train_path, index=False)
+    red_val_table.to_csv(val_path, index=False)
+    red_test_table.to_csv(test_path, index=False)
+
+    tableA = read_table(args.input, 'tableA')
+    str_cols = [col for col in tableA.columns if col != 'id']
+    tableA[str_cols] = tableA[str_cols].astype(str)
+    tableB = read_table(args.input, 'tableB')
+    str_cols = [col for col in tableB.columns if col != 'id']
+    tableB[str_cols] = tableB[str_cols].astype(str)
 
 
 useful_field_num = len(tableA.columns)-1
 gcn_dim = 768
 
-val_dataset = MergedMatchingDataset(os.path.join(args.output, 'valid.csv'), tableA, tableB,
-                                    other_path=[os.path.join(args.output, 'train.csv'), os.path.join(args.output, 'test.csv')])
-test_dataset = MergedMatchingDataset(os.path.join(args.output, 'test.csv'), tableA, tableB,
-                                     other_path=[os.path.join(args.output, 'train.csv'), os.path.join(args.output, 'valid.csv')])
-train_dataset = MatchingDataset(os.path.join(args.output, 'train.csv'), tableA, tableB)
+with timer.phase("preprocess"):
+    val_dataset = MergedMatchingDataset(val_path, tableA, tableB, other_path=[train_path, test_path])
+    test_dataset = MergedMatchingDataset(test_path, tableA, tableB, other_path=[train_path, val_path])
+    train_dataset = MatchingDataset(train_path, tableA, tableB)
 
-batch_size = 2
-train_iter = DataLoader(train_dataset, batch_size=batch_size, collate_fn=collate_fn, shuffle=True)
-val_iter = DataLoader(val_dataset, batch_size=batch_size, collate_fn=collate_fn, shuffle=False)
-test_iter = DataLoader(test_dataset, batch_size=batch_size, collate_fn=collate_fn, shuffle=False)
+    batch_size = 2
+    train_iter = DataLoader(train_dataset, batch_size=batch_size, collate_fn=collate_fn, shuffle=True)
+    val_iter = DataLoader(val_dataset, batch_size=batch_size, collate_fn=collate_fn, shuffle=False)
+    test_iter = DataLoader(test_dataset, batch_size=batch_size, collate_fn=collate_fn, shuffle=False)
 
 embedmodel = EmbedModel(useful_field_num=useful_field_num, lm = args.model.lower(), device=device)
 
@@ -135,11 +147,32 @@ neg = 2.0 / (1.0 + pos_neg_ratio)
 criterion = nn.CrossEntropyLoss(weight=torch.Tensor([neg, pos])).to(embedmodel.device)
 log_freq = len(train_iter)//10
 
-start_time = time.process_time()
-f1s, ps, rs, score_dicts, time_m, res_per_epoch = train(train_iter, args.output, logger, tf_logger, model, embedmodel, opt, criterion, args.epochs, test_iter=test_iter, val_iter=val_iter,
-      scheduler=scheduler, log_freq=log_freq, start_epoch=start_epoch, start_f1=start_f1, score_type=['mean'])
-eval_time = time.process_time() - time_m
-train_time =  time_m - start_time
-
-transform_output(score_dicts, f1s, ps, rs, train_time, eval_time, res_per_epoch, args.output, test_table)
+# the epochs, the model selection and the test evaluation all happen inside train() of the fork, so only a finished
+# training is checkpointed, a job interrupted during training starts over
+checkpoint = load_checkpoint(args.output) if args.resume else None
+if checkpoint is not None and checkpoint['epoch'] < args.epochs:
+    print("The checkpoint is not of a finished training, starting over")
+    checkpoint = None
+
+# train() evaluates the test set itself and only returns the CPU time at which training ended
+with timer.phase("train"):
+    if checkpoint is not None:
+        restore_checkpoint(checkpoint, model=model, embedmodel=embedmodel)
+        f1s, ps, rs, score_dicts, train_time, eval_time = [checkpoint['extra'][key] for key in
+                                                           ['f1s', 'ps', 'rs', 'score_dicts', 'train_time', 'eval_time']]
+        res_per_epoch = checkpoint['results_per_epoch']
+    else:
+        start_time = time.process_time()
+        f1s, ps, rs, score_dicts, time_m, res_per_epoch = train(train_iter, args.output, logger, tf_logger, model, embedmodel, opt, criterion, args.epochs, test_iter=test_iter, val_iter=val_iter,
+              scheduler=scheduler, log_freq=log_freq, start_epoch=start_epoch, start_f1=start_f1, score_type=['mean'])
+        eval_time = time.process_time() - time_m
+        train_time =  time_m - start_time
+        save_checkpoint(args.output, args.epochs, res_per_epoch,
+                        extra={'f1s': f1s, 'ps': ps, 'rs': rs, 'score_dicts': score_dicts,
+                               'train_time': train_time, 'eval_time': eval_time},
+                        model=model, embedmodel=embedmodel)
+
+with timer.phase("write"):
+    transform_output(score_dicts, f1s, ps, rs, train_time, eval_time, res_per_epoch, args.output, test_table)
+timer.write(args.output)
 print("Final output: ", os.listdir(args.output))
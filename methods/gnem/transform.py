@@ -1,5 +1,6 @@
 import os
 import pandas as pd
+from erbench.tables import write_table
 
 
 def transform_output(score_dicts, f1s, ps, rs, train_time, eval_time, results_per_epoch, dest_dir, test_table):
@@ -24,18 +25,18 @@ def transform_output(score_dicts, f1s, ps, rs, train_time, eval_time, results_pe
     predictions['tableA_name'] = test_table.loc[predictions.index, name_cols[0]]
     predictions['tableB_name'] = test_table.loc[predictions.index, name_cols[1]]
     predictions.reset_index(inplace=True)
-    predictions.loc[:, ['tableA_id', 'tableB_id',
+    write_table(predictions.loc[:, ['tableA_id', 'tableB_id',
                     'tableA_name', 'tableB_name',
-                    'label', 'prob_class1']].to_csv(os.path.join(dest_dir, 'predictions.csv'), index=False)
+                    'label', 'prob_class1']], dest_dir, 'predictions')
 
     # save evaluation metrics to metrics.csv
-    pd.DataFrame({
+    write_table(pd.DataFrame({
         'f1': f1s,
         'precision': ps,
         'recall': rs,
         'train_time': [train_time] * len(f1s),
         'eval_time': [eval_time] * len(f1s),
-    }).to_csv(os.path.join(dest_dir, 'metrics.csv'), index=False)
+    }), dest_dir, 'metrics')
 
     pd.DataFrame(results_per_epoch,
                  columns=['epoch', 'f1', 'precision', 'recall', 'train_time', 'valid_time', 'test_time']
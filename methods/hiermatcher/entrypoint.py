@@ -2,7 +2,6 @@ import sys
 sys.path.append('fork-deepmatcher')
 
 import argparse
-import time
 import os
 import pathtype
 
@@ -10,6 +9,9 @@ import pandas as pd
 import deepmatcher as dm
 from HierMatcher import *
 from transform import transform_input, transform_output
+from erbench.timing import PhaseTimer
+from erbench.pairs import load_pairs
+from erbench.embeddings import install_fasttext_shim
 
 parser = argparse.ArgumentParser(description='Benchmark a dataset with a method')
 parser.add_argument('input', type=pathtype.Path(readable=True), nargs='?', default='/data',
@@ -32,39 +34,45 @@ if not os.path.isdir(args.output) or not os.access(args.output, os.W_OK):
     print("output folder does not exits or is not writable")
     exit(1)
 
+# use the memory-mapped embedding store instead of the full fastText model, if one was built
+install_fasttext_shim(args.embeddings)
+
 print("Hi, I'm HierMatcher entrypoint!")
 print("Input taken from: ", args.input)
 print("Input directory: ", os.listdir(args.input))
 print("Output directory: ", os.listdir(args.output))
 
-transform_input(args.input, args.output)
+timer = PhaseTimer()
+with timer.phase("load"):
+    transform_input(args.input, args.output)
 
 # Step 1. Convert input data into the format expected by the method
-datasets = dm.data.process(path=args.output,
-                           train="train_dm.csv",
-                           validation='valid_dm.csv',
-                           test="test_dm.csv",
-                           id_attr='id',
-                           label_attr='label',
-                           left_prefix='tableA_',
-                           right_prefix='tableB_',
-                           cache=None,
-                           embeddings_cache_path=args.embeddings)
+with timer.phase("preprocess"):
+    datasets = dm.data.process(path=args.output,
+                               train="train_dm.csv",
+                               validation='valid_dm.csv',
+                               test="test_dm.csv",
+                               id_attr='id',
+                               label_attr='label',
+                               left_prefix='tableA_',
+                               right_prefix='tableB_',
+                               cache=None,
+                               embeddings_cache_path=args.embeddings)
 
 train, valid, test = datasets[0], datasets[1], datasets[2] if len(datasets) >= 3 else None
 
 # Step 2. Run the method
 model = HierMatcher(hidden_size=150, embedding_length=300, manualSeed=args.seed)
 
-start_time = time.process_time()
-_, results_per_epoch = model.run_train(train, valid, test, epochs=args.epochs, batch_size=32, label_smoothing=0.05, pos_weight=1.5)
-train_time = time.process_time() - start_time
+with timer.phase("train"):
+    _, results_per_epoch = model.run_train(train, valid, test, epochs=args.epochs, batch_size=32, label_smoothing=0.05, pos_weight=1.5)
 
-start_time = time.process_time()
-predictions, stats = model.run_eval(test, return_stats=True, return_predictions=True)
-eval_time = time.process_time() - start_time
+with timer.phase("eval"):
+    predictions, stats = model.run_eval(test, return_stats=True, return_predictions=True)
 
 # Step 3. Convert the output into a common format
-test_data =  pd.read_csv(os.path.join(args.input, 'test.csv'), encoding_errors='replace')
-transform_output(predictions, test_data, stats, results_per_epoch, train_time, eval_time, args.output)
+with timer.phase("write"):
+    test_data = load_pairs(args.input, 'test')
+    transform_output(predictions, test_data, stats, results_per_epoch, timer.wall_time("train"), timer.wall_time("eval"), args.output)
+timer.write(args.output)
 print("Final output: ", os.listdir(args.output))
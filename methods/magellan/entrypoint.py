@@ -1,6 +1,5 @@
 import os
 import argparse
-import time
 import random
 
 import pathtype
@@ -8,6 +7,9 @@ import pandas as pd
 import numpy as np
 import py_entitymatching as em
 from transform import transform_output
+from erbench.timing import PhaseTimer
+from erbench.pairs import load_pairs
+from erbench.tables import read_table
 from sklearn.preprocessing import StandardScaler
 
 parser = argparse.ArgumentParser(description='Benchmark a dataset with a method')
@@ -47,15 +49,17 @@ def add_catalog_information(df, tableA, tableB):
 
 # Step 1. Convert input data into the format expected by the method
 print("Method input: ", os.listdir(args.input))
-tableA = pd.read_csv(os.path.join(args.input, 'tableA.csv'), encoding_errors='replace')
-tableB = pd.read_csv(os.path.join(args.input, 'tableB.csv'), encoding_errors='replace')
-train = pd.read_csv(os.path.join(args.input, 'train.csv'), encoding_errors='replace')
-test = pd.read_csv(os.path.join(args.input, 'test.csv'), encoding_errors='replace')
-
-tableA.rename(columns=lambda x: x.split('/')[-1], inplace=True)
-tableB.rename(columns=lambda x: x.split('/')[-1], inplace=True)
-train.rename(columns=lambda x: x.split('/')[-1], inplace=True)
-test.rename(columns=lambda x: x.split('/')[-1], inplace=True)
+timer = PhaseTimer()
+with timer.phase("load"):
+    tableA = read_table(args.input, 'tableA')
+    tableB = read_table(args.input, 'tableB')
+    train = load_pairs(args.input, 'train')
+    test = load_pairs(args.input, 'test')
+
+    tableA.rename(columns=lambda x: x.split('/')[-1], inplace=True)
+    tableB.rename(columns=lambda x: x.split('/')[-1], inplace=True)
+    train.rename(columns=lambda x: x.split('/')[-1], inplace=True)
+    test.rename(columns=lambda x: x.split('/')[-1], inplace=True)
 
 name_cols = list(sorted([col for col in test.columns if col.endswith('_name') or col.endswith('_title')]))
 excl_attributes += name_cols
@@ -87,40 +91,41 @@ elif args.method == "NaiveBayes":
 else:
     raise ValueError("Invalid method")
 
-# get features and remove those containing the id attribute
-F = em.get_features_for_matching(tableA, tableB, validate_inferred_attr_types=False)
-for num, feature in enumerate(F.feature_name):
-    if 'id' not in feature:
-        break
-F = F[num:]
-
-# get feature vectors for the train and test set
-train_f_vectors = em.extract_feature_vecs(train, feature_table=F, attrs_after=excl_attributes)
-test_f_vectors = em.extract_feature_vecs(test, feature_table=F, attrs_after=excl_attributes)
-
-# remove NaN values from the feature vectors by replacing them with the mean
-if not pd.notnull(train_f_vectors).to_numpy().all():
-    train_f_vectors = em.impute_table(train_f_vectors, missing_val=np.nan, exclude_attrs=excl_attributes, strategy='mean')
-
-# fill NaN values in the test feature vectors with the same mean values
-fill_nan_values = train_f_vectors.mean()
-if not pd.notnull(test_f_vectors).to_numpy().all():
-    test_f_vectors.fillna(fill_nan_values, inplace=True)
-
-# Scale the feature vectors (better for some matching methods)
-feature_columns = []
-for column in train_f_vectors.columns:
-    if column not in excl_attributes:
-        feature_columns.append(column)
-
-X_train = train_f_vectors[feature_columns]
-scaler = StandardScaler().fit(X_train)
-X_train_scaled = scaler.transform(X_train)
-train_f_vectors[feature_columns] = X_train_scaled
-
-X_test = test_f_vectors[feature_columns]
-X_test_scaled = scaler.transform(X_test)
-test_f_vectors[feature_columns] = X_test_scaled
+with timer.phase("preprocess"):
+    # get features and remove those containing the id attribute
+    F = em.get_features_for_matching(tableA, tableB, validate_inferred_attr_types=False)
+    for num, feature in enumerate(F.feature_name):
+        if 'id' not in feature:
+            break
+    F = F[num:]
+
+    # get feature vectors for the train and test set
+    train_f_vectors = em.extract_feature_vecs(train, feature_table=F, attrs_after=excl_attributes)
+    test_f_vectors = em.extract_feature_vecs(test, feature_table=F, attrs_after=excl_attributes)
+
+    # remove NaN values from the feature vectors by replacing them with the mean
+    if not pd.notnull(train_f_vectors).to_numpy().all():
+        train_f_vectors = em.impute_table(train_f_vectors, missing_val=np.nan, exclude_attrs=excl_attributes, strategy='mean')
+
+    # fill NaN values in the test feature vectors with the same mean values
+    fill_nan_values = train_f_vectors.mean()
+    if not pd.notnull(test_f_vectors).to_numpy().all():
+        test_f_vectors.fillna(fill_nan_values, inplace=True)
+
+    # Scale the feature vectors (better for some matching methods)
+    feature_columns = []
+    for column in train_f_vectors.columns:
+        if column not in excl_attributes:
+            feature_columns.append(column)
+
+    X_train = train_f_vectors[feature_columns]
+    scaler = StandardScaler().fit(X_train)
+    X_train_scaled = scaler.transform(X_train)
+    train_f_vectors[feature_columns] = X_train_scaled
+
+    X_test = test_f_vectors[feature_columns]
+    X_test_scaled = scaler.transform(X_test)
+    test_f_vectors[feature_columns] = X_test_scaled
 
 # train a matcher
 # result = em.select_matcher([dt, svm, rf, lg, ln, nb], table=train_f_vectors, exclude_attrs=excl_attributes, k=5,
@@ -128,20 +133,20 @@ test_f_vectors[feature_columns] = X_test_scaled
 # print(result['cv_stats'])
 
 
-start_time = time.process_time()
-matcher.fit(table=train_f_vectors, exclude_attrs=excl_attributes, target_attr='label')
-train_time = time.process_time() - start_time
+with timer.phase("train"):
+    matcher.fit(table=train_f_vectors, exclude_attrs=excl_attributes, target_attr='label')
 
-start_time = time.process_time()
-if args.method == "SVM":
-    prediction = matcher.predict(table=test_f_vectors, exclude_attrs=excl_attributes, append=True, return_probs=False,
-                                inplace=False, target_attr='prediction')
-    prediction['probability'] = prediction['prediction'].astype(float)
-else:
-    prediction = matcher.predict(table=test_f_vectors, exclude_attrs=excl_attributes, append=True, return_probs=True,
-                                 inplace=False, target_attr='prediction', probs_attr='probability')
+with timer.phase("eval"):
+    if args.method == "SVM":
+        prediction = matcher.predict(table=test_f_vectors, exclude_attrs=excl_attributes, append=True, return_probs=False,
+                                    inplace=False, target_attr='prediction')
+        prediction['probability'] = prediction['prediction'].astype(float)
+    else:
+        prediction = matcher.predict(table=test_f_vectors, exclude_attrs=excl_attributes, append=True, return_probs=True,
+                                     inplace=False, target_attr='prediction', probs_attr='probability')
 
-eval_time = time.process_time() - start_time
 # Step 3. Convert the output into a common format
-transform_output(prediction, train_time, eval_time, args.output)
+with timer.phase("write"):
+    transform_output(prediction, timer.wall_time("train"), timer.wall_time("eval"), args.output)
+timer.write(args.output)
 print("Final output: ", os.listdir(args.output))
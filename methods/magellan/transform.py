@@ -1,5 +1,6 @@
 import os
 import pandas as pd
+from erbench.tables import write_table
 
 
 def transform_output(predictions_df, train_time, eval_time, dest_dir):
@@ -15,7 +16,7 @@ def transform_output(predictions_df, train_time, eval_time, dest_dir):
     name_cols = list(sorted([col for col in predictions_df.columns if col.endswith('_name') or col.endswith('_title')]))
     predictions_df = predictions_df[['tableA_id', 'tableB_id']+name_cols+['label', 'probability']]
     predictions_df.columns = ['tableA_id', 'tableB_id', 'tableA_name', 'tableB_name', 'label', 'prob_class1']
-    predictions_df.to_csv(os.path.join(dest_dir, 'predictions.csv'), index=False)
+    write_table(predictions_df, dest_dir, 'predictions')
     #candidate_table[['tableA_id', 'tableB_id']].to_csv(os.path.join(dest_dir, 'predictions.csv'), index=False)
 
     # calculate evaluation metrics
@@ -27,12 +28,12 @@ def transform_output(predictions_df, train_time, eval_time, dest_dir):
     precision = true_positives / num_candidates
     f1 = 2 * precision * recall / (precision + recall)
 
-    pd.DataFrame({
+    write_table(pd.DataFrame({
         'f1': [f1],
         'precision': [true_positives / num_candidates],
         'recall': [true_positives / ground_truth],
         'train_time': [train_time],
         'eval_time': [eval_time],
-    }).to_csv(os.path.join(dest_dir, 'metrics.csv'), index=False)
+    }), dest_dir, 'metrics')
 
     return None
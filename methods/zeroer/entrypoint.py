@@ -10,7 +10,7 @@ from transform import transform_input, transform_output
 from data_loading_helper.feature_extraction import gather_features_and_labels, gather_similarity_features
 import numpy as np
 import utils
-import time
+from erbench.timing import PhaseTimer
 
 def add_catalog_information(df, tableA, tableB):
     em.set_ltable(df, tableA)
@@ -51,19 +51,20 @@ excl_attributes = ['_id', 'ltable_id', 'rtable_id', 'label']
 
     
 read_prefixes = ['tableA_', 'tableB_']
-t_input = time.perf_counter()
-dataset, tableA, tableB, GT = transform_input(args.input, read_prefixes, args.full)
-print(f'Input reading done after {time.perf_counter() - t_input:.4f}s')
+timer = PhaseTimer()
+with timer.phase("load"):
+    dataset, tableA, tableB, GT = transform_input(args.input, read_prefixes, args.full)
+print(f'Input reading done after {timer.wall_time("load"):.4f}s')
 
-prep_time = time.perf_counter()
-em.set_key(tableA, 'id')
-em.set_key(tableB, 'id')
-add_catalog_information(dataset, tableA, tableB)
+with timer.phase("preprocess"):
+    em.set_key(tableA, 'id')
+    em.set_key(tableB, 'id')
+    add_catalog_information(dataset, tableA, tableB)
 
-id_df = dataset[["ltable_id", "rtable_id"]]
-cand_features = gather_features_and_labels(tableA, tableB, GT, dataset)
-sim_features = gather_similarity_features(cand_features)
-prep_time = time.perf_counter() - prep_time
+    id_df = dataset[["ltable_id", "rtable_id"]]
+    cand_features = gather_features_and_labels(tableA, tableB, GT, dataset)
+    sim_features = gather_similarity_features(cand_features)
+prep_time = timer.wall_time("preprocess")
 
 print(f'preprocessing done after {prep_time:.4f}s')
 
@@ -74,25 +75,27 @@ true_labels = cand_features.gold.values
 if np.sum(true_labels)==0:
     true_labels = None
 
-start_time = time.perf_counter()
-y_pred, results_per_iteration, model = utils.run_zeroer(sim_features, sim_features_lr,id_dfs,
-                    true_labels , LR_dup_free= True, LR_identical=False, run_trans=True)
-train_time = time.perf_counter() - start_time
+with timer.phase("train"):
+    y_pred, results_per_iteration, model = utils.run_zeroer(sim_features, sim_features_lr,id_dfs,
+                        true_labels , LR_dup_free= True, LR_identical=False, run_trans=True)
+train_time = timer.wall_time("train")
 print(f"Evaluation done after {train_time:.4f}s")
 
-start_time = time.perf_counter()
-y_pred = model.predict_PM(sim_features.values)
+with timer.phase("eval"):
+    y_pred = model.predict_PM(sim_features.values)
 
-ids = id_df.values
-id_tuple_to_index = dict([])
-for i in range(ids.shape[0]):
-    id_tuple_to_index[(ids[i,0],ids[i,1])] = i
-    id_tuple_to_index[(ids[i,1], ids[i,0])] = i
-y_pred = model.enforce_transitivity(y_pred, ids, id_tuple_to_index, None, None, LR_dup_free=True, LR_identical=False)
-eval_time = time.perf_counter() - start_time
+    ids = id_df.values
+    id_tuple_to_index = dict([])
+    for i in range(ids.shape[0]):
+        id_tuple_to_index[(ids[i,0],ids[i,1])] = i
+        id_tuple_to_index[(ids[i,1], ids[i,0])] = i
+    y_pred = model.enforce_transitivity(y_pred, ids, id_tuple_to_index, None, None, LR_dup_free=True, LR_identical=False)
+eval_time = timer.wall_time("eval")
 
 
 pred_df = cand_features.copy()
 pred_df['pred'] = y_pred
 
-transform_output(pred_df, results_per_iteration, train_time, eval_time, prep_time, args.output, dataset)
+with timer.phase("write"):
+    transform_output(pred_df, results_per_iteration, train_time, eval_time, prep_time, args.output, dataset)
+timer.write(args.output)
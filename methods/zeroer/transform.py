@@ -4,15 +4,17 @@ import sys
 import pandas as pd
 import numpy as np
 import utils
+from erbench.pairs import load_pairs
+from erbench.tables import read_table, write_table
 
 
 def transform_input(source_dir, prefixes=['tableA_', 'tableB_'], use_full=True):
     
-    tableA_df = pd.read_csv(os.path.join(source_dir, 'tableA.csv'))
-    tableB_df = pd.read_csv(os.path.join(source_dir, 'tableB.csv'))
-    matches_df = pd.read_csv(os.path.join(source_dir, 'matches.csv'))
+    tableA_df = read_table(source_dir, 'tableA')
+    tableB_df = read_table(source_dir, 'tableB')
+    matches_df = read_table(source_dir, 'matches')
 
-    test_df = pd.read_csv(os.path.join(source_dir, 'test.csv'))
+    test_df = load_pairs(source_dir, 'test')
 
     tableA_df.rename(columns=lambda x: x.split('/')[-1], inplace=True)
     tableB_df.rename(columns=lambda x: x.split('/')[-1], inplace=True)
@@ -20,8 +22,8 @@ def transform_input(source_dir, prefixes=['tableA_', 'tableB_'], use_full=True):
 
     
     if use_full:
-        train_df = pd.read_csv(os.path.join(source_dir, 'train.csv'))
-        valid_df = pd.read_csv(os.path.join(source_dir, 'valid.csv'))
+        train_df = load_pairs(source_dir, 'train')
+        valid_df = load_pairs(source_dir, 'valid')
         train_df.rename(columns=lambda x: x.split('/')[-1], inplace=True)
         valid_df.rename(columns=lambda x: x.split('/')[-1], inplace=True)
 
@@ -69,9 +71,9 @@ def transform_output(predictions, results_per_iteration, train_time, eval_time,
 
     candidate_table = predictions[predictions['prediction'] == 1]
     # save candidate pair IDs to predictions.csv
-    p_table.loc[:, ['tableA_id', 'tableB_id',
+    write_table(p_table.loc[:, ['tableA_id', 'tableB_id',
                     'tableA_name', 'tableB_name',
-                    'label', 'prob_class1']].to_csv(os.path.join(dest_dir, 'predictions.csv'), index=False)
+                    'label', 'prob_class1']], dest_dir, 'predictions')
 
     # calculate evaluation metrics
     num_candidates = candidate_table.shape[0]
@@ -82,14 +84,14 @@ def transform_output(predictions, results_per_iteration, train_time, eval_time,
     precision = true_positives / num_candidates
     f1 = 2 * precision * recall / (precision + recall)
 
-    pd.DataFrame({
+    write_table(pd.DataFrame({
         'f1': [f1],
         'precision': [true_positives / num_candidates],
         'recall': [true_positives / ground_truth],
         'preprocess_time': [preprocess_time],
         'train_time': [train_time],
         'eval_time': [eval_time],
-    }).to_csv(os.path.join(dest_dir, 'metrics.csv'), index=False)
+    }), dest_dir, 'metrics')
 
     pd.DataFrame(results_per_iteration,
                  columns=['iteration', 'f1', 'precision', 'recall', 'iteration_time', 'eval_time']
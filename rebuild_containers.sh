@@ -20,6 +20,11 @@ METHODS=(
 )
 
 COMMAND="apptainer build --force"
+# with --docker, the Docker images are built instead of the Apptainer images
+BUILDER="apptainer"
+if [ "$1" == "--docker" ]; then
+    BUILDER="docker"
+fi
 MAX_PARALLEL=5
 FAILED_LIST=$(mktemp)  # Create a temporary file to track failed tasks
 
@@ -48,7 +53,17 @@ process_container() {
         return 1
     fi
 
-    (cd "$folder" && eval "$COMMAND $DESTINATION/${name}.sif container.def")
+    if [ "$BUILDER" == "docker" ] && [ ! -f "$folder/Dockerfile" ]; then
+        log "Skipped: $name has no Dockerfile"
+        return 0
+    fi
+
+    # both builds run in the folder, the definitions copy the shared erbench package from ../../manager
+    if [ "$BUILDER" == "docker" ]; then
+        (cd "$folder" && docker build -f Dockerfile -t "$name" ../..)
+    else
+        (cd "$folder" && eval "$COMMAND $DESTINATION/${name}.sif container.def")
+    fi
     local result=$?
     
     timestamp=$(date "+%Y-%m-%d %H:%M:%S")
@@ -0,0 +1,112 @@
+"""
+Persistent cache of the tuple embeddings of DeepBlocker, so runs which only differ in K (the recall level) or in the
+seed of the split reuse the trained embeddings and go straight to the vector pairing.
+
+`CachedTupleEmbedding` wraps a tuple embedding model like `AutoEncoderTupleEmbedding`. The embeddings of both tables
+come from the same trained model, so they are cached together: an entry is a directory in `ERBENCH_CACHE_DIR/deepblocker`
+with one `.npy` file per table of the corpus, keyed by the merged texts of both tables (that is the dataset, the
+blocking columns and the cleaning) and the embedding file. It is written atomically (as a temporary directory which is
+renamed) once all tables are embedded, and the embeddings are memory-mapped when they are read. Unless the entry holds
+the embeddings of all tuples of the corpus, the model is trained and both tables are embedded again.
+"""
+import os
+import json
+
+import numpy as np
+
+from erbench.artifacts import get_cache_dir, hash_series, make_key, store_dir
+
+CACHE_VERSION = "3"  # increase when the tuple embedding model or the layout of the entries changes
+META_FILE = "meta.json"  # holds the number of embedded tuples of an entry, its tables may be the same
+
+
+class CachedTupleEmbedding:
+
+    def __init__(self, tuple_embedding_model, embedding_path: str, cols_to_block, clean: bool):
+        self.tuple_embedding_model = tuple_embedding_model
+        self.key_parts = [CACHE_VERSION, type(tuple_embedding_model).__name__, os.path.abspath(embedding_path),
+                          sorted(cols_to_block), clean]
+        self.cache_dir = get_cache_dir("deepblocker")
+        self.all_merged_text = None
+        self.path = None
+        self.cached = {}
+        self.embedded = {}
+        self.num_embedded = 0
+        self.fitted = False
+
+    def preprocess(self, all_merged_text):
+        # training is deferred until it is clear that the embeddings are not cached
+        self.all_merged_text = all_merged_text
+        self.fitted = False
+        self.cached = {}
+        self.embedded = {}
+        self.num_embedded = 0
+        self.path = None
+        if self.cache_dir is None:
+            self._fit()
+            return
+
+        key = make_key("tuple_embedding", *self.key_parts, hash_series(all_merged_text))
+        self.path = os.path.join(self.cache_dir, key)
+        self.cached = _load_entry(self.path, len(all_merged_text))
+        if self.cached:
+            print("Using tuple embeddings from cache", self.path)
+        else:
+            self._fit()
+
+    def get_tuple_embedding(self, list_of_tuples):
+        name = hash_series(list_of_tuples).hex()
+        if not self.fitted:
+            if name not in self.cached:
+                # another table than the cached ones, whose embeddings were already used
+                raise RuntimeError("The tuple embeddings of {} do not contain those of the table".format(self.path))
+            # the vector pairing models take numpy arrays, so the mapped file is used as is
+            return self.cached[name]
+
+        embeddings = self.tuple_embedding_model.get_tuple_embedding(list_of_tuples)
+        self.embedded[name] = _to_numpy(embeddings)
+        self.num_embedded += len(self.embedded[name])
+        if self.path is not None and self.num_embedded == len(self.all_merged_text):
+            _store_entry(self.path, self.embedded, self.num_embedded)
+        return embeddings
+
+    def _fit(self):
+        if not self.fitted:
+            self.tuple_embedding_model.preprocess(self.all_merged_text)
+            self.fitted = True
+
+
+def _load_entry(path: str, num_tuples: int) -> dict:
+    """
+    Returns the embeddings of the tables by the hash of their texts, or an empty dict if the entry does not exist or
+    does not hold the embeddings of all `num_tuples` tuples.
+    """
+    if not os.path.isdir(path):
+        return {}
+    try:
+        with open(os.path.join(path, META_FILE), "r") as f:
+            meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in meta["tables"]}
+    except (OSError, ValueError, KeyError) as e:
+        print("Warning: Failed to read {} from cache: {}".format(path, e))
+        return {}
+    if meta["num_tuples"] != num_tuples:
+        print("Warning: Incomplete tuple embeddings in {}, training the model again".format(path))
+        return {}
+    return arrays
+
+
+def _store_entry(path: str, arrays: dict, num_tuples: int) -> bool:
+    def write(temp_path):
+        for name, array in arrays.items():
+            np.save(os.path.join(temp_path, name + ".npy"), array)
+        with open(os.path.join(temp_path, META_FILE), "w") as f:
+            json.dump({"tables": sorted(arrays), "num_tuples": num_tuples}, f)
+
+    return store_dir(path, write)
+
+
+def _to_numpy(embeddings) -> np.ndarray:
+    if hasattr(embeddings, 'detach'):
+        embeddings = embeddings.detach().cpu().numpy()
+    return np.asarray(embeddings, dtype=np.float32)
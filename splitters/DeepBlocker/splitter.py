@@ -3,7 +3,6 @@ sys.path.append('fork-deepblocker')
 
 import argparse
 import os
-import time
 import random
 import pathtype
 import pandas as pd
@@ -11,54 +10,43 @@ import pandas as pd
 from deep_blocker import DeepBlocker
 from tuple_embedding_models import AutoEncoderTupleEmbedding
 from vector_pairing_models import ExactTopKVectorPairing
-from sklearn.model_selection import train_test_split
-
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import SnowballStemmer
+from vector_pairing import BlockedTopKVectorPairing, IVFTopKVectorPairing
+from embedding_cache import CachedTupleEmbedding
+from erbench.timing import PhaseTimer, FILTERING_PHASES_FILE
+from erbench.splitting import compute_stats, filter_matches, label_pairs, split_candidates, read_dataset, \
+    stringify_attributes, write_dataset, write_filtering_metrics
+from erbench.pairs import format_pairs, write_pairs
+from erbench.cleaning import clean_table
+from erbench.embeddings import install_fasttext_shim
 from settings import dataset_settings
 
 
-def clean_entry(entry, stemmer, stop_words):
-    try:
-        list_entries = word_tokenize(entry)
-    except LookupError:
-        nltk.download('punkt_tab')
-        list_entries = word_tokenize(entry)
-    clean_entries = [stemmer.stem(e) for e in list_entries if e not in stop_words]
-    return ' '.join(clean_entries)
-
-def generate_candidates(embedding_path, tableA_df, tableB_df, matches_df, settings):
-    for col in tableA_df.columns:
-        if col == 'id':
-            continue
-        tableA_df[col] = tableA_df[col].astype(str)
-        tableA_df[col] = tableA_df[col].str.replace('\t', ' ')
-    for col in tableB_df.columns:
-        if col == 'id':
-            continue
-        tableB_df[col] = tableB_df[col].astype(str)
-        tableB_df[col] = tableB_df[col].str.replace('\t', ' ')
-    cols_to_block = list(set(tableA_df.columns.tolist()) & set(tableB_df.columns.tolist()))
+PAIRING_MODELS = {
+    'exact': ExactTopKVectorPairing,
+    'blocked': BlockedTopKVectorPairing,
+    'ivf': IVFTopKVectorPairing,
+}
+
+
+def generate_candidates(embedding_path, tableA_df, tableB_df, matches_df, settings, pairing='exact'):
+    stringify_attributes(tableA_df)
+    stringify_attributes(tableB_df)
+    # sorted, so the merged texts and with them the cached tuple embeddings are the same in every run
+    cols_to_block = sorted(set(tableA_df.columns.tolist()) & set(tableB_df.columns.tolist()))
     cols_to_block.remove('id')
     print("Blocking columns: ", cols_to_block)
 
-    block_A = tableA_df.copy()
-    block_B = tableB_df.copy()
-
     if settings['clean']:
-        try:
-            stop_words = set(stopwords.words('english'))
-        except LookupError:
-            nltk.download('stopwords')
-            stop_words = set(stopwords.words('english'))
-        snowball_stemmer = SnowballStemmer('english')
-        block_A[cols_to_block] = block_A[cols_to_block].map(lambda x: clean_entry(x, snowball_stemmer, stop_words))
-        block_B[cols_to_block] = block_B[cols_to_block].map(lambda x: clean_entry(x, snowball_stemmer, stop_words))
-
-    tuple_embedding_model = AutoEncoderTupleEmbedding(embedding_path=embedding_path)
-    topK_vector_pairing_model = ExactTopKVectorPairing(K=settings['K'])
+        block_A = clean_table(tableA_df, cols_to_block)
+        block_B = clean_table(tableB_df, cols_to_block)
+    else:
+        block_A = tableA_df.copy()
+        block_B = tableB_df.copy()
+
+    # the embeddings only depend on the tables, the blocking columns, the cleaning and the embedding file, not on K
+    tuple_embedding_model = CachedTupleEmbedding(AutoEncoderTupleEmbedding(embedding_path=embedding_path),
+                                                 embedding_path, cols_to_block, settings['clean'])
+    topK_vector_pairing_model = PAIRING_MODELS[pairing](K=settings['K'])
     db = DeepBlocker(tuple_embedding_model, topK_vector_pairing_model)
 
     if settings['reverse']:
@@ -72,42 +60,27 @@ def generate_candidates(embedding_path, tableA_df, tableB_df, matches_df, settin
 
 
     # keep only those true pairs, which were found in blocking
-    golden_set = set(matches_df.itertuples(index=False, name=None))
     pairs_df = candidate_set_df[['tableA_id', 'tableB_id']].copy()
-    pairs_df['label'] = pairs_df.apply(lambda x: (x['tableA_id'], x['tableB_id']) in golden_set, axis=1).astype(int)
+    pairs_df['label'] = label_pairs(pairs_df, matches_df)
 
     ## Sanity Check:
     print(pairs_df['label'].sum()/pairs_df.shape[0], pairs_df['label'].sum()/matches_df.shape[0])
 
-    cand_tableA = tableA_df.add_prefix('tableA_')
-    cand_tableB = tableB_df.add_prefix('tableB_')
+    return format_pairs(tableA_df, tableB_df, pairs_df)
 
-    return pd.concat([
-        (cand_tableA.loc[pairs_df['tableA_id']]).reset_index(drop=True),
-        (cand_tableB.loc[pairs_df['tableB_id']]).reset_index(drop=True),
-        pairs_df['label'].reset_index(drop=True)
-    ], axis=1)
 
-
-def split_input(embedding_path, tableA_df, tableB_df, matches_df, settings, seed=1, valid=True):
-    candidates = generate_candidates(embedding_path, tableA_df, tableB_df, matches_df, settings)
+def split_input(embedding_path, tableA_df, tableB_df, matches_df, settings, seed=1, valid=True, pairing='exact'):
+    candidates = generate_candidates(embedding_path, tableA_df, tableB_df, matches_df, settings, pairing)
 
     # get statistics:
-    num_matches = matches_df.shape[0]
-    num_candidates = candidates.shape[0]
-    tp = candidates['label'].sum()
-    p = tp / num_candidates
-    r = tp / num_matches
-    f1 = 2 * p * r / (p + r)
-    stats = [f1, p, r, num_candidates]
+    stats = compute_stats(candidates['label'].sum(), candidates.shape[0], matches_df.shape[0])
 
     print("Candidates generated: ", candidates.shape[0])
     if valid:
-        train, test_valid = train_test_split(candidates, train_size=0.6, random_state = seed, shuffle = True, stratify = candidates['label'])
-        valid, test = train_test_split(test_valid, train_size=0.5, random_state = seed, shuffle = True, stratify = test_valid['label'])
+        train, valid, test = split_candidates(candidates, seed, valid=True)
         return train, valid, test, stats
 
-    return train_test_split(candidates, train_size=0.75, random_state=seed, shuffle=True, stratify=candidates['label']), stats
+    return split_candidates(candidates, seed, valid=False), stats
 
 
 if __name__ == "__main__":
@@ -122,6 +95,9 @@ if __name__ == "__main__":
                         help='The recall value for the train set')
     parser.add_argument('-s', '--seed', type=int, nargs='?', default=random.randint(0, 4294967295),
                         help='The random state used to initialize the algorithms and split dataset')
+    parser.add_argument('-p', '--pairing', type=str, nargs='?', default='exact', choices=list(PAIRING_MODELS),
+                        help='The top-K vector pairing: exact (brute force), blocked (exact with bounded memory) '
+                             'or ivf (approximate, reports its recall vs. exact)')
     args = parser.parse_args()
 
     if args.output is None:
@@ -132,20 +108,18 @@ if __name__ == "__main__":
         print("output folder does not exits or is not writable")
         exit(1)
 
-    print("Hi, I'm DeepBlocker splitter, I'm doing random split of the input datasets into train and test sets.")
-    tableA_df = pd.read_csv(os.path.join(args.input, 'tableA.csv'), encoding_errors='replace')
-    tableB_df = pd.read_csv(os.path.join(args.input, 'tableB.csv'), encoding_errors='replace')
-    matches_df = pd.read_csv(os.path.join(args.input, 'matches.csv'), encoding_errors='replace')
+    # use the memory-mapped embedding store instead of the full fastText model, if one was built
+    install_fasttext_shim(args.embeddings)
 
-    tableA_df = tableA_df.set_index('id', drop=False)
-    tableB_df = tableB_df.set_index('id', drop=False)
+    print("Hi, I'm DeepBlocker splitter, I'm doing random split of the input datasets into train and test sets.")
+    timer = PhaseTimer()
+    with timer.phase("load"):
+        tableA_df, tableB_df, matches_df = read_dataset(args.input)
 
-    #Remove those pairs from matches, which entries no longer appear in tableA or tableB:
-    A_match_exists = matches_df['tableA_id'].map(lambda x: x in tableA_df.index).astype(bool)
-    B_match_exists = matches_df['tableB_id'].map(lambda x: x in tableB_df.index).astype(bool)
-    matches_df = matches_df[A_match_exists & B_match_exists]
+        #Remove those pairs from matches, which entries no longer appear in tableA or tableB:
+        matches_df = filter_matches(matches_df, tableA_df, tableB_df)
 
-    print("Input tables are:", "A", tableA_df.shape, "B", tableB_df.shape, "Matches", matches_df.shape)
+        print("Input tables are:", "A", tableA_df.shape, "B", tableB_df.shape, "Matches", matches_df.shape)
 
     # get right settings:
     folders = [entry for entry in str(args.input).split('/') if entry != '']
@@ -153,26 +127,17 @@ if __name__ == "__main__":
     dataset = dataset_folder.split('_')[0]
     settings = dataset_settings[args.recall][dataset]
 
-    start_time = time.process_time()
-    train, valid, test, stats = split_input(str(args.embeddings), tableA_df, tableB_df, matches_df, seed=args.seed, settings=settings, valid=True)
-    stop_time = time.process_time()
+    with timer.phase("filter"):
+        train, valid, test, stats = split_input(str(args.embeddings), tableA_df, tableB_df, matches_df, seed=args.seed, settings=settings, valid=True, pairing=args.pairing)
     print("Done! Train size: {}, test size: {}.".format(train.shape[0], test.shape[0]))
 
-    train.to_csv(os.path.join(args.output, "train.csv"), index=False)
-    valid.to_csv(os.path.join(args.output, "valid.csv"), index=False)
-    test.to_csv(os.path.join(args.output, "test.csv"), index=False)
-
-    tableA_df.to_csv(os.path.join(args.output, "tableA.csv"), index=False)
-    tableB_df.to_csv(os.path.join(args.output, "tableB.csv"), index=False)
-    matches_df.to_csv(os.path.join(args.output, "matches.csv"), index=False)
-
-    pd.DataFrame({
-        'f1': [stats[0]],
-        'precision': [stats[1]],
-        'recall': [stats[2]],
-        'filtering_time': [stop_time - start_time],
-        'num_candidates': [stats[3]],
-        'entries_tableA': [tableA_df.shape[0]],
-        'entries_tableB': [tableB_df.shape[0]],
-        'entries_matches': [matches_df.shape[0]],
-    }).to_csv(os.path.join(args.output, 'filtering_metrics.csv'), index=False)
+    with timer.phase("write"):
+        write_pairs(train, args.output, "train")
+        write_pairs(valid, args.output, "valid")
+        write_pairs(test, args.output, "test")
+
+        write_dataset(args.output, tableA_df, tableB_df, matches_df)
+
+        write_filtering_metrics(args.output, stats, timer.wall_time("filter"), tableA_df, tableB_df, matches_df)
+
+    timer.write(args.output, FILTERING_PHASES_FILE)
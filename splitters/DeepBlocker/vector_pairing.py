@@ -0,0 +1,220 @@
+"""
+Top-K vector pairing models for large K, with the same interface as `ExactTopKVectorPairing` of DeepBlocker:
+`index()` the embeddings of one table, `query()` those of the other and get the indices of the K most similar
+indexed tuples per query tuple, as an (n, K) array. Like `ExactTopKVectorPairing`, the similarity is the cosine
+similarity by default (the rows are L2-normalized in `index()` and `query()`), `similarity_measure='dot'` keeps the
+inner product of the raw embeddings.
+
+    blocked: exact search, in blocks of queries with bounded memory, spread over threads
+    ivf:     approximate search over an inverted file index (k-means lists), only the `n_probe` closest lists are scored
+
+Both are plain NumPy, the matrix products run in the multithreaded BLAS and the blocks in a thread pool.
+"""
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+import numpy as np
+
+from vector_pairing_models import ABCVectorPairing
+from erbench.cleaning import get_num_processes
+
+# memory of the score matrix of one block of queries (per thread)
+BLOCK_MEMORY = 256 * 1024 ** 2
+
+
+def to_numpy(embedding_matrix) -> np.ndarray:
+    if hasattr(embedding_matrix, 'detach'):
+        embedding_matrix = embedding_matrix.detach().cpu().numpy()
+    return np.ascontiguousarray(embedding_matrix, dtype=np.float32)
+
+
+def normalize(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalizes the rows, like `torch.nn.functional.normalize`.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def prepare_vectors(embedding_matrix, similarity_measure: str) -> np.ndarray:
+    """
+    Returns the embeddings as float32 array, normalized for `similarity_measure='cosine'`.
+    """
+    if similarity_measure not in ("cosine", "dot"):
+        raise ValueError("Unknown similarity measure {}, expected cosine or dot".format(similarity_measure))
+    vectors = to_numpy(embedding_matrix)
+    return normalize(vectors) if similarity_measure == "cosine" else vectors
+
+
+def top_k(scores: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the scores and column indices of the k highest scores per row, sorted in descending order.
+    """
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+def exact_top_k(queries: np.ndarray, vectors: np.ndarray, k: int, threads: int = 1,
+                block_memory: int = BLOCK_MEMORY) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k inner-product search of every query in `vectors`, the score matrix is computed in blocks of queries.
+    """
+    k = min(k, vectors.shape[0])
+    block_size = max(1, block_memory // (4 * max(1, vectors.shape[0])))
+    scores = np.empty((queries.shape[0], k), dtype=np.float32)
+    indices = np.empty((queries.shape[0], k), dtype=np.int64)
+
+    def search(start):
+        end = min(start + block_size, queries.shape[0])
+        scores[start:end], indices[start:end] = top_k(queries[start:end] @ vectors.T, k)
+
+    with ThreadPoolExecutor(max(1, threads)) as executor:
+        list(executor.map(search, range(0, queries.shape[0], block_size)))
+    return scores, indices
+
+
+def recall_vs_exact(indices: np.ndarray, exact_indices: np.ndarray) -> float:
+    """
+    Returns the share of the exact top-k neighbours which are among the found ones, averaged over the queries.
+    """
+    if exact_indices.size == 0:
+        return 1.0
+    found = sum(len(np.intersect1d(row, exact_row)) for row, exact_row in zip(indices, exact_indices))
+    return found / exact_indices.size
+
+
+class BlockedTopKVectorPairing(ABCVectorPairing):
+    """
+    Exact top-K pairing like `ExactTopKVectorPairing` (same similarity), but it never holds the full score matrix in
+    memory.
+    """
+
+    def __init__(self, K: int, similarity_measure: str = "cosine", threads: Optional[int] = None,
+                 block_memory: int = BLOCK_MEMORY):
+        super().__init__()
+        self.K = K
+        self.similarity_measure = similarity_measure
+        self.threads = threads or get_num_processes()
+        self.block_memory = block_memory
+        self.recall = 1.0
+
+    def index(self, embedding_matrix_for_indexing):
+        self.vectors = self._prepare(embedding_matrix_for_indexing)
+
+    def query(self, embedding_matrix_for_querying) -> np.ndarray:
+        queries = self._prepare(embedding_matrix_for_querying)
+        return exact_top_k(queries, self.vectors, self.K, self.threads, self.block_memory)[1]
+
+    def _prepare(self, embedding_matrix) -> np.ndarray:
+        return prepare_vectors(embedding_matrix, self.similarity_measure)
+
+
+class IVFTopKVectorPairing(ABCVectorPairing):
+    """
+    Approximate top-K pairing over an inverted file index: the indexed vectors are clustered into `n_lists` lists by
+    k-means, and a query is only scored against the vectors of its `n_probe` closest lists (and those of the other
+    queries closest to the same list). `n_probe` is raised so that a query sees about `candidate_factor * K` vectors.
+    Queries which still see fewer than K vectors are searched exactly. After querying, the recall of the found
+    neighbours against the exact ones (same similarity) of `recall_sample` queries is printed and kept in `recall`.
+    """
+
+    def __init__(self, K: int, similarity_measure: str = "cosine", n_lists: Optional[int] = None, n_probe: int = 8,
+                 candidate_factor: float = 4.0, kmeans_iterations: int = 10, recall_sample: int = 1000, seed: int = 1,
+                 threads: Optional[int] = None, block_memory: int = BLOCK_MEMORY):
+        super().__init__()
+        self.K = K
+        self.similarity_measure = similarity_measure
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.candidate_factor = candidate_factor
+        self.kmeans_iterations = kmeans_iterations
+        self.recall_sample = recall_sample
+        self.seed = seed
+        self.threads = threads or get_num_processes()
+        self.block_memory = block_memory
+        self.recall = None  # type: Optional[float]
+
+    def index(self, embedding_matrix_for_indexing):
+        self.vectors = self._prepare(embedding_matrix_for_indexing)
+        n = self.vectors.shape[0]
+        n_lists = self.n_lists or max(1, int(math.sqrt(n)))
+        n_lists = min(n_lists, n)
+
+        rng = np.random.default_rng(self.seed)
+        # k-means on a sample of the vectors, the lists are then filled with all of them
+        sample = self.vectors[rng.choice(n, min(n, 256 * n_lists), replace=False)]
+        self.centroids = sample[rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            assignment = self._assign(sample)
+            for list_id in range(n_lists):
+                members = sample[assignment == list_id]
+                if members.shape[0] > 0:
+                    self.centroids[list_id] = members.mean(axis=0)
+            if self.similarity_measure == "cosine":
+                # spherical k-means, the lists are assigned by the inner product with the centroids
+                self.centroids = normalize(self.centroids)
+
+        assignment = self._assign(self.vectors)
+        order = np.argsort(assignment, kind='stable')
+        self.list_members = np.split(order, np.cumsum(np.bincount(assignment, minlength=n_lists))[:-1])
+
+    def query(self, embedding_matrix_for_querying) -> np.ndarray:
+        queries = self._prepare(embedding_matrix_for_querying)
+        k = min(self.K, self.vectors.shape[0])
+        n_lists = len(self.list_members)
+        average_list_size = self.vectors.shape[0] / n_lists
+        n_probe = min(n_lists, max(self.n_probe, int(math.ceil(self.candidate_factor * k / average_list_size))))
+
+        # the closest lists of every query, the queries are grouped by the closest one
+        _, probes = exact_top_k(queries, self.centroids, n_probe, self.threads, self.block_memory)
+        order = np.argsort(probes[:, 0], kind='stable')
+        groups = np.split(order, np.cumsum(np.bincount(probes[:, 0], minlength=n_lists))[:-1])
+
+        indices = np.full((queries.shape[0], k), -1, dtype=np.int64)
+
+        def search(group):
+            # every query of a group is scored against all lists probed by any of them, which are mostly the same,
+            # so a group needs a single matrix product per block and no merging of per-list results
+            if group.shape[0] == 0:
+                return
+            candidates = np.concatenate([self.list_members[list_id] for list_id in np.unique(probes[group])])
+            if candidates.shape[0] < k:
+                return
+            vectors = self.vectors[candidates]
+            block_size = max(1, self.block_memory // (4 * candidates.shape[0]))
+            for start in range(0, group.shape[0], block_size):
+                rows = group[start:start + block_size]
+                indices[rows] = candidates[top_k(queries[rows] @ vectors.T, k)[1]]
+
+        with ThreadPoolExecutor(max(1, self.threads)) as executor:
+            list(executor.map(search, groups))
+
+        underfilled = np.nonzero((indices < 0).any(axis=1))[0]
+        if underfilled.shape[0] > 0:
+            print("Searching {} queries with fewer than {} candidates exactly".format(underfilled.shape[0], k))
+            indices[underfilled] = exact_top_k(queries[underfilled], self.vectors, k, self.threads, self.block_memory)[1]
+
+        self.recall = self.report_recall(queries, indices, k, n_probe)
+        return indices
+
+    def report_recall(self, queries: np.ndarray, indices: np.ndarray, k: int, n_probe: int) -> float:
+        rng = np.random.default_rng(self.seed)
+        sample = rng.choice(queries.shape[0], min(queries.shape[0], self.recall_sample), replace=False)
+        _, exact_indices = exact_top_k(queries[sample], self.vectors, k, self.threads, self.block_memory)
+        recall = recall_vs_exact(indices[sample], exact_indices)
+        print("Recall of the IVF top-{} pairing vs. exact ({} lists, {} probes, {} sampled queries): {:.4f}".format(
+            k, len(self.list_members), n_probe, sample.shape[0], recall))
+        return recall
+
+    def _prepare(self, embedding_matrix) -> np.ndarray:
+        return prepare_vectors(embedding_matrix, self.similarity_measure)
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return exact_top_k(vectors, self.centroids, 1, self.threads, self.block_memory)[1][:, 0]
@@ -3,48 +3,52 @@ sys.path.append('fork-deepblocker')
 
 import argparse
 import os
-import time
 import random
 import pathtype
 
+import numpy as np
 import pandas as pd
 from pyjedai.joins import TopKJoin
 from pyjedai.datamodel import Data
 from settings import dataset_settings
-from sklearn.model_selection import train_test_split
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk.stem import SnowballStemmer
+from erbench.timing import PhaseTimer, FILTERING_PHASES_FILE
+from erbench.splitting import compute_stats, filter_matches, label_pairs, split_candidates, read_dataset, \
+    stringify_attributes, write_dataset, write_filtering_metrics
+from erbench.pairs import format_pairs, write_pairs
+from erbench.cleaning import clean_table
 
+# largest K of the join of --auto_k, unless the settings or --max_k ask for more
+AUTO_MAX_K = 50
 
-def clean_entry(entry, stemmer, stop_words):
-    list_entries = word_tokenize(entry)
-    clean_entries = [stemmer.stem(e) for e in list_entries if e not in stop_words]
-    return ' '.join(clean_entries)
 
-def generate_candidates(tableA_df, tableB_df, matches_df, settings):
+def get_query_side(settings):
+    """
+    Returns the id column of the records whose K nearest neighbours are searched by the join: `TopKJoin.fit` (without
+    `reverse_order`) indexes dataset_1 and keeps the top-K pairs of every record of dataset_2.
+    """
+    return 'tableA_id' if settings['reverse'] else 'tableB_id'
+
 
+def join_ranked(tableA_df, tableB_df, settings, K):
+    """
+    Runs the top-K join once and returns every found pair (tableA_id, tableB_id) with its similarity score and its
+    rank among the neighbours of its query record, so the candidates of every smaller K are those with rank <= K.
+    """
     ac_tableA = list(tableA_df.columns)
     ac_tableA.remove('id')
     ac_tableB = list(tableB_df.columns)
     ac_tableB.remove('id')
 
-    tableA_df[ac_tableA] = tableA_df[ac_tableA].astype(str)
-    for col in ac_tableA:
-        tableA_df[col] = tableA_df[col].str.replace('\t', ' ')
-    tableB_df[ac_tableB] = tableB_df[ac_tableB].astype(str)
-    for col in ac_tableB:
-        tableB_df[col] = tableB_df[col].str.replace('\t', ' ')
-
-    block_A = tableA_df.copy()
-    block_B = tableB_df.copy()
-    print(block_A['id'], block_B['id'])
+    stringify_attributes(tableA_df)
+    stringify_attributes(tableB_df)
 
     if settings['clean']:
-        stop_words = set(stopwords.words('english'))
-        snowball_stemmer = SnowballStemmer('english')
-        block_A[ac_tableA] = block_A[ac_tableA].map(lambda x: clean_entry(x, snowball_stemmer, stop_words))
-        block_B[ac_tableB] = block_B[ac_tableB].map(lambda x: clean_entry(x, snowball_stemmer, stop_words))
+        block_A = clean_table(tableA_df, ac_tableA)
+        block_B = clean_table(tableB_df, ac_tableB)
+    else:
+        block_A = tableA_df.copy()
+        block_B = tableB_df.copy()
+    print(block_A['id'], block_B['id'])
 
     if settings['reverse']:
         data = Data(
@@ -70,55 +74,93 @@ def generate_candidates(tableA_df, tableB_df, matches_df, settings):
         tokenization = 'qgrams'
     if settings['multiset']:
         tokenization += '_multiset'
-    join = TopKJoin(K = settings['K'], metric = settings['similarity'], tokenization = tokenization, qgrams = settings['QGram'])
+    join = TopKJoin(K = K, metric = settings['similarity'], tokenization = tokenization, qgrams = settings['QGram'])
 
     candidates = join.fit(data)
     candidates_df = join.export_to_df(candidates)
     candidates_df = candidates_df.astype(int)
+    # export_to_df iterates over the edges of the graph in the same order
+    candidates_df['score'] = [weight for _, _, weight in candidates.edges(data='weight')]
+    if candidates_df['score'].isna().any():
+        raise ValueError("The join did not store the similarity scores of the pairs")
+
     if settings['reverse']:
-        candidates_df.columns = ['tableB_id', 'tableA_id']
+        candidates_df.columns = ['tableB_id', 'tableA_id', 'score']
     else:
-        candidates_df.columns = ['tableA_id', 'tableB_id']
+        candidates_df.columns = ['tableA_id', 'tableB_id', 'score']
+
+    # like the join at a smaller K, a pair is kept up to the K-th best score of its query record, ties included,
+    # the pairs stay in the order of the export, which the splits depend on
+    query_side = get_query_side(settings)
+    candidates_df['rank'] = candidates_df.groupby(query_side)['score'].rank(method='min', ascending=False).astype(int)
+    return candidates_df.reset_index(drop=True)
+
 
+def find_k(ranked_df, num_matches, recall):
+    """
+    Returns the smallest K whose candidates reach the recall and the recall of that K,
+    or the largest K of the ranked pairs and its recall, if none does. `ranked_df` has to be labelled.
+    """
+    match_ranks = np.sort(ranked_df.loc[ranked_df['label'] == 1, 'rank'].to_numpy())
+    needed = int(np.ceil(recall * num_matches - 1e-9))
+    if needed == 0:
+        return 1, float((match_ranks <= 1).sum() / num_matches) if num_matches else 0.0
+    if needed > match_ranks.shape[0]:
+        return int(ranked_df['rank'].max()), float(match_ranks.shape[0] / num_matches)
+    K = int(match_ranks[needed - 1])
+    return K, float((match_ranks <= K).sum() / num_matches)
+
+
+def truncate(ranked_df, K):
+    return ranked_df.loc[ranked_df['rank'] <= K, ['tableA_id', 'tableB_id', 'label']].reset_index(drop=True)
+
+
+def generate_candidates(tableA_df, tableB_df, matches_df, settings):
+    ranked_df = join_ranked(tableA_df, tableB_df, settings, settings['K'])
+    ranked_df['label'] = label_pairs(ranked_df, matches_df)
+    return get_candidates(tableA_df, tableB_df, matches_df, ranked_df, settings['K'])
+
+
+def get_candidates(tableA_df, tableB_df, matches_df, ranked_df, K):
     #only keeps those true pairs, which were found in blocking
-    golden_set = set(matches_df.itertuples(index=False, name=None))
-    pairs_df = candidates_df
-    pairs_df['label'] = pairs_df.apply(lambda x: (x['tableA_id'], x['tableB_id']) in golden_set, axis=1).astype(int)
+    pairs_df = truncate(ranked_df, K)
 
     ## Sanity Check:
     print(pairs_df['label'].sum() / pairs_df.shape[0], pairs_df['label'].sum() / matches_df.shape[0])
 
-    cand_tableA = tableA_df.add_prefix('tableA_')
-    cand_tableB = tableB_df.add_prefix('tableB_')
-
-    return pd.concat([
-        (cand_tableA.loc[pairs_df['tableA_id']]).reset_index(drop=True),
-        (cand_tableB.loc[pairs_df['tableB_id']]).reset_index(drop=True),
-        pairs_df['label'].reset_index(drop=True)
-    ], axis=1)
+    return format_pairs(tableA_df, tableB_df, pairs_df)
 
 
-def split_input(tableA_df, tableB_df, matches_df, settings, seed = 1, valid=True):
-    candidates = generate_candidates(tableA_df, tableB_df, matches_df, settings)
-
+def split_candidates_with_stats(candidates, matches_df, seed = 1, valid=True):
     #get statistics:
-    num_matches = matches_df.shape[0]
-    num_candidates = candidates.shape[0]
-    tp = candidates['label'].sum()
-    p = tp / num_candidates
-    r = tp / num_matches
-    f1 = 2 * p * r / (p + r)
-    stats = [f1, p, r, num_candidates]
+    stats = compute_stats(candidates['label'].sum(), candidates.shape[0], matches_df.shape[0])
 
     print("Candidates generated: ", candidates.shape[0])
     if valid:
-        train, test_valid = train_test_split(candidates, train_size=0.6, random_state=seed, shuffle=True,
-                                             stratify=candidates['label'])
-        valid, test = train_test_split(test_valid, train_size=0.5, random_state=seed, shuffle=True,
-                                       stratify=test_valid['label'])
+        train, valid, test = split_candidates(candidates, seed, valid=True)
         return train, valid, test, stats
 
-    return train_test_split(candidates, train_size=0.75, random_state=seed, shuffle=True, stratify=candidates['label']), stats
+    return split_candidates(candidates, seed, valid=False), stats
+
+
+def split_input(tableA_df, tableB_df, matches_df, settings, seed = 1, valid=True):
+    candidates = generate_candidates(tableA_df, tableB_df, matches_df, settings)
+    return split_candidates_with_stats(candidates, matches_df, seed, valid)
+
+
+def same_join(settings, other):
+    return all(settings[key] == other[key] for key in settings if key != 'K')
+
+
+def write_split(output, train, valid, test, stats, filtering_time, tableA_df, tableB_df, matches_df):
+    os.makedirs(output, exist_ok=True)
+    write_pairs(train, output, "train")
+    write_pairs(valid, output, "valid")
+    write_pairs(test, output, "test")
+
+    write_dataset(output, tableA_df, tableB_df, matches_df)
+
+    write_filtering_metrics(output, stats, filtering_time, tableA_df, tableB_df, matches_df)
 
 
 if __name__ == "__main__":
@@ -133,6 +175,14 @@ if __name__ == "__main__":
                         help='The random state used to initialize the algorithms and split dataset')
     parser.add_argument('-d', '--default', action='store_true', default=False,
                         help='use the default configuration for kNN-Join')
+    parser.add_argument('-a', '--auto_k', action='store_true', default=False,
+                        help='use the smallest K which reaches the recall, found with a single join at --max_k')
+    parser.add_argument('-m', '--max_k', type=int, nargs='?',
+                        help='K of the single join of --auto_k and --sweep (by default the largest K of the settings, '
+                             'at least {} with --auto_k)'.format(AUTO_MAX_K))
+    parser.add_argument('--sweep', action='store_true', default=False,
+                        help='also write the splits of the other recall levels, whose settings only differ in K, '
+                             'to <output>/recall_<level>, all from a single join')
     args = parser.parse_args()
 
     if args.output is None:
@@ -144,19 +194,14 @@ if __name__ == "__main__":
         exit(1)
 
     print("Hi, I'm KNN-Join splitter, I'm splitting the candidates of KNN-Join into train and test sets.")
-    tableA_df = pd.read_csv(os.path.join(args.input, 'tableA.csv'), encoding_errors='replace')
-    tableB_df = pd.read_csv(os.path.join(args.input, 'tableB.csv'), encoding_errors='replace')
-    matches_df = pd.read_csv(os.path.join(args.input, 'matches.csv'), encoding_errors='replace')
-
-    tableA_df = tableA_df.set_index('id', drop=False)
-    tableB_df = tableB_df.set_index('id', drop=False)
+    timer = PhaseTimer()
+    with timer.phase("load"):
+        tableA_df, tableB_df, matches_df = read_dataset(args.input)
 
-    #Remove those pairs from matches, which entries no longer appear in tableA or tableB:
-    A_match_exists = matches_df['tableA_id'].map(lambda x: x in tableA_df['id']).astype(bool)
-    B_match_exists = matches_df['tableB_id'].map(lambda x: x in tableB_df['id']).astype(bool)
-    matches_df = matches_df[A_match_exists & B_match_exists]
+        #Remove those pairs from matches, which entries no longer appear in tableA or tableB:
+        matches_df = filter_matches(matches_df, tableA_df, tableB_df)
 
-    print("Input tables are:", "A", tableA_df.shape, "B", tableB_df.shape, "Matches", matches_df.shape)
+        print("Input tables are:", "A", tableA_df.shape, "B", tableB_df.shape, "Matches", matches_df.shape)
 
     #get right settings:
     folders =[entry for entry in str(args.input).split('/') if entry != '']
@@ -171,27 +216,39 @@ if __name__ == "__main__":
         settings = dataset_settings[args.recall][dataset]
 
 
-    start_time = time.process_time()
-    train, valid, test, stats = split_input(tableA_df, tableB_df, matches_df,
-                                     seed=args.seed, settings=settings, valid=True)
-    stop_time = time.process_time()
+    splits = {}
+    with timer.phase("filter"):
+        if args.auto_k or args.sweep:
+            # one join at the largest K, the candidates of every smaller K are the neighbours up to that rank
+            levels = {args.recall: settings}
+            if args.sweep and not args.default:
+                levels.update({recall: level_settings[dataset] for recall, level_settings in dataset_settings.items()
+                               if same_join(settings, level_settings[dataset])})
+            max_k = args.max_k or max(level['K'] for level in levels.values())
+            if args.auto_k and not args.max_k:
+                max_k = max(max_k, AUTO_MAX_K)
+
+            ranked_df = join_ranked(tableA_df, tableB_df, settings, max_k)
+            ranked_df['label'] = label_pairs(ranked_df, matches_df)
+            for recall, level in sorted(levels.items()):
+                K = level['K']
+                if args.auto_k:
+                    K, reached = find_k(ranked_df, matches_df.shape[0], recall)
+                    print("Smallest K reaching recall {}: {} (recall {:.4f}, max K {})".format(recall, K, reached, max_k))
+                candidates = get_candidates(tableA_df, tableB_df, matches_df, ranked_df, min(K, max_k))
+                splits[recall] = split_candidates_with_stats(candidates, matches_df, seed=args.seed, valid=True)
+        else:
+            splits[args.recall] = split_input(tableA_df, tableB_df, matches_df,
+                                              seed=args.seed, settings=settings, valid=True)
+    train, valid, test, stats = splits[args.recall]
     print("Done! Train size: {}, test size: {}.".format(train.shape[0], test.shape[0]))
 
-    train.to_csv(os.path.join(args.output, "train.csv"), index=False)
-    valid.to_csv(os.path.join(args.output, "valid.csv"), index=False)
-    test.to_csv(os.path.join(args.output, "test.csv"), index=False)
-
-    tableA_df.to_csv(os.path.join(args.output, "tableA.csv"), index=False)
-    tableB_df.to_csv(os.path.join(args.output, "tableB.csv"), index=False)
-    matches_df.to_csv(os.path.join(args.output, "matches.csv"), index=False)
-
-    pd.DataFrame({
-        'f1': [stats[0]],
-        'precision': [stats[1]],
-        'recall': [stats[2]],
-        'filtering_time': [stop_time - start_time],
-        'num_candidates': [stats[3]],
-        'entries_tableA': [tableA_df.shape[0]],
-        'entries_tableB': [tableB_df.shape[0]],
-        'entries_matches': [matches_df.shape[0]],
-    }).to_csv(os.path.join(args.output, 'filtering_metrics.csv'), index=False)
+    with timer.phase("write"):
+        write_split(args.output, train, valid, test, stats, timer.wall_time("filter"), tableA_df, tableB_df, matches_df)
+
+        for recall, (train, valid, test, stats) in splits.items():
+            if recall != args.recall:
+                write_split(os.path.join(args.output, "recall_{}".format(recall)), train, valid, test, stats,
+                            timer.wall_time("filter"), tableA_df, tableB_df, matches_df)
+
+    timer.write(args.output, FILTERING_PHASES_FILE)
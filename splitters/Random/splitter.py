@@ -1,33 +1,118 @@
 import argparse
-import time
 import os
 import random
 import pathtype
 import pandas as pd
 import numpy as np
 
-from itertools import product
+from itertools import chain
 from sklearn.model_selection import train_test_split
+from erbench.timing import PhaseTimer, FILTERING_PHASES_FILE
+from erbench.splitting import compute_stats, encode_pairs, filter_matches, read_dataset, split_candidates, \
+    stringify_attributes, write_dataset, write_filtering_metrics
+from erbench.pairs import ID_COLUMNS, IDS_LAYOUT, PairsWriter, get_pairs_layout, write_pairs
 
 
-def generate_candidates(tableA_df, tableB_df, matches_df, recall, neg_pairs_ratio, seed):
+def encode_matches(a_ids, b_ids, matches_df):
+    """
+    Returns the sorted int64 keys `a_pos * len(b_ids) + b_pos` of the matching pairs.
+    """
+    return np.unique(encode_pairs(matches_df['tableA_id'], matches_df['tableB_id'], pd.Index(a_ids), pd.Index(b_ids)))
 
-    ac_tableA = list(tableA_df.columns)
-    ac_tableA.remove('id')
-    ac_tableB = list(tableB_df.columns)
-    ac_tableB.remove('id')
 
-    tableA_df[ac_tableA] = tableA_df[ac_tableA].astype(str)
-    for col in ac_tableA:
-        tableA_df[col] = tableA_df[col].str.replace('\t', ' ')
-    tableB_df[ac_tableB] = tableB_df[ac_tableB].astype(str)
-    for col in ac_tableB:
-        tableB_df[col] = tableB_df[col].str.replace('\t', ' ')
+def iter_complement_blocks(a_ids, b_ids, matches_df, block_pairs=1000000):
+    """
+    Yields all non-matching pairs (a_id, b_id) of the cross product, for blocks of table A
+    with about `block_pairs` pairs each, so the cross product never has to be kept in memory.
+    """
+    num_b = len(b_ids)
+    a_ids, b_ids = np.asarray(a_ids), np.asarray(b_ids)
+    golden_keys = encode_matches(a_ids, b_ids, matches_df)
+    block_size = max(1, block_pairs // max(num_b, 1))
+
+    for start in range(0, len(a_ids), block_size):
+        end = min(start + block_size, len(a_ids))
+        keys = np.arange(start * num_b, end * num_b, dtype=np.int64)
+        # the matches of this block are a contiguous range of the sorted golden keys
+        lo, hi = np.searchsorted(golden_keys, [start * num_b, end * num_b])
+        keys = keys[~np.isin(keys, golden_keys[lo:hi], assume_unique=True)]
+        yield np.column_stack([a_ids[keys // num_b], b_ids[keys % num_b]])
+
+
+def sample_negative_pairs(a_ids, b_ids, matches_df, limit, seed, keep_order=True, batch_factor=1.1):
+    """
+    Samples `limit` distinct pairs of (a_id, b_id) which are not in `matches_df`.
+
+    The pairs are drawn from the same random stream as the original sampler: `limit` IDs of table A, then `limit` IDs
+    of table B, then pairs for the shortfall. The shortfall is drawn in batches, pairs are encoded as int64 keys
+    `a_pos * len(b_ids) + b_pos` and matches and duplicates are removed with isin/duplicated on the keys.
+    With `keep_order`, the pairs are returned in the iteration order of the set the original sampler built, so the
+    sample is identical for a seed. Building that set dominates the runtime of large samples, without `keep_order`
+    the same pairs are returned in the order they were drawn.
+    """
+    a_ids, b_ids = np.asarray(a_ids), np.asarray(b_ids)
+    a_index, b_index = pd.Index(pd.unique(a_ids)), pd.Index(pd.unique(b_ids))
+    golden_keys = encode_pairs(matches_df['tableA_id'], matches_df['tableB_id'], a_index, b_index)
+
+    rng = np.random.default_rng(seed)
+    a_id = rng.choice(a_ids, size=limit)
+    b_id = rng.choice(b_ids, size=limit)
+
+    keys = encode_pairs(a_id, b_id, a_index, b_index)
+    first = np.flatnonzero(~pd.Index(keys).duplicated())
+    negative = first[~pd.Index(keys[first]).isin(golden_keys)]
+    taken = keys[negative]
+    sample_a, sample_b = [a_id[negative]], [b_id[negative]]
+
+    skip_counter = 0
+    missing = limit - len(negative)
+    while missing > 0:
+        size = int(missing * batch_factor) + 16
+        # rng.choice(ids) draws ids[rng.integers(0, len(ids))], so drawing the positions of a batch of pairs at once
+        # continues the stream like drawing the pairs one by one
+        positions = rng.integers(0, np.tile([len(a_ids), len(b_ids)], size))
+        a_batch, b_batch = a_ids[positions[0::2]], b_ids[positions[1::2]]
+        batch = pd.Index(encode_pairs(a_batch, b_batch, a_index, b_index))
+
+        # a pair is added if it is no match, not in the sample yet and its first draw in the batch
+        added = np.flatnonzero(~batch.duplicated() & ~batch.isin(golden_keys) & ~batch.isin(taken))[:missing]
+        drawn = added[-1] + 1 if len(added) == missing else size
+        skip_counter += drawn - len(added)
+        assert skip_counter < limit * 1.5, "Too many pairs skipped, please check the number of negatives requested"
+
+        taken = np.concatenate([taken, batch.to_numpy()[added]])
+        sample_a.append(a_batch[added])
+        sample_b.append(b_batch[added])
+        missing -= len(added)
+
+    if not keep_order:
+        return np.column_stack([np.concatenate(sample_a), np.concatenate(sample_b)])
+
+    # adding the first draw of every pair in the order of drawing fills the set like adding all pairs, then the set
+    # operations of the original sampler follow: the difference with the matches and adding the shortfall in order
+    golden_set = set(zip(matches_df['tableA_id'].tolist(), matches_df['tableB_id'].tolist()))
+    neg_ids = set(zip(a_id[first].tolist(), b_id[first].tolist())) - golden_set
+    for a_added, b_added in zip(sample_a[1:], sample_b[1:]):
+        neg_ids.update(zip(a_added.tolist(), b_added.tolist()))
+
+    if a_ids.dtype.kind in 'iu' and b_ids.dtype.kind in 'iu':
+        # much faster than np.array of the list of tuples, which gives the same array
+        dtype = np.result_type(a_ids.dtype, b_ids.dtype, np.int64)
+        return np.fromiter(chain.from_iterable(neg_ids), dtype=dtype, count=2 * len(neg_ids)).reshape(-1, 2)
+    return np.array(list(neg_ids))
+
+
+def prepare_tables(tableA_df, tableB_df):
+    stringify_attributes(tableA_df)
+    stringify_attributes(tableB_df)
 
     # rename columns of tableA and tableB for an easier joining of DataFrames
     cand_tableA = tableA_df.add_prefix('tableA_')
     cand_tableB = tableB_df.add_prefix('tableB_')
+    return cand_tableA, cand_tableB
 
+
+def generate_positive_pairs(cand_tableA, cand_tableB, matches_df, recall, seed):
     # create table of matching pairs, which contains all attributes
     red_matches = matches_df.sample(frac=recall, random_state=seed, axis=0, replace=False)
     pos_pairs = pd.concat([
@@ -37,73 +122,94 @@ def generate_candidates(tableA_df, tableB_df, matches_df, recall, neg_pairs_rati
 
     assert np.array_equal(matches_df.loc[red_matches.index,:].to_numpy(), pos_pairs.loc[:, ['tableA_id', 'tableB_id']].to_numpy()), \
         "Positive pair creation failed, pairs not identical with matches.csv"
+    pos_pairs['label'] = 1
+    if get_pairs_layout() == IDS_LAYOUT:
+        return pos_pairs[ID_COLUMNS + ['label']]
+    return pos_pairs
 
-    # create table of (randomly sampled) non-matching pairs, again containing all necessary attributes
-    golden_set = set(matches_df.itertuples(index=False, name=None))
 
-    if neg_pairs_ratio == -1:
-        full_pairs = set(tuple(pair for pair in product(tableA_df['id'], tableB_df['id'])))
-        neg_tuples = full_pairs - golden_set
-        neg_ids = np.array(list(neg_tuples))
-    else:
-        neg_pairs_limit = int(neg_pairs_ratio * len(golden_set) * recall)
-        rng = np.random.default_rng(seed)
-        skip_counter = 0
-        a_id = rng.choice(tableA_df['id'].to_numpy(), size=(neg_pairs_limit))
-        b_id = rng.choice(tableB_df['id'].to_numpy(), size=(neg_pairs_limit))
-        neg_ids = set(zip(a_id, b_id))
-        neg_ids = neg_ids - golden_set
-        num_neg_pairs = len(neg_ids)
-
-        while num_neg_pairs < neg_pairs_limit:
-            assert skip_counter < neg_pairs_limit * 1.5, "Too many pairs skipped, please check the number of negatives requested"
-            a_id = rng.choice(tableA_df['id'].to_numpy())
-            b_id = rng.choice(tableB_df['id'].to_numpy())
-
-            if (a_id, b_id) in golden_set or (a_id, b_id) in neg_ids:
-                skip_counter += 1
-                continue
-            neg_ids.add((a_id, b_id))
-            num_neg_pairs += 1
-        neg_ids = np.array(list(neg_ids))
+def generate_negative_pairs(cand_tableA, cand_tableB, neg_ids):
+    if get_pairs_layout() == IDS_LAYOUT:
+        return pd.DataFrame({'tableA_id': neg_ids[:, 0], 'tableB_id': neg_ids[:, 1], 'label': 0})
 
     neg_pairs = pd.concat([
         (cand_tableA.loc[neg_ids[:, 0]]).reset_index(drop=True),
         (cand_tableB.loc[neg_ids[:, 1]]).reset_index(drop=True)
     ], axis=1)
-
-    pos_pairs['label'] = 1
     neg_pairs['label'] = 0
+    return neg_pairs
+
+
+def generate_candidates(tableA_df, tableB_df, matches_df, recall, neg_pairs_ratio, seed, keep_order=True):
+    cand_tableA, cand_tableB = prepare_tables(tableA_df, tableB_df)
+    pos_pairs = generate_positive_pairs(cand_tableA, cand_tableB, matches_df, recall, seed)
+
+    # create table of (randomly sampled) non-matching pairs, again containing all necessary attributes
+    if neg_pairs_ratio == -1:
+        neg_ids = np.concatenate(list(iter_complement_blocks(tableA_df['id'].unique(), tableB_df['id'].unique(), matches_df)))
+    else:
+        neg_pairs_limit = int(neg_pairs_ratio * matches_df.shape[0] * recall)
+        neg_ids = sample_negative_pairs(tableA_df['id'].to_numpy(), tableB_df['id'].to_numpy(), matches_df,
+                                        neg_pairs_limit, seed, keep_order=keep_order)
+
+    neg_pairs = generate_negative_pairs(cand_tableA, cand_tableB, neg_ids)
 
     # join the matching and non-matching pairs to a large table
     pairs = pd.concat([pos_pairs, neg_pairs]).reset_index(drop=True)
     return pairs
 
-def split_input(tableA_df, tableB_df, matches_df, recall, neg_pairs_ratio, seed, valid=True):
+def split_input(tableA_df, tableB_df, matches_df, recall, neg_pairs_ratio, seed, valid=True, keep_order=True):
     candidates = generate_candidates(tableA_df, tableB_df, matches_df, recall=recall,
-                                     neg_pairs_ratio=neg_pairs_ratio, seed=seed)
+                                     neg_pairs_ratio=neg_pairs_ratio, seed=seed, keep_order=keep_order)
 
     # get statistics:
-    num_matches = matches_df.shape[0]
-    num_candidates = candidates.shape[0]
-    tp = candidates['label'].sum()
-    p = tp / num_candidates
-    r = tp / num_matches
-    f1 = 2 * p * r / (p + r)
-    stats = [f1, p, r, num_candidates]
+    stats = compute_stats(candidates['label'].sum(), candidates.shape[0], matches_df.shape[0])
 
     print("Candidates generated: ", candidates.shape[0])
     if valid:
-        train, test_valid = train_test_split(candidates, train_size=0.6, random_state=seed, shuffle=True,
-                                             stratify=candidates['label'])
-        valid, test = train_test_split(test_valid, train_size=0.5, random_state=seed, shuffle=True,
-                                       stratify=test_valid['label'])
-
+        train, valid, test = split_candidates(candidates, seed, valid=True)
         return train, valid, test, stats
-    train, test = train_test_split(candidates, train_size=0.75,
-                                   random_state=seed, shuffle=True, stratify=candidates['label'])
+    train, test = split_candidates(candidates, seed, valid=False)
     return train, test, stats
 
+
+def stream_split(tableA_df, tableB_df, matches_df, recall, seed, output, block_pairs=1000000):
+    """
+    Writes train/valid/test with all non-matching pairs (`neg_pairs_ratio == -1`) without materializing the cross product.
+
+    The positive pairs are split like in `split_input`. The negatives are generated per block of table A, shuffled and
+    appended to the split files, every block keeps the 60/20/20 proportions of the negatives written so far exact.
+    Returns the sizes of the splits and the statistics.
+    """
+    cand_tableA, cand_tableB = prepare_tables(tableA_df, tableB_df)
+    pos_pairs = generate_positive_pairs(cand_tableA, cand_tableB, matches_df, recall, seed)
+    pos_train, pos_test_valid = train_test_split(pos_pairs, train_size=0.6, random_state=seed, shuffle=True)
+    pos_valid, pos_test = train_test_split(pos_test_valid, train_size=0.5, random_state=seed, shuffle=True)
+
+    writers = [PairsWriter(output, name) for name in ["train", "valid", "test"]]
+    for writer, split in zip(writers, [pos_train, pos_valid, pos_test]):
+        writer.write(split)
+    sizes = [pos_train.shape[0], pos_valid.shape[0], pos_test.shape[0]]
+
+    rng = np.random.default_rng(seed)
+    num_negatives = 0
+    for neg_ids in iter_complement_blocks(tableA_df['id'].unique(), tableB_df['id'].unique(), matches_df, block_pairs):
+        neg_pairs = generate_negative_pairs(cand_tableA, cand_tableB, neg_ids[rng.permutation(len(neg_ids))])
+        start, num_negatives = num_negatives, num_negatives + len(neg_pairs)
+        cuts = [int(0.6 * num_negatives) - int(0.6 * start), int(0.8 * num_negatives) - int(0.8 * start)]
+        for i, (writer, split) in enumerate(zip(writers, [neg_pairs.iloc[:cuts[0]], neg_pairs.iloc[cuts[0]:cuts[1]], neg_pairs.iloc[cuts[1]:]])):
+            writer.write(split)
+            sizes[i] += split.shape[0]
+    for writer in writers:
+        writer.close()
+
+    # get statistics:
+    stats = compute_stats(pos_pairs.shape[0], pos_pairs.shape[0] + num_negatives, matches_df.shape[0])
+
+    print("Candidates generated: ", stats[3])
+    return sizes, stats
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Splits the dataset using random method')
     parser.add_argument('input', type=pathtype.Path(readable=True), nargs='?', default='/data',
@@ -116,6 +222,11 @@ if __name__ == "__main__":
                         help='The ratio of negative pairs to be generated relative to the number of positive pairs')
     parser.add_argument('-s', '--seed', type=int, nargs='?', default=random.randint(0, 4294967295),
                         help='The random state used to initialize the algorithms and split dataset')
+    parser.add_argument('-bp', '--block_pairs', type=int, nargs='?', default=1000000,
+                        help='With all negative pairs (-np -1), the number of pairs generated and written at once')
+    parser.add_argument('-do', '--draw_order', action='store_true', default=False,
+                        help='keep the sampled negative pairs in the order they were drawn, which is much faster for '
+                             'large samples, but gives other splits for a seed than the default order')
     args = parser.parse_args()
 
     if args.output is None:
@@ -127,41 +238,36 @@ if __name__ == "__main__":
         exit(1)
 
     print("Hi, I'm simple splitter, I'm doing random split of the input datasets into train and test sets.")
-    tableA_df = pd.read_csv(os.path.join(args.input, 'tableA.csv'), encoding_errors='replace')
-    tableB_df = pd.read_csv(os.path.join(args.input, 'tableB.csv'), encoding_errors='replace')
-    matches_df = pd.read_csv(os.path.join(args.input, 'matches.csv'), encoding_errors='replace')
-
-    tableA_df.set_index('id', inplace=True, drop=False)
-    tableB_df.set_index('id', inplace=True, drop=False)
+    timer = PhaseTimer()
+    with timer.phase("load"):
+        tableA_df, tableB_df, matches_df = read_dataset(args.input)
 
-    # Remove those pairs from matches, which entries no longer appear in tableA or tableB:
-    A_match_exists = matches_df['tableA_id'].map(lambda x: x in tableA_df['id']).astype(bool)
-    B_match_exists = matches_df['tableB_id'].map(lambda x: x in tableB_df['id']).astype(bool)
-    matches_df = matches_df[A_match_exists & B_match_exists]
-    print("Input tables are:", "A", tableA_df.shape, "B", tableB_df.shape, "Matches", matches_df.shape)
+        # Remove those pairs from matches, which entries no longer appear in tableA or tableB:
+        matches_df = filter_matches(matches_df, tableA_df, tableB_df)
+        print("Input tables are:", "A", tableA_df.shape, "B", tableB_df.shape, "Matches", matches_df.shape)
 
     # split the input datasets
-    start_time = time.process_time()
-    train, valid, test, stats = split_input(tableA_df, tableB_df, matches_df, recall=args.recall,
-                                     neg_pairs_ratio=args.neg_pairs_ratio, seed=args.seed)
-    stop_time = time.process_time()
-    print("Done! Train size: {}, test size: {}.".format(train.shape[0], test.shape[0]))
-
-    train.to_csv(os.path.join(args.output, "train.csv"), index=False)
-    valid.to_csv(os.path.join(args.output, "valid.csv"), index=False)
-    test.to_csv(os.path.join(args.output, "test.csv"), index=False)
-
-    tableA_df.to_csv(os.path.join(args.output, 'tableA.csv'), index=False)
-    tableB_df.to_csv(os.path.join(args.output, 'tableB.csv'), index=False)
-    matches_df.to_csv(os.path.join(args.output, 'matches.csv'), index=False)
-
-    pd.DataFrame({
-        'f1': [stats[0]],
-        'precision': [stats[1]],
-        'recall': [stats[2]],
-        'filtering_time': [stop_time - start_time],
-        'num_candidates': [stats[3]],
-        'entries_tableA': [tableA_df.shape[0]],
-        'entries_tableB': [tableB_df.shape[0]],
-        'entries_matches': [matches_df.shape[0]],
-    }).to_csv(os.path.join(args.output, 'filtering_metrics.csv'), index=False)
+    if args.neg_pairs_ratio == -1:
+        # the cross product doesn't fit into memory, the splits are written while they are generated
+        with timer.phase("filter"):
+            sizes, stats = stream_split(tableA_df, tableB_df, matches_df, recall=args.recall, seed=args.seed,
+                                        output=args.output, block_pairs=args.block_pairs)
+        print("Done! Train size: {}, test size: {}.".format(sizes[0], sizes[2]))
+    else:
+        with timer.phase("filter"):
+            train, valid, test, stats = split_input(tableA_df, tableB_df, matches_df, recall=args.recall,
+                                             neg_pairs_ratio=args.neg_pairs_ratio, seed=args.seed,
+                                             keep_order=not args.draw_order)
+        print("Done! Train size: {}, test size: {}.".format(train.shape[0], test.shape[0]))
+
+    with timer.phase("write"):
+        if args.neg_pairs_ratio != -1:
+            write_pairs(train, args.output, "train")
+            write_pairs(valid, args.output, "valid")
+            write_pairs(test, args.output, "test")
+
+        write_dataset(args.output, tableA_df, tableB_df, matches_df)
+
+        write_filtering_metrics(args.output, stats, timer.wall_time("filter"), tableA_df, tableB_df, matches_df)
+
+    timer.write(args.output, FILTERING_PHASES_FILE)
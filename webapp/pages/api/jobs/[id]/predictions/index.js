@@ -1,11 +1,11 @@
 import prisma from "../../../../../prisma/client";
 import { queryPredictions } from "./query";
+import { BodyTooLargeError, readJsonBody } from "../../../../../utils/requestUtils";
 
+// the body is parsed by readJsonBody, as the manager uploads gzip-compressed chunks
 export const config = {
   api: {
-    bodyParser: {
-      sizeLimit: '20mb',
-    },
+    bodyParser: false,
   },
 }
 
@@ -30,8 +30,20 @@ export default async function handler(req, res) {
   }
 
   if (req.method === 'POST' || req.method === 'PUT') {
+    let body;
     try {
-      const predictions = req.body.map(p => ({
+      body = await readJsonBody(req);
+    } catch (error) {
+      if (error instanceof BodyTooLargeError) {
+        return res.status(413).json({ error: "Predictions chunk is too large" });
+      }
+      console.error("Error reading predictions:", error);
+      return res.status(400).json({ error: "Invalid predictions body" });
+    }
+
+    try {
+      // predictions are unique per job and pair, so a re-sent chunk doesn't create duplicates
+      const predictions = body.map(p => ({
         jobId: jobId,
         tableA_id: p.tableA_id,
         tableB_id: p.tableB_id,
@@ -1,17 +1,38 @@
+import {createHash} from "crypto";
 import {queryJobs} from "./query";
 
+const parseStatuses = (status) => {
+  if (!status) {
+    return undefined;
+  }
+  const statuses = Array.isArray(status) ? status : status.split(',');
+  return statuses.map(s => s.trim()).filter(s => s.length > 0);
+}
+
 export default async function handler(req, res) {
   if (req.method === 'GET') {
     try {
+      const {status, updatedSince, ...query} = req.query;
       const data = await queryJobs({
         sortField: 'createdAt',
         sortOrder: 'desc',
         first: 0,
         rows: 100,
-        ...req.query,
+        ...query,
+        statuses: parseStatuses(status),
+        updatedSince: updatedSince,
       });
 
-      return res.status(200).json(data);
+      // the manager polls this endpoint, an unchanged job list is answered with 304
+      const body = JSON.stringify(data);
+      const etag = `"${createHash('sha1').update(body).digest('base64url')}"`;
+      res.setHeader('ETag', etag);
+      if (req.headers['if-none-match'] === etag) {
+        return res.status(304).end();
+      }
+
+      res.setHeader('Content-Type', 'application/json; charset=utf-8');
+      return res.status(200).send(body);
     } catch (error) {
       console.error("Error fetching jobs:", error);
       return res.status(500).json({error: "Failed to fetch jobs"});
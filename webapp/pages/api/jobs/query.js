@@ -1,7 +1,7 @@
 import prisma from "../../../prisma/client";
 
 /**
- * @param params {{first?: string, rows?: string, sortField?: string, sortOrder?: string, filters?: {status?: {value: string, matchMode: string}, notifyEmail?: {value: string}, datasetId?: {value: string}, filteringAlgoId?: {value: string}, filteringParams?: {value: string}, matchingAlgoId?: {value: string}, matchingParams?: {value: string}}, include?: {}}}
+ * @param params {{first?: string, rows?: string, sortField?: string, sortOrder?: string, statuses?: string[], updatedSince?: string, filters?: {status?: {value: string, matchMode: string}, notifyEmail?: {value: string}, datasetId?: {value: string}, filteringAlgoId?: {value: string}, filteringParams?: {value: string}, matchingAlgoId?: {value: string}, matchingParams?: {value: string}}, include?: {}}}
  * @returns {Promise<{page: {rows: number, first: number, total: number}, data: Array}>}
  */
 export async function queryJobs(params) {
@@ -12,9 +12,16 @@ export async function queryJobs(params) {
   const sortOrder = parseInt(params.sortOrder) === -1 || (typeof params.sortOrder === 'string' && params.sortOrder?.toLowerCase() === 'desc') ? 'desc' : 'asc';
 
   const whereClause = {
-    status: {in: ['pending', 'queued', 'filtering', 'matching']},
+    status: {in: params.statuses?.length ? params.statuses : ['pending', 'queued', 'filtering', 'matching']},
   };
 
+  if (params.updatedSince) {
+    const updatedSince = new Date(params.updatedSince);
+    if (!isNaN(updatedSince.getTime())) {
+      whereClause.updatedAt = {gt: updatedSince};
+    }
+  }
+
   if (params.filters) {
     if (params.filters.status?.value) {
       whereClause.status = params.filters.status.value;
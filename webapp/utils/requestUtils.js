@@ -0,0 +1,29 @@
+import {createGunzip} from "zlib";
+
+export class BodyTooLargeError extends Error {
+}
+
+/**
+ * Reads and parses a JSON request body, which can be gzip-compressed (`Content-Encoding: gzip`).
+ * The API route must disable the built-in body parser for this to work.
+ * @param req {import('http').IncomingMessage}
+ * @param limit {number} maximum size of the (decompressed) body in bytes
+ * @returns {Promise<any>}
+ */
+export async function readJsonBody(req, limit = 20 * 1024 * 1024) {
+  const encoding = (req.headers['content-encoding'] || '').toLowerCase();
+  const stream = encoding === 'gzip' ? req.pipe(createGunzip()) : req;
+
+  const chunks = [];
+  let size = 0;
+  for await (const chunk of stream) {
+    size += chunk.length;
+    if (size > limit) {
+      stream.destroy();
+      throw new BodyTooLargeError(`Request body exceeds ${limit} bytes`);
+    }
+    chunks.push(chunk);
+  }
+
+  return JSON.parse(Buffer.concat(chunks).toString('utf8'));
+}